@@ -6,11 +6,45 @@ Works with both PostgreSQL (Railway) and SQLite (local)
 
 import os
 import sqlite3
+import tempfile
+import threading
 import time
 import uuid
-from flask import Flask, request, redirect, url_for, render_template, flash
+from contextlib import contextmanager
+from flask import Flask, request, redirect, url_for, render_template, flash, jsonify
 from werkzeug.utils import secure_filename
 
+try:
+    from database import compile_sql, compile_insert, POSTGRESQL, SQLITE, iter_chunks, write_rows, BULK_CHUNK_SIZE
+    from game_import import detect_format, import_jobs
+    from stats_engine import player_stats_batch, player_streaks, empty_player_stats, PARTICIPANT_RESULTS
+    from head_to_head import head_to_head, player_names, with_name
+    from leaderboard_view import leaderboard_view
+    from score_stats import score_distribution
+    from game_columns import game_columns
+    import board_stats
+    import date_columns
+    import game_events
+    import game_tables
+    import ratings
+    import rollups
+    import skunk_columns
+except ImportError:
+    from app.database import compile_sql, compile_insert, POSTGRESQL, SQLITE, iter_chunks, write_rows, BULK_CHUNK_SIZE
+    from app.game_import import detect_format, import_jobs
+    from app.stats_engine import player_stats_batch, player_streaks, empty_player_stats, PARTICIPANT_RESULTS
+    from app.head_to_head import head_to_head, player_names, with_name
+    from app.leaderboard_view import leaderboard_view
+    from app.score_stats import score_distribution
+    from app.game_columns import game_columns
+    from app import board_stats
+    from app import date_columns
+    from app import game_events
+    from app import game_tables
+    from app import ratings
+    from app import rollups
+    from app import skunk_columns
+
 app = Flask(__name__)
 app.secret_key = os.environ.get("SECRET_KEY", "dev-key-change-in-production")
 
@@ -25,60 +59,125 @@ def is_production():
     """Check if running in production (Railway deployment)"""
     return "RAILWAY_ENVIRONMENT" in os.environ
 
-def execute_query(query, params=None, fetch=False):
-    """Execute database query with automatic database selection"""
-    params = params or []
-    
+# The connection of the transaction() block this thread is in, if any
+_transaction = threading.local()
+
+def _connect():
+    """Open a connection - PostgreSQL in production, otherwise SQLITE_DB_PATH or app/database.db"""
     if is_production():
-        # Production: Use PostgreSQL
-        try:
-            import psycopg2
+        import psycopg2
+        
+        DATABASE_URL = os.environ.get("DATABASE_URL")
+        if not DATABASE_URL:
+            raise Exception("DATABASE_URL not found in environment")
+        return psycopg2.connect(DATABASE_URL)
+    
+    db_path = os.environ.get("SQLITE_DB_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+@contextmanager
+def transaction():
+    """Run several queries on one connection as one unit of work.
+
+    Commits when the outermost block exits cleanly and rolls back on any
+    exception. Nested blocks join the outer transaction.
+    """
+    conn = getattr(_transaction, 'conn', None)
+    if conn is not None:
+        yield conn
+        return
+    
+    conn = _connect()
+    if not is_production():
+        # SQLite only opens a transaction implicitly before writes - table changes belong in it too
+        conn.execute("BEGIN")
+    _transaction.conn = conn
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _transaction.conn = None
+        conn.close()
+
+def _execute(compiled_sql, params, fetch=False, returning=False):
+    """Run one statement - on the transaction() connection if there is one, else on its own"""
+    conn = getattr(_transaction, 'conn', None)
+    owns_connection = conn is None
+    if owns_connection:
+        conn = _connect()
+    
+    try:
+        if is_production():
             from psycopg2.extras import RealDictCursor
-            
-            DATABASE_URL = os.environ.get("DATABASE_URL")
-            if not DATABASE_URL:
-                raise Exception("DATABASE_URL not found in environment")
-            
-            conn = psycopg2.connect(DATABASE_URL)
             cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute(query, params)
-            
-            if fetch:
-                result = cursor.fetchall()
-            else:
-                result = None
-                conn.commit()
-            
-            cursor.close()
-            conn.close()
-            return result
-            
-        except Exception as e:
-            print(f"PostgreSQL Error: {e}")
-            raise
-    else:
-        # Development: Use SQLite
-        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "database.db")
-        
-        try:
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
+        else:
             cursor = conn.cursor()
-            cursor.execute(query, params)
-            
-            if fetch:
-                result = cursor.fetchall()
-            else:
-                result = None
+        cursor.execute(compiled_sql, params)
+        
+        if fetch:
+            result = cursor.fetchall()
+        elif returning:
+            # PostgreSQL hands the new ID back from RETURNING, SQLite from lastrowid
+            result = cursor.fetchone()['id'] if is_production() else cursor.lastrowid
+        else:
+            result = None
+        
+        cursor.close()
+        if owns_connection and not fetch:
+            conn.commit()
+        return result
+    
+    except Exception as e:
+        print(f"{'PostgreSQL' if is_production() else 'SQLite'} Error: {e}")
+        raise
+    finally:
+        if owns_connection:
+            conn.close()
+
+def execute_query(query, params=None, fetch=False):
+    """Execute database query with automatic database selection"""
+    # Translate ? placeholders (and INSERT OR IGNORE) for psycopg2
+    sql = compile_sql(query, POSTGRESQL).sql if is_production() else query
+    return _execute(sql, params or [], fetch=fetch)
+
+def execute_insert(query, params=None):
+    """Execute an INSERT and return the new row's ID"""
+    compiled = compile_insert(query, POSTGRESQL if is_production() else SQLITE)
+    return _execute(compiled.sql, params or [], returning=True)
+
+def bulk_insert(table, columns, rows, chunk_size=BULK_CHUNK_SIZE, conflict_columns=None, update_columns=None):
+    """Insert many rows, one driver call and one commit per chunk.
+
+    Inside transaction() the rows go on its connection and commit with it.
+    """
+    conn = getattr(_transaction, 'conn', None)
+    owns_connection = conn is None
+    if owns_connection:
+        conn = _connect()
+    dialect = POSTGRESQL if is_production() else SQLITE
+    
+    total = 0
+    try:
+        cursor = conn.cursor()
+        for chunk in iter_chunks(rows, chunk_size):
+            total += write_rows(cursor, dialect, table, columns, chunk, conflict_columns, update_columns)
+            if owns_connection:
                 conn.commit()
-            
-            cursor.close()
+        cursor.close()
+        return total
+    except Exception as e:
+        if owns_connection:
+            conn.rollback()
+        print(f"Bulk insert error: {e}")
+        raise
+    finally:
+        if owns_connection:
             conn.close()
-            return result
-            
-        except Exception as e:
-            print(f"SQLite Error: {e}")
-            raise
 
 def generate_unique_filename(original_filename, prefix="board"):
     """Generate a unique filename for uploaded files"""
@@ -126,174 +225,66 @@ def uploaded_file(filename):
 def calculate_player_stats(player_id):
     """Calculate comprehensive statistics for a player"""
     try:
-        # Basic win/loss stats
-        wins = execute_query("SELECT COUNT(*) as count FROM games WHERE winner_id = ?", [player_id], fetch=True)[0]['count']
-        losses = execute_query("SELECT COUNT(*) as count FROM games WHERE loser_id = ?", [player_id], fetch=True)[0]['count']
-        
-        # Skunk stats (games won/lost by >30 points)
-        skunks_given = execute_query("""
-            SELECT COUNT(*) as count FROM games 
-            WHERE winner_id = ? AND (winner_score - loser_score) >= 30
-        """, [player_id], fetch=True)[0]['count']
-        
-        skunks_received = execute_query("""
-            SELECT COUNT(*) as count FROM games 
-            WHERE loser_id = ? AND (winner_score - loser_score) >= 30
-        """, [player_id], fetch=True)[0]['count']
-        
-        # Double skunks (won/lost by >60 points)
-        double_skunks_given = execute_query("""
-            SELECT COUNT(*) as count FROM games 
-            WHERE winner_id = ? AND (winner_score - loser_score) >= 60
-        """, [player_id], fetch=True)[0]['count']
-        
-        double_skunks_received = execute_query("""
-            SELECT COUNT(*) as count FROM games 
-            WHERE loser_id = ? AND (winner_score - loser_score) >= 60
-        """, [player_id], fetch=True)[0]['count']
-        
-        # Average scores
-        avg_winning_score = execute_query("""
-            SELECT AVG(winner_score) as avg FROM games WHERE winner_id = ?
-        """, [player_id], fetch=True)[0]['avg'] or 0
-        
-        avg_losing_score = execute_query("""
-            SELECT AVG(loser_score) as avg FROM games WHERE loser_id = ?
-        """, [player_id], fetch=True)[0]['avg'] or 0
-        
-        # Recent form (last 10 games)
-        recent_games = execute_query("""
-            SELECT CASE WHEN winner_id = ? THEN 'W' ELSE 'L' END as result
-            FROM games 
-            WHERE winner_id = ? OR loser_id = ?
-            ORDER BY date_played DESC 
-            LIMIT 10
-        """, [player_id, player_id, player_id], fetch=True)
-        
-        recent_wins = sum(1 for game in recent_games if game['result'] == 'W')
-        recent_form = f"{recent_wins}/{len(recent_games)}" if recent_games else "0/0"
-        
-        # Current streak calculation
-        current_streak = 0
-        if recent_games:
-            streak_type = recent_games[0]['result'] if recent_games else None
-            for game in recent_games:
-                if game['result'] == streak_type:
-                    current_streak += 1
-                else:
-                    break
-            current_streak = f"{current_streak}{'W' if streak_type == 'W' else 'L'}"
-        else:
-            current_streak = "0"
-        
-        # Find favorite opponent (who they beat the most)
-        favorite_opponent = None
-        try:
-            opponent_stats = execute_query("""
-                SELECT p.id, p.first_name || ' ' || p.last_name as name,
-                       COUNT(CASE WHEN g.winner_id = ? THEN 1 END) as wins_against_them,
-                       COUNT(CASE WHEN g.loser_id = ? THEN 1 END) as losses_to_them,
-                       COUNT(*) as total_games
-                FROM games g
-                JOIN players p ON (g.winner_id = p.id OR g.loser_id = p.id)
-                WHERE (g.winner_id = ? OR g.loser_id = ?) AND p.id != ?
-                GROUP BY p.id, p.first_name, p.last_name
-                HAVING COUNT(CASE WHEN g.winner_id = ? THEN 1 END) > 0
-                ORDER BY wins_against_them DESC, total_games DESC
-                LIMIT 1
-            """, [player_id, player_id, player_id, player_id, player_id, player_id], fetch=True)
-            
-            if opponent_stats:
-                opp = opponent_stats[0]
-                favorite_opponent = {
-                    'id': opp['id'],
-                    'name': opp['name'],
-                    'wins_against_them': opp['wins_against_them'],
-                    'losses_to_them': opp['losses_to_them'],
-                    'total_games': opp['total_games'],
-                    'win_rate_against': round((opp['wins_against_them'] / opp['total_games'] * 100), 1) if opp['total_games'] > 0 else 0
-                }
-        except Exception as e:
-            print(f"Error finding favorite opponent: {e}")
-        
-        return {
-            'wins': wins,
-            'losses': losses,
-            'total_games': wins + losses,
-            'win_percentage': round((wins / (wins + losses) * 100), 1) if (wins + losses) > 0 else 0,
-            'skunks_given': skunks_given,
-            'skunks_received': skunks_received,
-            'double_skunks_given': double_skunks_given,
-            'double_skunks_received': double_skunks_received,
-            'avg_winning_score': round(avg_winning_score, 1),
-            'avg_losing_score': round(avg_losing_score, 1),
-            'recent_form': recent_form,
-            'recent_wins': recent_wins,
-            'recent_games_count': len(recent_games),
-            'current_streak': current_streak,
-            'favorite_opponent': favorite_opponent
-        }
-        
+        matrix = head_to_head.ensure_loaded(execute_query)
+        return player_stats_batch(execute_query, [player_id], matrix=matrix,
+                                  streak_source=PARTICIPANT_RESULTS)[player_id]
     except Exception as e:
         print(f"Error calculating player stats: {e}")
-        return {
-            'wins': 0, 'losses': 0, 'total_games': 0, 'win_percentage': 0,
-            'skunks_given': 0, 'skunks_received': 0,
-            'double_skunks_given': 0, 'double_skunks_received': 0,
-            'avg_winning_score': 0, 'avg_losing_score': 0,
-            'recent_form': '0/0', 'recent_wins': 0, 'recent_games_count': 0,
-            'current_streak': '0', 'favorite_opponent': None
-        }
+        return empty_player_stats()
 
 def get_player_nemesis(player_id):
     """Find the player's nemesis (opponent they've lost to most)"""
     try:
-        nemesis_data = execute_query("""
-            SELECT p.id, p.first_name || ' ' || p.last_name as name, 
-                   COUNT(*) as losses_to_them,
-                   (SELECT COUNT(*) FROM games g2 WHERE g2.winner_id = ? AND g2.loser_id = p.id) as wins_against_them
-            FROM games g
-            JOIN players p ON g.winner_id = p.id
-            WHERE g.loser_id = ?
-            GROUP BY p.id, p.first_name, p.last_name
-            ORDER BY losses_to_them DESC, wins_against_them ASC
-            LIMIT 1
-        """, [player_id, player_id], fetch=True)
-        
-        if nemesis_data:
-            nemesis = nemesis_data[0]
-            total_games = nemesis['losses_to_them'] + nemesis['wins_against_them']
-            return {
-                'id': nemesis['id'],
-                'name': nemesis['name'],
-                'losses_to_them': nemesis['losses_to_them'],
-                'wins_against_them': nemesis['wins_against_them'],
-                'total_games': total_games,
-                'win_rate_against': round((nemesis['wins_against_them'] / total_games * 100), 1) if total_games > 0 else 0
-            }
-        return None
+        nemesis = head_to_head.ensure_loaded(execute_query).nemesis(player_id)
+        if nemesis:
+            with_name(nemesis, player_names(execute_query, [nemesis['id']]))
+        return nemesis
         
     except Exception as e:
         print(f"Error finding nemesis: {e}")
         return None
 
+def get_leaderboard_rows():
+    """Every player with games, best win rate first.
+
+    Read from the materialized leaderboard view in production (created on
+    first use), otherwise computed with one grouped query.
+    """
+    if is_production() and not leaderboard_view.enabled:
+        try:
+            leaderboard_view.enable(execute_query)
+        except Exception as e:
+            print(f"Leaderboard view unavailable: {e}")
+    
+    player_ratings = ratings.current_ratings(execute_query)
+    streaks = player_streaks(execute_query, source=PARTICIPANT_RESULTS)
+    rows = []
+    for row in leaderboard_view.rows(execute_query):
+        total_games = row['wins'] + row['losses']
+        rows.append({
+            'id': row['id'],
+            'name': f"{row['first_name']} {row['last_name']}",
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'photo': row['photo'],
+            'wins': row['wins'],
+            'losses': row['losses'],
+            'win_rate': (row['wins'] * 100.0 / total_games) if total_games else None,
+            'skunks_given': row['skunks_given'],
+            'skunks_received': row['skunks_received'],
+            'rating': player_ratings.get(row['id'], {}).get('rating'),
+            'longest_win_streak': 0,
+            'longest_loss_streak': 0,
+            **streaks.get(row['id'], {}),
+        })
+    rows.sort(key=lambda x: (x['win_rate'] or 0, x['wins']), reverse=True)
+    return rows
+
 def get_player_leaderboard_position(player_id):
     """Get player's position in various leaderboards"""
     try:
         # Overall win rate leaderboard
-        leaderboard = execute_query("""
-            SELECT p.id,
-                   p.first_name || ' ' || p.last_name as name,
-                   COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) as wins,
-                   COUNT(CASE WHEN g.loser_id = p.id THEN 1 END) as losses,
-                   (COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) * 100.0 / 
-                    (COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) + COUNT(CASE WHEN g.loser_id = p.id THEN 1 END))) as win_rate
-            FROM players p
-            LEFT JOIN games g ON (g.winner_id = p.id OR g.loser_id = p.id)
-            GROUP BY p.id, p.first_name, p.last_name
-            HAVING (COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) + COUNT(CASE WHEN g.loser_id = p.id THEN 1 END)) > 0
-            ORDER BY win_rate DESC, wins DESC
-        """, fetch=True)
+        leaderboard = get_leaderboard_rows()
         
         # Find player's position
         for i, player in enumerate(leaderboard):
@@ -325,8 +316,9 @@ def index():
         filter_wood = request.args.get('filter_wood')
         filter_material = request.args.get('filter_material')
         search = request.args.get('search')
-        date_from = request.args.get('date_from')
-        date_to = request.args.get('date_to')
+        # Compared as typed dates, whichever format they were entered in
+        date_from = date_columns.iso_date(request.args.get('date_from'))
+        date_to = date_columns.iso_date(request.args.get('date_to'))
         
         # Base query
         query = "SELECT * FROM boards WHERE 1=1"
@@ -355,11 +347,11 @@ def index():
             params.extend([search_param, search_param, search_param, search_param])
         
         if date_from:
-            query += " AND date >= ?"
+            query += " AND board_date >= ?"
             params.append(date_from)
         
         if date_to:
-            query += " AND date <= ?"
+            query += " AND board_date <= ?"
             params.append(date_to)
         
         # Add ordering
@@ -379,7 +371,8 @@ def board_detail(board_id):
         if not board:
             flash("Board not found!", "error")
             return redirect(url_for("index"))
-        return render_template("board_detail.html", board=board[0])
+        return render_template("board_detail.html", board=board[0],
+                               play_stats=board_stats.board_summary(execute_query, board_id))
     except Exception as e:
         flash(f"Database error: {e}", "error")
         return redirect(url_for("index"))
@@ -576,23 +569,28 @@ def edit_board(board_id):
 @app.route("/delete_board/<int:board_id>", methods=["POST"])
 def delete_board(board_id):
     try:
-        # Get board info to delete associated images
-        board = execute_query("SELECT * FROM boards WHERE id = ?", [board_id], fetch=True)
-        if not board:
-            flash("Board not found!", "error")
-            return redirect(url_for("index"))
+        with transaction():
+            # Get board info to delete associated images
+            board = execute_query("SELECT * FROM boards WHERE id = ?", [board_id], fetch=True)
+            if not board:
+                flash("Board not found!", "error")
+                return redirect(url_for("index"))
+            
+            board = board[0]
+            
+            # Take the board off its games, with the tables kept from games, then delete it
+            changes = game_tables.clear_board(execute_query, bulk_insert, board_id)
+            execute_query("DELETE FROM boards WHERE id = ?", [board_id])
         
-        board = board[0]
+        for old_game, new_game, version in changes:
+            game_events.game_changed(old_game, new_game, version)
         
-        # Delete associated images
+        # Delete associated images once the delete has been committed
         if board['image_front']:
             safe_delete_file(board['image_front'])
         if board['image_back']:
             safe_delete_file(board['image_back'])
         
-        # Delete board from database
-        execute_query("DELETE FROM boards WHERE id = ?", [board_id])
-        
         flash("Board deleted successfully!", "success")
         return redirect(url_for("index"))
         
@@ -606,10 +604,10 @@ def players():
         # Get all players with their game statistics
         players = execute_query("""
             SELECT p.*,
-                   COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) as wins,
-                   COUNT(CASE WHEN g.loser_id = p.id THEN 1 END) as losses
+                   COUNT(CASE WHEN gp.role = 'winner' THEN 1 END) as wins,
+                   COUNT(CASE WHEN gp.role = 'loser' THEN 1 END) as losses
             FROM players p
-            LEFT JOIN games g ON (g.winner_id = p.id OR g.loser_id = p.id)
+            LEFT JOIN game_participants gp ON gp.player_id = p.id
             GROUP BY p.id, p.first_name, p.last_name, p.photo, p.date_added
             ORDER BY p.first_name, p.last_name
         """, fetch=True)
@@ -697,6 +695,7 @@ def edit_player(player_id):
                 UPDATE players SET first_name = ?, last_name = ?, photo = ?
                 WHERE id = ?
             """, [first_name, last_name, photo_filename, player_id])
+            leaderboard_view.request_refresh()
             
             flash("Player updated successfully!", "success")
             return redirect(url_for("player_detail", player_id=player_id))
@@ -718,21 +717,26 @@ def edit_player(player_id):
 @app.route("/delete_player/<int:player_id>", methods=["POST"])
 def delete_player(player_id):
     try:
-        # Get player info to delete associated images
-        player = execute_query("SELECT * FROM players WHERE id = ?", [player_id], fetch=True)
-        if not player:
-            flash("Player not found!", "error")
-            return redirect(url_for("players"))
+        with transaction():
+            # Get player info to delete associated images
+            player = execute_query("SELECT * FROM players WHERE id = ?", [player_id], fetch=True)
+            if not player:
+                flash("Player not found!", "error")
+                return redirect(url_for("players"))
+            
+            player = player[0]
+            
+            # Their games go too (PostgreSQL cascades), with the tables kept from games
+            changes = game_tables.delete_player_games(execute_query, bulk_insert, player_id)
+            execute_query("DELETE FROM players WHERE id = ?", [player_id])
         
-        player = player[0]
+        for old_game, new_game, version in changes:
+            game_events.game_changed(old_game, new_game, version)
         
-        # Delete associated photo
+        # Delete associated photo once the delete has been committed
         if player['photo']:
             safe_delete_file(player['photo'])
         
-        # Delete player from database
-        execute_query("DELETE FROM players WHERE id = ?", [player_id])
-        
         flash("Player deleted successfully!", "success")
         return redirect(url_for("players"))
         
@@ -754,18 +758,20 @@ def player_detail(player_id):
                    pw.first_name || ' ' || pw.last_name as winner,
                    pl.first_name || ' ' || pl.last_name as loser,
                    CASE 
-                       WHEN g.winner_id = ? THEN 'W'
+                       WHEN gp.role = 'winner' THEN 'W'
                        ELSE 'L'
                    END as result
-            FROM games g
+            FROM game_participants gp
+            JOIN games g ON g.id = gp.game_id
             LEFT JOIN players pw ON g.winner_id = pw.id
             LEFT JOIN players pl ON g.loser_id = pl.id
-            WHERE g.winner_id = ? OR g.loser_id = ?
-            ORDER BY g.date_played DESC
-        """, [player_id, player_id, player_id], fetch=True)
+            WHERE gp.player_id = ?
+            ORDER BY gp.played_on DESC NULLS LAST, gp.game_id DESC
+        """, [player_id], fetch=True)
         
         # Calculate comprehensive statistics
         stats = calculate_player_stats(player_id)
+        stats['rating'] = ratings.current_ratings(execute_query, [player_id]).get(player_id, {}).get('rating')
         
         # Get nemesis (most frequent opponent they've lost to)
         nemesis = get_player_nemesis(player_id)
@@ -782,7 +788,9 @@ def player_detail(player_id):
                              recent_games=recent_games,
                              stats=stats,
                              nemesis=nemesis,
-                             leaderboard_position=leaderboard_position)
+                             leaderboard_position=leaderboard_position,
+                             trend=rollups.player_trend(execute_query, player_id, 'month')[-rollups.TREND_MONTHS:],
+                             score_stats=score_distribution.player(execute_query, player_id))
         
     except Exception as e:
         flash(f"Database error: {e}", "error")
@@ -800,7 +808,7 @@ def games():
             LEFT JOIN players pw ON g.winner_id = pw.id
             LEFT JOIN players pl ON g.loser_id = pl.id
             LEFT JOIN boards b ON g.board_id = b.id
-            ORDER BY g.date_played DESC
+            ORDER BY g.played_on DESC NULLS LAST, g.id DESC
         """, fetch=True)
         
         players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True)
@@ -812,6 +820,18 @@ def games():
         flash(f"Database error: {e}", "error")
         return render_template("games.html", games=[], players=[], boards=[])
 
+def sync_game_tables(game_id, old_game, new_game):
+    """Bring the tables kept from games up to date after one game write.
+
+    Call it inside the write's transaction() so they commit or roll back
+    together. Returns the write's games version for game_events.game_changed.
+    """
+    return game_tables.sync(execute_query, bulk_insert, game_id, old_game, new_game)
+
+def rebuild_game_tables():
+    """Recompute every table kept from games, in one transaction"""
+    game_tables.rebuild(execute_query, bulk_insert, transaction)
+
 @app.route("/add_game", methods=["POST"])
 def add_game():
     try:
@@ -830,11 +850,15 @@ def add_game():
         
         insert_params = [winner_id, loser_id, board_id, winner_score, loser_score, date_played, is_skunk, is_double_skunk, notes]
         
-        execute_query("""
-            INSERT INTO games (winner_id, loser_id, board_id, winner_score, loser_score, date_played, is_skunk, is_double_skunk, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, insert_params)
-        
+        # The game and the tables kept from games are written together or not at all
+        with transaction():
+            game_id = execute_insert("""
+                INSERT INTO games (winner_id, loser_id, board_id, winner_score, loser_score, date_played, is_skunk, is_double_skunk, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, insert_params)
+            new_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0]
+            version = sync_game_tables(game_id, None, new_game)
+        game_events.game_changed(None, new_game, version)
         flash("Game recorded successfully!", "success")
         
     except Exception as e:
@@ -842,6 +866,36 @@ def add_game():
     
     return redirect(url_for("games"))
 
+@app.route("/import_games", methods=["POST"])
+def import_games_upload():
+    try:
+        file = request.files.get("import_file")
+        if not file or not file.filename:
+            flash("Please choose a CSV or NDJSON file to import", "error")
+            return redirect(url_for("games"))
+        
+        fmt = detect_format(file.filename)
+        fd, path = tempfile.mkstemp(prefix="game_import_", suffix=f".{fmt}")
+        os.close(fd)
+        file.save(path)
+        
+        # Runs in a background thread - progress is kept per worker process, keyed by job ID
+        job_id = import_jobs.start(path, fmt, execute_query, bulk_insert, rebuild_game_tables)
+        
+        flash(f"Import started - progress at {url_for('import_games_status', job_id=job_id)}", "success")
+    except Exception as e:
+        flash(f"Error importing games: {e}", "error")
+    
+    return redirect(url_for("games"))
+
+@app.route("/import_games/<job_id>")
+def import_games_status(job_id):
+    result = import_jobs.get(job_id)
+    if result is None:
+        return jsonify({'error': "Unknown import job"}), 404
+    # JSON, not HTML - error messages echo values from the uploaded file
+    return jsonify(result.as_dict())
+
 @app.route("/game/<int:game_id>/edit", methods=["GET", "POST"])
 def edit_game(game_id):
     try:
@@ -882,13 +936,21 @@ def edit_game(game_id):
             is_double_skunk = 1 if loser_score_int < 61 else 0
             is_skunk = 1 if loser_score_int < 91 and not is_double_skunk else 0
             
-            execute_query("""
-                UPDATE games 
-                SET winner_id = ?, loser_id = ?, board_id = ?, winner_score = ?, 
-                    loser_score = ?, date_played = ?, is_skunk = ?, is_double_skunk = ?, notes = ?
-                WHERE id = ?
-            """, [winner_id, loser_id, board_id, winner_score, loser_score, date_played, is_skunk, is_double_skunk, notes, game_id])
-            
+            with transaction():
+                old_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+                execute_query("""
+                    UPDATE games 
+                    SET winner_id = ?, loser_id = ?, board_id = ?, winner_score = ?, 
+                        loser_score = ?, date_played = ?, is_skunk = ?, is_double_skunk = ?, notes = ?
+                    WHERE id = ?
+                """, [winner_id, loser_id, board_id, winner_score, loser_score, date_played, is_skunk, is_double_skunk, notes, game_id])
+                
+                new_game = None
+                if old_game:
+                    new_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0]
+                    version = sync_game_tables(game_id, old_game[0], new_game)
+            if new_game:
+                game_events.game_changed(old_game[0], new_game, version)
             flash("Game updated successfully!", "success")
             return redirect(url_for("games"))
             
@@ -902,14 +964,17 @@ def edit_game(game_id):
 @app.route("/game/<int:game_id>/delete", methods=["POST"])
 def delete_game(game_id):
     try:
-        # Check if game exists
-        game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
-        if not game:
-            flash("Game not found", "error")
-            return redirect(url_for("games"))
-        
-        # Delete the game
-        execute_query("DELETE FROM games WHERE id = ?", [game_id])
+        # Delete the game and its share of the tables kept from games together
+        with transaction():
+            # Check if game exists
+            game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+            if not game:
+                flash("Game not found", "error")
+                return redirect(url_for("games"))
+            
+            execute_query("DELETE FROM games WHERE id = ?", [game_id])
+            version = sync_game_tables(game_id, game[0], None)
+        game_events.game_changed(game[0], None, version)
         flash("Game deleted successfully!", "success")
         
     except Exception as e:
@@ -924,13 +989,17 @@ def stats():
         # Get all data for the template
         boards = execute_query("SELECT * FROM boards", fetch=True)
         players = execute_query("SELECT * FROM players", fetch=True)
-        games = execute_query("SELECT * FROM games", fetch=True)
+        total_games = execute_query("SELECT COUNT(*) as count FROM games", fetch=True)[0]['count']
         
         # Calculate comprehensive leaderboard data
         leaderboard = []
-        if players and games:
+        if players and total_games:
+            # Stats for every player from a few grouped queries
+            all_stats = player_stats_batch(execute_query, matrix=head_to_head.ensure_loaded(execute_query),
+                                           streak_source=PARTICIPANT_RESULTS)
+            player_ratings = ratings.current_ratings(execute_query)
             for player in players:
-                player_stats = calculate_player_stats(player['id'])
+                player_stats = all_stats.get(player['id'], empty_player_stats())
                 if player_stats['total_games'] > 0:  # Only include players with games
                     leaderboard_entry = {
                         'id': player['id'],
@@ -947,76 +1016,58 @@ def stats():
                         'double_skunks_received': player_stats['double_skunks_received'],
                         'avg_winning_score': player_stats['avg_winning_score'],
                         'current_streak': player_stats['current_streak'],
-                        'recent_form': player_stats['recent_form']
+                        'longest_win_streak': player_stats['longest_win_streak'],
+                        'longest_loss_streak': player_stats['longest_loss_streak'],
+                        'recent_form': player_stats['recent_form'],
+                        'rating': player_ratings.get(player['id'], {}).get('rating')
                     }
                     leaderboard.append(leaderboard_entry)
             
             # Sort leaderboard by win percentage (desc), then by total wins (desc), then by total games (desc)
             leaderboard.sort(key=lambda x: (x['win_percentage'], x['wins'], x['total_games']), reverse=True)
         
-        # Calculate nemesis data for each player
+        # Nemesis for each player straight from the head-to-head matrix
         player_nemesis = {}
-        if players and games:
+        if players and total_games:
+            names = {p['id']: f"{p['first_name']} {p['last_name']}" for p in players}
             for player in players:
-                # Find who beat this player the most
-                opponents = {}
-                for game in games:
-                    if game['loser_id'] == player['id']:
-                        # Find winner name
-                        winner = next((p for p in players if p['id'] == game['winner_id']), None)
-                        if winner:
-                            winner_name = f"{winner['first_name']} {winner['last_name']}"
-                            opponents[winner_name] = opponents.get(winner_name, 0) + 1
-                
-                if opponents:
-                    # Find the opponent who beat this player the most
-                    nemesis = max(opponents.items(), key=lambda x: x[1])
-                    player_nemesis[player['id']] = {
-                        'name': nemesis[0],
-                        'losses_to_them': nemesis[1]
-                    }
+                nemesis = with_name(head_to_head.nemesis(player['id']), names)
+                if nemesis:
+                    player_nemesis[player['id']] = nemesis
         
         return render_template("stats.html", 
                              boards=boards, 
                              players=players, 
-                             games=games, 
+                             total_games=total_games, 
                              leaderboard=leaderboard,
                              player_nemesis=player_nemesis)
         
     except Exception as e:
         print(f"ERROR in stats route: {e}")
         flash(f"Database error: {e}", "error")
-        return render_template("stats.html", boards=[], players=[], games=[], leaderboard=[], player_nemesis={})
+        return render_template("stats.html", boards=[], players=[], total_games=0, leaderboard=[], player_nemesis={})
 
 @app.route("/leaderboard")
 def leaderboard():
     """Display player leaderboard with various rankings"""
     try:
         # Get all players with their stats
-        players_data = execute_query("""
-            SELECT p.id,
-                   p.first_name || ' ' || p.last_name as name,
-                   p.first_name, p.last_name, p.photo,
-                   COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) as wins,
-                   COUNT(CASE WHEN g.loser_id = p.id THEN 1 END) as losses,
-                   (COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) * 100.0 / 
-                    NULLIF(COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) + COUNT(CASE WHEN g.loser_id = p.id THEN 1 END), 0)) as win_rate,
-                   COUNT(CASE WHEN g.winner_id = p.id AND (g.winner_score - g.loser_score) >= 30 THEN 1 END) as skunks_given,
-                   COUNT(CASE WHEN g.loser_id = p.id AND (g.winner_score - g.loser_score) >= 30 THEN 1 END) as skunks_received
-            FROM players p
-            LEFT JOIN games g ON (g.winner_id = p.id OR g.loser_id = p.id)
-            GROUP BY p.id, p.first_name, p.last_name, p.photo
-            HAVING (COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) + COUNT(CASE WHEN g.loser_id = p.id THEN 1 END)) > 0
-            ORDER BY win_rate DESC, wins DESC
-        """, fetch=True)
+        players_data = get_leaderboard_rows()
         
         # Calculate rankings
         win_rate_leaders = sorted(players_data, key=lambda x: (x['win_rate'] or 0, x['wins']), reverse=True)
         most_wins = sorted(players_data, key=lambda x: x['wins'], reverse=True)
         most_games = sorted(players_data, key=lambda x: x['wins'] + x['losses'], reverse=True)
-        skunk_masters = sorted(players_data, key=lambda x: x['skunks_given'], reverse=True)
+        # Skunk counts straight from the partial indexes over skunked games
+        skunks = skunk_columns.skunk_leaders(execute_query)
+        skunk_masters = sorted((dict(p, **skunks[p['id']]) for p in players_data if p['id'] in skunks),
+                               key=lambda x: (x['skunks_given'], x['double_skunks_given']), reverse=True)
+        rating_leaders = sorted(players_data, key=lambda x: x['rating'] or 0, reverse=True)
+        streak_leaders = sorted(players_data, key=lambda x: x['longest_win_streak'], reverse=True)
         
         return render_template("leaderboard.html", 
+                             rating_leaders=rating_leaders,
+                             streak_leaders=streak_leaders,
                              win_rate_leaders=win_rate_leaders,
                              most_wins=most_wins,
                              most_games=most_games,
@@ -1025,7 +1076,19 @@ def leaderboard():
     except Exception as e:
         flash(f"Database error: {e}", "error")
         return render_template("leaderboard.html", 
-                             win_rate_leaders=[], most_wins=[], most_games=[], skunk_masters=[])
+                             rating_leaders=[], streak_leaders=[], win_rate_leaders=[], most_wins=[], most_games=[], skunk_masters=[])
+
+def init_game_tables():
+    """Create the tables kept from games and fill them the first time"""
+    try:
+        for label in game_tables.init(execute_query, bulk_insert, transaction, postgresql=is_production()):
+            print(f"✅ {label} built from games")
+    except Exception:
+        app.logger.exception("Initializing tables kept from games failed - nothing was changed")
+
+# Pages read game_participants and the other tables kept from games, so create
+# them on import - a WSGI server never runs the __main__ block below
+init_game_tables()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 5000))
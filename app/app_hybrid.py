@@ -5,15 +5,66 @@ Works with both PostgreSQL (Railway) and SQLite (local)
 """
 
 import os
-import sqlite3
 import uuid
 import time
+import tempfile
+import threading
+from contextlib import contextmanager
+from functools import partial
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import (Flask, render_template, request, redirect, url_for, flash, g, has_app_context,
+                   Response, stream_with_context, abort, jsonify)
+
+try:
+    from database import (get_pool, pool_stats, get_sqlite_connection, release_sqlite_connection,
+                          compile_sql, compile_insert, statement_cache_info, SQLITE, POSTGRESQL,
+                          execute_compiled, prepared_statement_stats, iter_chunks, write_rows,
+                          BULK_CHUNK_SIZE, stream_rows, STREAM_ITERSIZE)
+except ImportError:
+    from app.database import (get_pool, pool_stats, get_sqlite_connection, release_sqlite_connection,
+                              compile_sql, compile_insert, statement_cache_info, SQLITE, POSTGRESQL,
+                              execute_compiled, prepared_statement_stats, iter_chunks, write_rows,
+                              BULK_CHUNK_SIZE, stream_rows, STREAM_ITERSIZE)
+
+try:
+    from game_import import detect_format, import_jobs
+    from data_export import EXPORT_FORMATS, export_query, iter_export
+    from stats_engine import build_leaderboard, player_streaks, PARTICIPANT_RESULTS
+    from head_to_head import head_to_head, player_names, with_name
+    from leaderboard_view import leaderboard_view
+    from score_stats import score_distribution
+    from game_columns import game_columns, COLUMNAR_STATS
+    import board_stats
+    import game_events
+    import game_tables
+    import ratings
+    import rollups
+    import stats_cube
+    import summary_tables
+except ImportError:
+    from app.game_import import detect_format, import_jobs
+    from app.data_export import EXPORT_FORMATS, export_query, iter_export
+    from app.stats_engine import build_leaderboard, player_streaks, PARTICIPANT_RESULTS
+    from app.head_to_head import head_to_head, player_names, with_name
+    from app.leaderboard_view import leaderboard_view
+    from app.score_stats import score_distribution
+    from app.game_columns import game_columns, COLUMNAR_STATS
+    from app import board_stats
+    from app import game_events
+    from app import game_tables
+    from app import ratings
+    from app import rollups
+    from app import stats_cube
+    from app import summary_tables
+
+# Columns the board list shows - description is cut to what the card displays
+BOARD_LIST_COLUMNS = """id, date, roman_number, wood_type, material_type, in_collection, is_gift,
+       gifted_to, gifted_from, image_front, image_back, SUBSTR(description, 1, 101) as description"""
 
 # Check if we're on Railway (has DATABASE_URL)
 DATABASE_URL = os.environ.get('DATABASE_URL')
 IS_RAILWAY = bool(DATABASE_URL)
+DB_DIALECT = POSTGRESQL if IS_RAILWAY else SQLITE
 
 # Cloudinary configuration
 USE_CLOUDINARY = IS_RAILWAY and os.environ.get('CLOUDINARY_URL')
@@ -113,6 +164,12 @@ def init_database():
             print("✅ PostgreSQL tables initialized successfully")
         except Exception as e:
             print(f"❌ Error initializing PostgreSQL tables: {e}")
+        
+        try:
+            leaderboard_view.enable(execute_query)
+            print("✅ Materialized leaderboard view ready")
+        except Exception as e:
+            print(f"❌ Error creating leaderboard view: {e}")
     else:
         # SQLite table creation (local development)
         sqlite_schema = """
@@ -174,81 +231,273 @@ def init_database():
             print("✅ SQLite tables initialized successfully")
         except Exception as e:
             print(f"❌ Error initializing SQLite tables: {e}")
+    
+    # Generated game columns and the tables kept from games (precomputed stats, participants,
+    # ratings, rollups, board stats, the stats cube) - filled the first time they exist
+    try:
+        for label in game_tables.init(execute_query, bulk_insert, transaction, postgresql=IS_RAILWAY):
+            print(f"✅ {label} built from games")
+    except Exception:
+        app.logger.exception("Initializing tables kept from games failed - nothing was changed")
+    
+    if COLUMNAR_STATS and not game_columns.enabled:
+        game_columns.enable()
+        print("✅ Columnar game stats enabled")
+
+def sync_game_tables(game_id, old_game, new_game):
+    """Bring the tables kept from games up to date after one game write.
+
+    Call it inside the write's transaction() so they commit or roll back
+    together. Returns the write's games version for game_events.game_changed.
+    """
+    return game_tables.sync(execute_query, bulk_insert, game_id, old_game, new_game)
+
+def rebuild_game_tables():
+    """Recompute every table kept from games, in one transaction"""
+    game_tables.rebuild(execute_query, bulk_insert, transaction)
 
 def get_db():
     """Get database connection - PostgreSQL on Railway, SQLite locally"""
     if IS_RAILWAY:
-        # Import here to avoid errors when psycopg2 is not installed locally
-        import psycopg2
-        from psycopg2.extras import RealDictCursor
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
-        return conn
+        # Borrow from this worker's pool instead of opening a new connection
+        return get_pool().getconn()
     else:
-        # SQLite for local development
-        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
-        
-        # Try data directory first
-        data_dir = os.path.join(base_dir, "data")
-        db_path = os.path.join(data_dir, "database.db")
-        
-        # Fallback to app directory
-        if not os.path.exists(db_path):
-            app_dir = os.path.dirname(os.path.abspath(__file__))
-            db_path = os.path.join(app_dir, "database.db")
-        
-        conn = sqlite3.connect(db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        # SQLite for local development - this thread's cached, tuned connection
+        return get_sqlite_connection()
 
-def execute_query(query, params=None, fetch=False):
-    """Execute query with database-agnostic parameter handling"""
-    if params is None:
-        params = []
+def release_db(conn):
+    """Give a connection from get_db() back - returns it to the pool on Railway"""
+    if IS_RAILWAY:
+        get_pool().putconn(conn)
+    else:
+        release_sqlite_connection(conn)
+
+# Connection state outside of a Flask app context (CLI scripts, startup)
+_local = threading.local()
+
+def _db_scope():
+    """Where the shared connection lives - flask.g during a request, a thread-local otherwise"""
+    return g if has_app_context() else _local
+
+def _in_transaction():
+    return getattr(_db_scope(), 'db_transaction_depth', 0) > 0
+
+@contextmanager
+def _connection():
+    """Connection for a single query.
+
+    During a request every query shares one connection, kept on flask.g and
+    released by close_request_db(). Outside a request the connection of an
+    open transaction() is reused, otherwise a connection is borrowed just for
+    this query.
+    """
+    scope = _db_scope()
+    conn = getattr(scope, 'db', None)
+    if conn is not None:
+        yield conn
+    elif has_app_context():
+        g.db = get_db()
+        yield g.db
+    else:
+        conn = get_db()
+        try:
+            yield conn
+        finally:
+            release_db(conn)
+
+@app.teardown_appcontext
+def close_request_db(exception=None):
+    """Release the request's connection - uncommitted work is rolled back"""
+    conn = g.pop('db', None)
+    g.pop('db_transaction_depth', None)
+    if conn is not None:
+        release_db(conn)
+
+@contextmanager
+def transaction():
+    """Run several queries as one atomic unit of work on one connection.
+
+        with transaction():
+            board = execute_query("SELECT ...", [board_id], fetch=True)
+            execute_query("UPDATE ...", [...])
+
+    Commits when the outermost block exits cleanly and rolls back on any
+    exception. Nested blocks join the outer transaction.
+    """
+    scope = _db_scope()
+    outermost = getattr(scope, 'db_transaction_depth', 0) == 0
+    owns_connection = False
+
+    if outermost:
+        if getattr(scope, 'db', None) is None:
+            scope.db = get_db()
+            owns_connection = not has_app_context()
+        if not IS_RAILWAY and not scope.db.in_transaction:
+            # SQLite only opens a transaction implicitly before writes
+            scope.db.execute("BEGIN")
+
+    scope.db_transaction_depth = getattr(scope, 'db_transaction_depth', 0) + 1
+    try:
+        yield scope.db
+        if outermost:
+            scope.db.commit()
+    except Exception:
+        if outermost:
+            scope.db.rollback()
+        raise
+    finally:
+        scope.db_transaction_depth -= 1
+        if owns_connection:
+            release_db(scope.db)
+            scope.db = None
+
+def execute_query(query, params=None, fetch=False, prepare=False, lazy=False):
+    """Execute query with database-agnostic parameter handling
+
+    prepare=True marks a hot statement: on PostgreSQL it is PREPAREd once per
+    connection and EXECUTEd after that. SQLite already caches prepared
+    statements per connection, so the flag makes no difference there.
+
+    fetch=True, lazy=True returns LazyRows instead of a list, so a template
+    can loop over a long result without it all being loaded first. Lazy
+    rows come from a PostgreSQL named cursor, which DECLAREs the query and
+    so cannot EXECUTE a prepared statement - lazy and prepare don't mix.
+    """
+    if fetch and lazy:
+        if prepare:
+            raise ValueError("lazy=True reads through a named cursor and cannot use a prepared statement")
+        return LazyRows(query, params)
     
+    # Rewritten for this database once per distinct statement, then cached
+    compiled = compile_sql(query, DB_DIALECT)
+    return _execute_compiled(compiled, params, fetch=fetch, prepare=prepare)
+
+def execute_insert(query, params=None, id_column='id', prepare=False):
+    """Execute an INSERT and return the new row's ID
+
+    Uses INSERT ... RETURNING on PostgreSQL and cursor.lastrowid on SQLite,
+    so the ID comes back without a second round-trip.
+    """
+    compiled = compile_insert(query, DB_DIALECT, id_column)
+    return _execute_compiled(compiled, params, prepare=prepare, id_column=id_column)
+
+def bulk_insert(table, columns, rows, chunk_size=BULK_CHUNK_SIZE, conflict_columns=None, update_columns=None):
+    """Insert many rows at once and return how many were written
+
+    rows can be any iterable (a generator is fine) of tuples in column order
+    or dicts keyed by column name. They are sent chunk_size at a time -
+    executemany() on SQLite, COPY on PostgreSQL - and each chunk is committed,
+    so a large import never holds everything in memory or in one transaction.
+    Inside transaction() nothing is committed until the block exits.
+
+    Pass conflict_columns to skip rows that already exist, plus update_columns
+    to overwrite them instead (an upsert).
+    """
+    total = 0
+    with _connection() as conn:
+        cursor = conn.cursor()
+        try:
+            for chunk in iter_chunks(rows, chunk_size):
+                total += write_rows(cursor, DB_DIALECT, table, columns, chunk,
+                                    conflict_columns, update_columns)
+                if not _in_transaction():
+                    conn.commit()
+        except Exception:
+            if not _in_transaction():
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
+    return total
+
+_NO_ROWS = object()
+
+class LazyRows:
+    """Query rows fetched in batches while they are iterated
+
+    Uses a named cursor on PostgreSQL and fetchmany() on SQLite, on the
+    request's connection. Truth testing ({% if boards %}) reads just the
+    first batch. Each further loop over the rows runs the query again
+    rather than keeping them all in memory, so only hand LazyRows to a
+    template that loops over them once.
+    """
+
+    def __init__(self, query, params=None, itersize=STREAM_ITERSIZE):
+        self.query = query
+        self.params = params
+        self.itersize = itersize
+        self._started = None  # (first row, rest) begun by __bool__
+
+    def _rows(self):
+        with _connection() as conn:
+            for row in stream_rows(conn, DB_DIALECT, self.query, self.params, self.itersize):
+                yield row
+
+    def _start(self):
+        rows = self._rows()
+        return next(rows, _NO_ROWS), rows
+
+    def __bool__(self):
+        if self._started is None:
+            self._started = self._start()
+        return self._started[0] is not _NO_ROWS
+
+    def __iter__(self):
+        first, rows = self._started or self._start()
+        self._started = None
+        if first is _NO_ROWS:
+            return
+        yield first
+        for row in rows:
+            yield row
+
+def iter_query(query, params=None, itersize=STREAM_ITERSIZE):
+    """Yield the rows of a SELECT without loading them all (named cursor on PostgreSQL)
+
+    Uses a connection of its own for as long as the generator runs, so it
+    can feed a streamed response after the request's connection is gone.
+    """
     conn = get_db()
-    cursor = conn.cursor()
-    
     try:
-        if IS_RAILWAY:
-            # PostgreSQL uses $1, $2, etc. - convert from ?
-            pg_query = query
-            param_count = query.count('?')
-            for i in range(param_count):
-                pg_query = pg_query.replace('?', f'${i+1}', 1)
-            cursor.execute(pg_query, params)
-        else:
-            # SQLite uses ?
-            cursor.execute(query, params)
+        for row in stream_rows(conn, DB_DIALECT, query, params, itersize):
+            yield row
+    finally:
+        release_db(conn)
+
+def _execute_compiled(compiled, params, fetch=False, prepare=False, id_column='id'):
+    if params is None:
+        params = []
+    
+    with _connection() as conn:
+        cursor = conn.cursor()
         
-        if fetch:
-            result = cursor.fetchall()
-            cursor.close()
-            conn.close()
-            return result
-        else:
-            conn.commit()
-            if IS_RAILWAY:
-                # Get last inserted ID for PostgreSQL
-                if query.strip().upper().startswith('INSERT'):
-                    cursor.execute("SELECT LASTVAL()")
-                    last_id = cursor.fetchone()[0]
-                    cursor.close()
-                    conn.close()
-                    return last_id
-            else:
-                # Get last inserted ID for SQLite
-                last_id = cursor.lastrowid
-                cursor.close()
-                conn.close()
-                return last_id
+        try:
+            execute_compiled(cursor, compiled, params, prepare=prepare)
             
-            cursor.close()
-            conn.close()
+            if fetch:
+                return cursor.fetchall()
             
-    except Exception as e:
-        cursor.close()
-        conn.close()
-        raise e
+            new_id = None
+            if compiled.returning:
+                row = cursor.fetchone()
+                if row is not None and id_column in row.keys():
+                    new_id = row[id_column]
+            elif compiled.is_insert and DB_DIALECT == SQLITE:
+                # SQLite: the driver already knows the new row's ID
+                new_id = cursor.lastrowid
+            
+            # Inside transaction() the commit happens when the block exits
+            if not _in_transaction():
+                conn.commit()
+            return new_id
+            
+        except Exception:
+            # Don't leave the shared connection in an aborted transaction
+            if not _in_transaction():
+                conn.rollback()
+            raise
+        finally:
+            cursor.close()
 
 def upload_image_to_cloudinary(file, folder="cribbage_boards"):
     """Upload image to Cloudinary cloud storage"""
@@ -400,6 +649,16 @@ def debug_filesystem():
     except Exception as e:
         return f"Debug error: {e}"
 
+@app.route("/debug/db_pool")
+def debug_db_pool():
+    """Debug route to check connection pool usage for this worker"""
+    debug_info = {
+        "pool": pool_stats() if IS_RAILWAY else "Connection pool is only used with PostgreSQL (Railway)",
+        "statement_cache": statement_cache_info(),
+        "prepared_statements": prepared_statement_stats() if IS_RAILWAY else "PostgreSQL only",
+    }
+    return f"<pre>{str(debug_info)}</pre>"
+
 @app.route("/static/<path:filename>")
 def static_files(filename):
     """Serve static files"""
@@ -422,7 +681,8 @@ except Exception as e:
 @app.route("/")
 def index():
     try:
-        boards = execute_query("SELECT * FROM boards ORDER BY date DESC", fetch=True)
+        # A list, not LazyRows - index.html loops over the boards twice (grid and list views)
+        boards = execute_query(f"SELECT {BOARD_LIST_COLUMNS} FROM boards ORDER BY board_date DESC NULLS LAST, id DESC", fetch=True, prepare=True)
         return render_template("index.html", boards=boards)
     except Exception as e:
         flash(f"Database error: {e}", "error")
@@ -431,11 +691,12 @@ def index():
 @app.route("/board/<int:board_id>")
 def board_detail(board_id):
     try:
-        board = execute_query("SELECT * FROM boards WHERE id = ?", [board_id], fetch=True)
+        board = execute_query("SELECT * FROM boards WHERE id = ?", [board_id], fetch=True, prepare=True)
         if not board:
             flash("Board not found!", "error")
             return redirect(url_for("index"))
-        return render_template("board_detail.html", board=board[0])
+        play_stats = board_stats.board_summary(partial(execute_query, prepare=True), board_id)
+        return render_template("board_detail.html", board=board[0], play_stats=play_stats)
     except Exception as e:
         flash(f"Database error: {e}", "error")
         return redirect(url_for("index"))
@@ -496,7 +757,7 @@ def add_board():
             print(f"💾 Inserting board into database...")
             print(f"📊 Values: [{date}, {roman_number}, {description}, {wood_type}, {material_type}, {front_filename}, {back_filename}, {is_gift}, {gifted_to}, {gifted_from}, {in_collection}]")
             
-            result = execute_query("""
+            result = execute_insert("""
                 INSERT INTO boards (date, roman_number, description, wood_type, material_type, 
                                   image_front, image_back, is_gift, gifted_to, gifted_from, in_collection)
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
@@ -558,17 +819,14 @@ def edit_board(board_id):
             front_image = request.files.get("front_view") or request.files.get("image_front") 
             back_image = request.files.get("back_view") or request.files.get("image_back")
             
-            # Get current filenames
-            current_board = execute_query("SELECT image_front, image_back FROM boards WHERE id = ?", [board_id], fetch=True)
-            front_filename = current_board[0]['image_front'] if current_board else None
-            back_filename = current_board[0]['image_back'] if current_board else None
+            # Upload new files first so no transaction is held open during the upload
+            new_front_filename = None
+            new_back_filename = None
             
-            # Update filenames if new files uploaded
             if front_image and front_image.filename and front_image.filename.strip():
                 print(f"🖼️ Processing front image for edit: {front_image.filename}")
                 new_front_filename = upload_image(front_image, "front")
                 if new_front_filename:
-                    front_filename = new_front_filename
                     print(f"✅ Front image updated successfully")
                 else:
                     print(f"❌ Front image update failed")
@@ -577,19 +835,23 @@ def edit_board(board_id):
                 print(f"🖼️ Processing back image for edit: {back_image.filename}")
                 new_back_filename = upload_image(back_image, "back")
                 if new_back_filename:
-                    back_filename = new_back_filename
                     print(f"✅ Back image updated successfully")
                 else:
                     print(f"❌ Back image update failed")
             
-            # Update database
-            execute_query("""
-                UPDATE boards SET date = ?, roman_number = ?, description = ?, wood_type = ?, 
-                                material_type = ?, image_front = ?, image_back = ?, is_gift = ?, 
-                                gifted_to = ?, gifted_from = ?, in_collection = ?
-                WHERE id = ?
-            """, [date, roman_number, description, wood_type, material_type, 
-                  front_filename, back_filename, is_gift, gifted_to, gifted_from, in_collection, board_id])
+            # Read current filenames and update in one atomic unit of work
+            with transaction():
+                current_board = execute_query("SELECT image_front, image_back FROM boards WHERE id = ?", [board_id], fetch=True)
+                front_filename = new_front_filename or (current_board[0]['image_front'] if current_board else None)
+                back_filename = new_back_filename or (current_board[0]['image_back'] if current_board else None)
+                
+                execute_query("""
+                    UPDATE boards SET date = ?, roman_number = ?, description = ?, wood_type = ?, 
+                                    material_type = ?, image_front = ?, image_back = ?, is_gift = ?, 
+                                    gifted_to = ?, gifted_from = ?, in_collection = ?
+                    WHERE id = ?
+                """, [date, roman_number, description, wood_type, material_type, 
+                      front_filename, back_filename, is_gift, gifted_to, gifted_from, in_collection, board_id])
             
             flash("Board updated successfully!", "success")
             return redirect(url_for("board_detail", board_id=board_id))
@@ -603,13 +865,21 @@ def delete_board(board_id):
     try:
         print(f"🗑️ Deleting board ID: {board_id}")
         
-        # Get board info for cleanup
-        board = execute_query("SELECT image_front, image_back FROM boards WHERE id = ?", [board_id], fetch=True)
+        with transaction():
+            # Get board info for cleanup
+            board = execute_query("SELECT image_front, image_back FROM boards WHERE id = ?", [board_id], fetch=True)
+            
+            changes = []
+            if board:
+                print(f"✅ Board found, proceeding with deletion")
+                # Take the board off its games (PostgreSQL's ON DELETE SET NULL), with the tables kept from games
+                changes = game_tables.clear_board(execute_query, bulk_insert, board_id)
+                # Delete the board from database
+                execute_query("DELETE FROM boards WHERE id = ?", [board_id])
         
+        for old_game, new_game, version in changes:
+            game_events.game_changed(old_game, new_game, version)
         if board:
-            print(f"✅ Board found, proceeding with deletion")
-            # Delete the board from database
-            execute_query("DELETE FROM boards WHERE id = ?", [board_id])
             print(f"✅ Board deleted successfully from database")
             flash("Board deleted successfully!", "success")
         else:
@@ -628,7 +898,7 @@ def delete_board(board_id):
 @app.route("/players")
 def players():
     try:
-        players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True)
+        players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True, prepare=True)
         return render_template("players.html", players=players)
     except Exception as e:
         flash(f"Database error: {e}", "error")
@@ -674,8 +944,8 @@ def add_player():
                 print(f"📍 Full traceback: {traceback.format_exc()}")
                 photo_filename = None
         
-        execute_query("INSERT INTO players (first_name, last_name, photo) VALUES (?, ?, ?)", 
-                     [first_name, last_name, photo_filename])
+        execute_insert("INSERT INTO players (first_name, last_name, photo) VALUES (?, ?, ?)", 
+                      [first_name, last_name, photo_filename])
         
         flash("Player added successfully!", "success")
     except Exception as e:
@@ -686,7 +956,7 @@ def add_player():
 @app.route("/player/<int:player_id>")
 def player_detail(player_id):
     try:
-        player = execute_query("SELECT * FROM players WHERE id = ?", [player_id], fetch=True)
+        player = execute_query("SELECT * FROM players WHERE id = ?", [player_id], fetch=True, prepare=True)
         if not player:
             flash("Player not found!", "error")
             return redirect(url_for("players"))
@@ -697,40 +967,32 @@ def player_detail(player_id):
                    pw.first_name || ' ' || pw.last_name as winner,
                    pl.first_name || ' ' || pl.last_name as loser,
                    b.roman_number
-            FROM games g
+            FROM game_participants gp
+            JOIN games g ON g.id = gp.game_id
             LEFT JOIN players pw ON g.winner_id = pw.id
             LEFT JOIN players pl ON g.loser_id = pl.id
             LEFT JOIN boards b ON g.board_id = b.id
-            WHERE g.winner_id = ? OR g.loser_id = ?
-            ORDER BY g.date_played DESC
-        """, [player_id, player_id], fetch=True)
+            WHERE gp.player_id = ?
+            ORDER BY gp.played_on DESC NULLS LAST, gp.game_id DESC
+        """, [player_id], fetch=True, prepare=True)
         
-        # Calculate comprehensive stats
-        wins = len([g for g in games if g['winner_id'] == player_id])
-        losses = len([g for g in games if g['loser_id'] == player_id])
-        total_games = wins + losses
-        win_percentage = (wins / total_games * 100) if total_games > 0 else 0
+        # Totals come precomputed from player_stats
+        stats = summary_tables.player_summary(partial(execute_query, prepare=True), player_id)
+        stats.update(player_streaks(execute_query, [player_id], PARTICIPANT_RESULTS).get(
+            player_id, {'current_streak': '0', 'longest_win_streak': 0, 'longest_loss_streak': 0}))
+        stats['rating'] = ratings.current_ratings(execute_query, [player_id]).get(player_id, {}).get('rating')
+        stats['favorite_opponent'] = head_to_head.ensure_loaded(
+            execute_query, summary_tables.PAIR_MATRIX_QUERY).favorite_opponent(player_id)
+        nemesis = head_to_head.nemesis(player_id)
+        trend = rollups.player_trend(execute_query, player_id, 'month')[-rollups.TREND_MONTHS:]
+        score_stats = score_distribution.player(execute_query, player_id)
         
-        skunks_given = len([g for g in games if g['winner_id'] == player_id and (g['is_skunk'] or g['is_double_skunk'])])
-        skunks_received = len([g for g in games if g['loser_id'] == player_id and (g['is_skunk'] or g['is_double_skunk'])])
-        double_skunks_given = len([g for g in games if g['winner_id'] == player_id and g['is_double_skunk']])
-        double_skunks_received = len([g for g in games if g['loser_id'] == player_id and g['is_double_skunk']])
+        names = player_names(execute_query, [opponent['id'] for opponent in (nemesis, stats['favorite_opponent']) if opponent])
+        with_name(nemesis, names)
+        with_name(stats['favorite_opponent'], names)
         
-        stats = {
-            'wins': wins,
-            'losses': losses,
-            'total_games': total_games,
-            'win_percentage': win_percentage,
-            'skunks_given': skunks_given,
-            'skunks_received': skunks_received,
-            'double_skunks_given': double_skunks_given,
-            'double_skunks_received': double_skunks_received,
-            'current_streak': 'N/A',  # Keep for template compatibility but not used
-            'favorite_opponent': None,
-            'nemesis': None
-        }
-        
-        return render_template("player_detail.html", player=player[0], stats=stats, games=games)
+        return render_template("player_detail.html", player=player[0], stats=stats, games=games, nemesis=nemesis,
+                               trend=trend, score_stats=score_stats)
     except Exception as e:
         flash(f"Database error: {e}", "error")
         return redirect(url_for("players"))
@@ -792,6 +1054,7 @@ def edit_player(player_id):
                 SET first_name = ?, last_name = ?, photo = ?
                 WHERE id = ?
             """, [first_name, last_name, photo_filename, player_id])
+            leaderboard_view.request_refresh()  # names and photos are copied into the view
             
             flash("Player updated successfully!", "success")
             return redirect(url_for("player_detail", player_id=player_id))
@@ -811,19 +1074,23 @@ def edit_player(player_id):
 @app.route("/delete_player/<int:player_id>", methods=["POST"])
 def delete_player(player_id):
     try:
-        # Get player data first to delete photo
-        player = execute_query("SELECT * FROM players WHERE id = ?", [player_id], fetch=True)
-        if player and player[0]['photo']:
-            safe_delete_file(player[0]['photo'])
-        
-        # Check if player has any games
-        games = execute_query("SELECT COUNT(*) as count FROM games WHERE winner_id = ? OR loser_id = ?", 
-                             [player_id, player_id], fetch=True)
+        with transaction():
+            player = execute_query("SELECT * FROM players WHERE id = ?", [player_id], fetch=True)
+            
+            # Check if player has any games
+            games = execute_query("SELECT COUNT(*) as count FROM game_participants WHERE player_id = ?", 
+                                 [player_id], fetch=True)
+            
+            has_games = bool(games and games[0]['count'] > 0)
+            if not has_games:
+                execute_query("DELETE FROM players WHERE id = ?", [player_id])
         
-        if games and games[0]['count'] > 0:
+        if has_games:
             flash("Cannot delete player - they have game records!", "error")
         else:
-            execute_query("DELETE FROM players WHERE id = ?", [player_id])
+            # Only remove the photo once the delete has been committed
+            if player and player[0]['photo']:
+                safe_delete_file(player[0]['photo'])
             flash("Player deleted successfully!", "success")
             
     except Exception as e:
@@ -836,7 +1103,7 @@ def games():
     try:
         # Get games with player and board information
         games_query = """
-            SELECT g.*, 
+            SELECT g.id, g.date_played, g.winner_id, g.loser_id, g.is_skunk, g.is_double_skunk,
                    w.first_name || ' ' || w.last_name as winner,
                    l.first_name || ' ' || l.last_name as loser,
                    b.roman_number
@@ -844,18 +1111,16 @@ def games():
             JOIN players w ON g.winner_id = w.id
             JOIN players l ON g.loser_id = l.id
             JOIN boards b ON g.board_id = b.id
-            ORDER BY g.date_played DESC, g.id DESC
+            ORDER BY g.played_on DESC NULLS LAST, g.id DESC
         """
         
-        if IS_RAILWAY:
-            # PostgreSQL uses || for concatenation
-            games = execute_query(games_query, fetch=True)
-        else:
-            # SQLite also supports ||
-            games = execute_query(games_query, fetch=True)
+        # || concatenation means the same on SQLite and PostgreSQL
+        # Lazy rather than prepared: games.html loops over them once, and a named cursor can't EXECUTE a prepared statement
+        games = execute_query(games_query, fetch=True, lazy=True)
         
-        players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True)
-        boards = execute_query("SELECT * FROM boards ORDER BY roman_number", fetch=True)
+        # Only what the filter and add game dropdowns show
+        players = execute_query("SELECT id, first_name, last_name FROM players ORDER BY first_name, last_name", fetch=True, prepare=True)
+        boards = execute_query("SELECT id, roman_number FROM boards ORDER BY roman_number", fetch=True, prepare=True)
         
         return render_template("games.html", games=games, players=players, boards=boards)
         
@@ -877,11 +1142,15 @@ def add_game():
             flash("Winner and loser cannot be the same player!", "error")
             return redirect(url_for("games"))
         
-        execute_query("""
-            INSERT INTO games (board_id, winner_id, loser_id, date_played, is_skunk, is_double_skunk)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """, [board_id, winner_id, loser_id, date_played, is_skunk, is_double_skunk])
+        with transaction():
+            game_id = execute_insert("""
+                INSERT INTO games (board_id, winner_id, loser_id, date_played, is_skunk, is_double_skunk)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [board_id, winner_id, loser_id, date_played, is_skunk, is_double_skunk])
+            new_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0]
+            version = sync_game_tables(game_id, None, new_game)
         
+        game_events.game_changed(None, new_game, version)
         flash("Game recorded successfully!", "success")
         
     except Exception as e:
@@ -889,6 +1158,55 @@ def add_game():
     
     return redirect(url_for("games"))
 
+@app.route("/import_games", methods=["POST"])
+def import_games_upload():
+    try:
+        file = request.files.get("import_file")
+        if not file or not file.filename:
+            flash("Please choose a CSV or NDJSON file to import", "error")
+            return redirect(url_for("games"))
+        
+        fmt = detect_format(file.filename)
+        
+        # Spool the upload to disk, then stream it from there row by row
+        fd, path = tempfile.mkstemp(prefix="game_import_", suffix=f".{fmt}")
+        os.close(fd)
+        file.save(path)
+        
+        # Runs in a background thread - progress is kept per worker process, keyed by job ID
+        job_id = import_jobs.start(path, fmt, execute_query, bulk_insert, rebuild_game_tables)
+        
+        flash(f"Import started - progress at {url_for('import_games_status', job_id=job_id)}", "success")
+        
+    except Exception as e:
+        flash(f"Error importing games: {e}", "error")
+    
+    return redirect(url_for("games"))
+
+@app.route("/import_games/<job_id>")
+def import_games_status(job_id):
+    """Progress of a background game import"""
+    result = import_jobs.get(job_id)
+    if result is None:
+        return jsonify({'error': "Unknown import job (it may have run in another worker)"}), 404
+    # JSON, not HTML - error messages echo values from the uploaded file
+    return jsonify(result.as_dict())
+
+@app.route("/export/<table>.<fmt>")
+def export_data(table, fmt):
+    """Stream boards, players or games as CSV, NDJSON or JSON"""
+    try:
+        query = export_query(table)
+    except ValueError:
+        abort(404)
+    if fmt not in EXPORT_FORMATS:
+        abort(404)
+    
+    # No Content-Length, so the body goes out chunked as it is generated
+    body = stream_with_context(iter_export(iter_query(query), fmt))
+    return Response(body, mimetype=EXPORT_FORMATS[fmt],
+                    headers={"Content-Disposition": f"attachment; filename={table}.{fmt}"})
+
 @app.route("/game/<int:game_id>/edit")
 def edit_game(game_id):
     try:
@@ -898,8 +1216,8 @@ def edit_game(game_id):
             return redirect(url_for("games"))
         
         game = game[0]
-        players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True)
-        boards = execute_query("SELECT * FROM boards ORDER BY roman_number", fetch=True)
+        players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True, prepare=True)
+        boards = execute_query("SELECT * FROM boards ORDER BY roman_number", fetch=True, prepare=True)
         
         return render_template("edit_game.html", game=game, players=players, boards=boards)
         
@@ -924,13 +1242,21 @@ def update_game(game_id):
             flash("Winner and loser cannot be the same player!", "error")
             return redirect(url_for("edit_game", game_id=game_id))
         
-        execute_query("""
-            UPDATE games 
-            SET board_id = ?, winner_id = ?, loser_id = ?, date_played = ?, 
-                winner_score = ?, loser_score = ?, is_skunk = ?, is_double_skunk = ?
-            WHERE id = ?
-        """, [board_id, winner_id, loser_id, date_played, winner_score, loser_score, is_skunk, is_double_skunk, game_id])
+        with transaction():
+            old_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+            execute_query("""
+                UPDATE games 
+                SET board_id = ?, winner_id = ?, loser_id = ?, date_played = ?, 
+                    winner_score = ?, loser_score = ?, is_skunk = ?, is_double_skunk = ?
+                WHERE id = ?
+            """, [board_id, winner_id, loser_id, date_played, winner_score, loser_score, is_skunk, is_double_skunk, game_id])
+            new_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+            if old_game and new_game:
+                # Back the old result out of the summaries and apply the new one
+                version = sync_game_tables(game_id, old_game[0], new_game[0])
         
+        if old_game and new_game:
+            game_events.game_changed(old_game[0], new_game[0], version)
         flash("Game updated successfully!", "success")
         
     except Exception as e:
@@ -941,7 +1267,14 @@ def update_game(game_id):
 @app.route("/game/<int:game_id>/delete", methods=["POST"])
 def delete_game(game_id):
     try:
-        execute_query("DELETE FROM games WHERE id = ?", [game_id])
+        with transaction():
+            old_game = execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+            execute_query("DELETE FROM games WHERE id = ?", [game_id])
+            if old_game:
+                version = sync_game_tables(game_id, old_game[0], None)
+        
+        if old_game:
+            game_events.game_changed(old_game[0], None, version)
         flash("Game deleted successfully!", "success")
         
     except Exception as e:
@@ -949,68 +1282,103 @@ def delete_game(game_id):
     
     return redirect(url_for("games"))
 
+# Filters the /stats breakdown offers, as query string arguments
+BREAKDOWN_FILTERS = ('wood_type', 'material_type', 'season', 'year')
+
+def get_breakdown(args, player_names_by_id, boards):
+    """The /stats breakdown from the stats cube, e.g. ?by=player&wood_type=Walnut&season=Winter"""
+    group_by = [d for d in dict.fromkeys((args.get('by') or 'player', args.get('then_by')))
+                if d in stats_cube.DIMENSIONS]
+    filters = {d: args[d] for d in BREAKDOWN_FILTERS if args.get(d)}
+    rows = stats_cube.query(execute_query, group_by, filters)
+    
+    labels = {'player': player_names_by_id,
+              'board': {b['id']: f"Board {b['roman_number'] or b['id']}" for b in boards}}
+    for row in rows:
+        row['labels'] = [labels.get(d, {}).get(row[d], row[d]) or '-' for d in group_by]
+    
+    return {
+        'group_by': group_by,
+        'filters': filters,
+        'rows': rows,
+        'dimensions': list(stats_cube.DIMENSIONS),
+        'choices': {'wood_type': stats_cube.values(execute_query, 'wood_type'),
+                    'material_type': stats_cube.values(execute_query, 'material_type'),
+                    'season': stats_cube.SEASONS,
+                    'year': stats_cube.values(execute_query, 'year')},
+    }
+
 @app.route("/stats")
 def stats():
     try:
         # Get basic data for the template
-        players = execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True)
-        boards = execute_query("SELECT * FROM boards ORDER BY roman_number", fetch=True)
+        players = execute_query("SELECT id, first_name, last_name, photo FROM players ORDER BY first_name, last_name", fetch=True, prepare=True)
+        boards = execute_query("SELECT id, roman_number, wood_type, material_type, in_collection FROM boards ORDER BY roman_number", fetch=True, prepare=True)
         
-        # Get games with player names for display
-        games_query = """
-            SELECT g.*, 
-                   w.first_name || ' ' || w.last_name as winner,
-                   l.first_name || ' ' || l.last_name as loser,
-                   b.roman_number
-            FROM games g
-            JOIN players w ON g.winner_id = w.id
-            JOIN players l ON g.loser_id = l.id
-            LEFT JOIN boards b ON g.board_id = b.id
-            ORDER BY g.date_played DESC, g.id DESC
-        """
-        games = execute_query(games_query, fetch=True)
+        total_games = execute_query("SELECT COUNT(*) as count FROM games", fetch=True, prepare=True)[0]['count']
+        
+        if game_columns.enabled:
+            # Totals and streaks from this worker's in-memory game columns,
+            # reloaded first if another worker has written games since
+            game_columns.ensure_current(execute_query)
+            leaderboard = game_columns.leaderboard(players)
+            streaks = game_columns.streaks()
+        else:
+            # Wins, losses and skunks for every player - the materialized view on
+            # PostgreSQL, the player_stats summary table on SQLite
+            leaderboard = build_leaderboard(partial(execute_query, prepare=True),
+                                            leaderboard_view.leaderboard_query(summary_tables.LEADERBOARD_QUERY))
+            streaks = player_streaks(execute_query, source=PARTICIPANT_RESULTS)
+        player_ratings = ratings.current_ratings(execute_query)
+        for entry in leaderboard:
+            entry['rating'] = player_ratings.get(entry['id'], {}).get('rating')
+            entry.update(streaks.get(entry['id'], {}))
         
-        # Simple leaderboard - basic win/loss stats
-        leaderboard = []
+        # Nemesis and rivalries come from the head-to-head matrix, not from games
+        head_to_head.ensure_loaded(execute_query, summary_tables.PAIR_MATRIX_QUERY)
+        names = {p['id']: f"{p['first_name']} {p['last_name']}" for p in players}
+        player_nemesis = {}
         for player in players:
-            wins = len([g for g in games if g['winner_id'] == player['id']])
-            losses = len([g for g in games if g['loser_id'] == player['id']])
-            total_games = wins + losses
-            
-            if total_games > 0:
-                win_percentage = (wins / total_games) * 100
-                player_stats = {
-                    'id': player['id'],
-                    'first_name': player['first_name'],
-                    'last_name': player['last_name'],
-                    'photo': player['photo'] if 'photo' in player.keys() else None,
-                    'wins': wins,
-                    'losses': losses,
-                    'total_games': total_games,
-                    'win_percentage': win_percentage,
-                    'skunks_given': len([g for g in games if g['winner_id'] == player['id'] and (g['is_skunk'] or g['is_double_skunk'])]),
-                    'skunks_received': len([g for g in games if g['loser_id'] == player['id'] and (g['is_skunk'] or g['is_double_skunk'])]),
-                    'double_skunks_given': len([g for g in games if g['winner_id'] == player['id'] and g['is_double_skunk']]),
-                    'double_skunks_received': len([g for g in games if g['loser_id'] == player['id'] and g['is_double_skunk']]),
-                }
-                leaderboard.append(player_stats)
+            nemesis = with_name(head_to_head.nemesis(player['id']), names)
+            if nemesis:
+                player_nemesis[player['id']] = nemesis
+        leader_ids = [entry['id'] for entry in leaderboard]
+        rivalry_grid = (game_columns.rivalry_grid(leader_ids) if game_columns.enabled
+                        else head_to_head.rivalry_grid(leader_ids))
+        
+        # Games per month from the monthly rollup, a row per month rather than a scan of games
+        trend = rollups.overall_trend(execute_query, 'month')[-rollups.TREND_MONTHS:]
+        
+        # Score and margin distributions, cached until a game changes
+        score_stats = score_distribution.get(execute_query)
+        for entry in leaderboard:
+            entry['scores'] = score_stats['by_player'].get(entry['id'])
         
-        # Sort by win percentage
-        leaderboard.sort(key=lambda x: x['win_percentage'], reverse=True)
+        breakdown = get_breakdown(request.args, names, boards)
         
         return render_template("stats.html", 
                              players=players, 
                              boards=boards, 
-                             games=games,
-                             leaderboard=leaderboard)
+                             total_games=total_games,
+                             leaderboard=leaderboard,
+                             player_nemesis=player_nemesis,
+                             rivalry_grid=rivalry_grid,
+                             trend=trend,
+                             score_stats=score_stats,
+                             breakdown=breakdown)
         
     except Exception as e:
         flash(f"Database error: {e}", "error")
         return render_template("stats.html", 
                              players=[], 
                              boards=[], 
-                             games=[],
-                             leaderboard=[])
+                             total_games=0,
+                             leaderboard=[],
+                             player_nemesis={},
+                             rivalry_grid={},
+                             trend=[],
+                             score_stats=None,
+                             breakdown=None)
 
 if __name__ == "__main__":
     # Initialize database tables on startup
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Per-board play statistics for Cribbage Board Collection
+board_stats holds each board's games, skunks and first and last day played
+(games.played_on, as YYYY-MM-DD);
+board_player_stats each player's wins and losses on it. A game write
+recomputes the rows of the board(s) it touches from games, which
+idx_games_board_id turns into a read of just that board's games, so the
+board detail page reads a handful of summary rows however often a board
+has been played on.
+
+rebuild() and check() cover the whole tables (see scripts/rebuild_stats.py).
+"""
+
+try:
+    from game_events import as_id
+except ImportError:
+    from app.game_events import as_id
+
+SCHEMA = [
+    # Already in schema_postgresql.sql; SQLite databases created by the app get it here
+    "CREATE INDEX IF NOT EXISTS idx_games_board_id ON games (board_id)",
+    """
+    CREATE TABLE IF NOT EXISTS board_stats (
+      board_id INTEGER PRIMARY KEY,
+      games INTEGER NOT NULL DEFAULT 0,
+      skunks INTEGER NOT NULL DEFAULT 0,
+      double_skunks INTEGER NOT NULL DEFAULT 0,
+      first_played VARCHAR(255),
+      last_played VARCHAR(255)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS board_player_stats (
+      board_id INTEGER NOT NULL,
+      player_id INTEGER NOT NULL,
+      wins INTEGER NOT NULL DEFAULT 0,
+      losses INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (board_id, player_id)
+    )
+    """,
+]
+
+BOARD_COLUMNS = ('games', 'skunks', 'double_skunks', 'first_played', 'last_played')
+PLAYER_COLUMNS = ('wins', 'losses')
+
+# Totals for every board matching {where}
+BOARD_TOTALS_FROM_GAMES = """
+    SELECT board_id, COUNT(*) as games,
+           SUM(CASE WHEN skunk_class > 0 THEN 1 ELSE 0 END) as skunks,
+           SUM(CASE WHEN skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks,
+           CAST(MIN(played_on) AS TEXT) as first_played,
+           CAST(MAX(played_on) AS TEXT) as last_played
+    FROM games
+    WHERE board_id IS NOT NULL {where}
+    GROUP BY board_id
+"""
+
+BOARD_PLAYERS_FROM_GAMES = """
+    SELECT board_id, player_id, SUM(won) as wins, COUNT(*) - SUM(won) as losses
+    FROM (
+        SELECT board_id, winner_id as player_id, 1 as won
+        FROM games WHERE board_id IS NOT NULL AND winner_id IS NOT NULL {where}
+        UNION ALL
+        SELECT board_id, loser_id as player_id, 0 as won
+        FROM games WHERE board_id IS NOT NULL AND loser_id IS NOT NULL {where}
+    ) r
+    GROUP BY board_id, player_id
+"""
+
+_INSERT_BOARD = f"INSERT INTO board_stats (board_id, {', '.join(BOARD_COLUMNS)}) "
+_INSERT_PLAYERS = f"INSERT INTO board_player_stats (board_id, player_id, {', '.join(PLAYER_COLUMNS)}) "
+
+
+def create_tables(execute_query):
+    for statement in SCHEMA:
+        execute_query(statement)
+
+
+def sync_board(execute_query, board_id):
+    """Recompute one board's rows from its games (none if it has no games left).
+
+    Call it in the same transaction as the write to games.
+    """
+    execute_query("DELETE FROM board_stats WHERE board_id = ?", [board_id])
+    execute_query("DELETE FROM board_player_stats WHERE board_id = ?", [board_id])
+    execute_query(_INSERT_BOARD + BOARD_TOTALS_FROM_GAMES.format(where="AND board_id = ?"), [board_id])
+    execute_query(_INSERT_PLAYERS + BOARD_PLAYERS_FROM_GAMES.format(where="AND board_id = ?"), [board_id, board_id])
+
+
+def apply_change(execute_query, old_game, new_game):
+    """Resync the boards a game write touched - both of them if it moved board"""
+    board_ids = {as_id(dict(game).get('board_id')) for game in (old_game, new_game) if game is not None}
+    for board_id in sorted(board_ids - {None}):
+        sync_board(execute_query, board_id)
+
+
+def rebuild(execute_query):
+    """Recompute both tables from games. Run it inside a transaction."""
+    execute_query("DELETE FROM board_stats")
+    execute_query("DELETE FROM board_player_stats")
+    execute_query(_INSERT_BOARD + BOARD_TOTALS_FROM_GAMES.format(where=""))
+    execute_query(_INSERT_PLAYERS + BOARD_PLAYERS_FROM_GAMES.format(where=""))
+
+
+def needs_rebuild(execute_query):
+    """True when games have been played on boards but nothing has been
+    summarized yet, or days played were copied from date_played text"""
+    if execute_query("SELECT COUNT(*) as count FROM board_stats "
+                     "WHERE first_played NOT LIKE '____-__-__' OR last_played NOT LIKE '____-__-__'",
+                     fetch=True)[0]['count']:
+        return True
+    if execute_query("SELECT COUNT(*) as count FROM board_stats", fetch=True)[0]['count']:
+        return False
+    return execute_query("SELECT COUNT(*) as count FROM games WHERE board_id IS NOT NULL", fetch=True)[0]['count'] > 0
+
+
+def check(execute_query):
+    """Rows that disagree with games, as readable lines (empty = consistent)"""
+    problems = []
+    for table, key_columns, columns, expected_query in (
+            ('board_stats', ('board_id',), BOARD_COLUMNS, BOARD_TOTALS_FROM_GAMES),
+            ('board_player_stats', ('board_id', 'player_id'), PLAYER_COLUMNS, BOARD_PLAYERS_FROM_GAMES)):
+        def by_key(rows):
+            return {tuple(row[k] for k in key_columns): tuple(row[c] for c in columns) for row in rows}
+
+        expected = by_key(execute_query(expected_query.format(where=""), fetch=True))
+        actual = by_key(execute_query(f"SELECT * FROM {table}", fetch=True))
+        for key in sorted(set(expected) | set(actual)):
+            if expected.get(key) != actual.get(key):
+                problems.append(f"{table} {dict(zip(key_columns, key))}: "
+                                f"expected {expected.get(key)}, found {actual.get(key)}")
+    return problems
+
+
+def board_summary(execute_query, board_id):
+    """The board's play stats for board_detail.html, or None if it has never been played on.
+
+    players is every player who has played on it, best win rate first.
+    """
+    rows = execute_query("SELECT * FROM board_stats WHERE board_id = ?", [board_id], fetch=True)
+    if not rows:
+        return None
+    summary = {column: rows[0][column] for column in BOARD_COLUMNS}
+    summary['skunk_rate'] = round(summary['skunks'] / summary['games'] * 100, 1) if summary['games'] else 0
+
+    summary['players'] = []
+    for row in execute_query("""
+        SELECT s.player_id, s.wins, s.losses, p.first_name || ' ' || p.last_name as name
+        FROM board_player_stats s
+        LEFT JOIN players p ON p.id = s.player_id
+        WHERE s.board_id = ?
+    """, [board_id], fetch=True):
+        games = row['wins'] + row['losses']
+        summary['players'].append({
+            'id': row['player_id'],
+            'name': row['name'],
+            'wins': row['wins'],
+            'losses': row['losses'],
+            'games': games,
+            'win_rate': round(row['wins'] / games * 100, 1) if games else 0,
+        })
+    summary['players'].sort(key=lambda p: (-p['win_rate'], -p['games'], p['name'] or ''))
+    return summary
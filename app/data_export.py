@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Streaming export of boards, players and games for Cribbage Board Collection
+Rows are encoded as they come off the cursor, so nothing is held in memory
+"""
+
+import csv
+import io
+import json
+
+EXPORT_QUERIES = {
+    'boards': "SELECT * FROM boards ORDER BY id",
+    'players': "SELECT id, first_name, last_name, photo, date_added FROM players ORDER BY id",
+    # Games joined with player names and board number; the board is optional
+    'games': """
+        SELECT g.id, g.date_played, g.board_id, b.roman_number,
+               g.winner_id, w.first_name || ' ' || w.last_name as winner,
+               g.loser_id, l.first_name || ' ' || l.last_name as loser,
+               g.winner_score, g.loser_score, g.is_skunk, g.is_double_skunk
+        FROM games g
+        JOIN players w ON g.winner_id = w.id
+        JOIN players l ON g.loser_id = l.id
+        LEFT JOIN boards b ON g.board_id = b.id
+        ORDER BY g.id
+    """,
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'json': 'application/json',
+}
+
+ROWS_PER_CHUNK = 500  # rows encoded into each piece of the response body
+
+
+def export_query(table):
+    if table not in EXPORT_QUERIES:
+        raise ValueError(f"Unknown export: {table}")
+    return EXPORT_QUERIES[table]
+
+
+def iter_export(rows, fmt, rows_per_chunk=ROWS_PER_CHUNK):
+    """Encode rows (dicts or sqlite3.Row) as CSV, NDJSON or a JSON array, yielding text chunks"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer) if fmt == 'csv' else None
+    count = 0
+
+    if fmt == 'json':
+        buffer.write('[')
+
+    for row in rows:
+        if fmt == 'csv':
+            if count == 0:
+                writer.writerow(row.keys())
+            writer.writerow([row[key] for key in row.keys()])
+        else:
+            if fmt == 'json' and count:
+                buffer.write(',')
+            # default=str covers dates and Decimal prices from PostgreSQL
+            buffer.write(json.dumps(dict(row), default=str))
+            if fmt == 'ndjson':
+                buffer.write('\n')
+        count += 1
+
+        if count % rows_per_chunk == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if fmt == 'json':
+        buffer.write(']\n')
+    if buffer.tell():
+        yield buffer.getvalue()
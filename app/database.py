@@ -4,66 +4,855 @@ Database Configuration for Cribbage Board Collection
 Supports both PostgreSQL (Railway) and SQLite (local development)
 """
 
+import io
+import itertools
 import os
+import re
 import sqlite3
-import psycopg2
+import threading
+import time
+import weakref
+from collections import OrderedDict, namedtuple
 from contextlib import contextmanager
+from functools import lru_cache
+
+DATABASE_URL = os.environ.get('DATABASE_URL')
+
+# Connection pool settings (per gunicorn worker process)
+POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '5'))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))                  # seconds to wait for a free connection
+POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800'))      # recycle connections after 30 minutes
+POOL_HEALTH_CHECK_IDLE = float(os.environ.get('DB_POOL_HEALTH_CHECK_IDLE', '30'))  # ping connections idle this long
+
+# SQLite tuning for local mode, applied once per connection
+SQLITE_BUSY_TIMEOUT = 10  # seconds to wait on a locked database before failing
+SQLITE_PRAGMAS = (
+    ("journal_mode", "WAL"),      # readers no longer block on a writer (and vice versa)
+    ("synchronous", "NORMAL"),    # safe with WAL, avoids an fsync on every commit
+    ("mmap_size", 134217728),     # memory-map up to 128MB of the database file
+    ("cache_size", -16000),       # 16MB page cache (negative = KiB)
+    ("temp_store", "MEMORY"),     # temp tables and sort buffers in RAM
+)
+
+# SQL dialects understood by compile_sql()
+SQLITE = 'sqlite'
+POSTGRESQL = 'postgresql'
+
+STATEMENT_CACHE_SIZE = 512
+PREPARED_STATEMENTS_PER_CONNECTION = 64
+SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+# ================================
+# SQL STATEMENT COMPILER
+# ================================
+#
+# Queries are written once in the project's portable SQL:
+#   - ? placeholders (SQLite style)
+#   - || for string concatenation (same meaning on SQLite and PostgreSQL)
+#   - INSERT OR IGNORE for "insert unless it already exists"
+#   - an optional RETURNING clause on INSERT
+# compile_sql() turns that into what the target driver expects and caches
+# the result, so each distinct statement is only rewritten once.
+
+CompiledStatement = namedtuple('CompiledStatement', [
+    'sql',          # text to pass to cursor.execute()
+    'param_count',  # number of placeholders
+    'is_insert',    # INSERT statement
+    'returning',    # True if the row comes back from a RETURNING clause
+    'prepare_sql',  # PostgreSQL text with $1..$n placeholders for PREPARE (None if not preparable)
+])
+
+# Statements PostgreSQL can PREPARE
+_PREPARABLE = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'VALUES', 'WITH'}
+
+_RETURNING_RE = re.compile(r'\s+RETURNING\s+.*$', re.IGNORECASE | re.DOTALL)
+_INSERT_OR_IGNORE_RE = re.compile(r'^(\s*)INSERT\s+OR\s+IGNORE\s+INTO\b', re.IGNORECASE)
+
+
+def _split_sql(query):
+    """Split SQL into (is_code, text) chunks.
+
+    Quoted strings, quoted identifiers and comments come back as non-code
+    chunks so placeholders are only rewritten where they really are
+    placeholders.
+    """
+    chunks = []
+    i = start = 0
+    n = len(query)
+    while i < n:
+        c = query[i]
+        if c in ("'", '"'):
+            end = i + 1
+            while end < n:
+                if query[end] == c:
+                    if end + 1 < n and query[end + 1] == c:  # escaped quote
+                        end += 2
+                        continue
+                    break
+                end += 1
+            end = min(end + 1, n)
+        elif query.startswith('--', i):
+            end = query.find('\n', i)
+            end = n if end == -1 else end
+        elif query.startswith('/*', i):
+            end = query.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+        else:
+            i += 1
+            continue
+        if start < i:
+            chunks.append((True, query[start:i]))
+        chunks.append((False, query[i:end]))
+        i = start = end
+    if start < n:
+        chunks.append((True, query[start:]))
+    return chunks
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def compile_sql(query, dialect):
+    """Compile portable SQL for `dialect` (SQLITE or POSTGRESQL)"""
+    if dialect not in (SQLITE, POSTGRESQL):
+        raise ValueError(f"Unknown SQL dialect: {dialect}")
+
+    chunks = _split_sql(query)
+    code = ''.join(text if is_code else ' ' for is_code, text in chunks)
+    first_word = code.lstrip().split(None, 1)[0].upper() if code.strip() else ''
+    is_insert = first_word == 'INSERT'
+    has_returning = is_insert and bool(_RETURNING_RE.search(code))
+    param_count = sum(text.count('?') for is_code, text in chunks if is_code)
+
+    if dialect == POSTGRESQL:
+        # psycopg2 uses %s placeholders, so a literal % has to be doubled
+        sql = ''.join(text.replace('%', '%%').replace('?', '%s') if is_code else text.replace('%', '%%')
+                      for is_code, text in chunks)
+        prepare_sql = None
+        if first_word in _PREPARABLE:
+            # PREPARE runs without parameters, so % stays as it is
+            numbers = iter(range(1, param_count + 1))
+            prepare_sql = ''.join(re.sub(r'\?', lambda _: f'${next(numbers)}', text) if is_code else text
+                                  for is_code, text in chunks)
+        if _INSERT_OR_IGNORE_RE.match(sql):
+            sql = _INSERT_OR_IGNORE_RE.sub(r'\1INSERT INTO', sql, count=1)
+            sql = _add_before_returning(sql, ' ON CONFLICT DO NOTHING', has_returning)
+            if prepare_sql:
+                prepare_sql = _INSERT_OR_IGNORE_RE.sub(r'\1INSERT INTO', prepare_sql, count=1)
+                prepare_sql = _add_before_returning(prepare_sql, ' ON CONFLICT DO NOTHING', has_returning)
+        return CompiledStatement(sql, param_count, is_insert, has_returning, prepare_sql)
+
+    sql = query
+    if has_returning and not SQLITE_HAS_RETURNING:
+        # Older SQLite (< 3.35) has no RETURNING - fall back to cursor.lastrowid
+        sql = _strip_returning(chunks)
+        has_returning = False
+    return CompiledStatement(sql, param_count, is_insert, has_returning, None)
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def compile_insert(query, dialect, id_column='id'):
+    """Compile an INSERT so the new row's ID comes back in the same round-trip.
+
+    PostgreSQL gets "RETURNING <id_column>" appended, SQLite reads
+    cursor.lastrowid, which costs nothing. Neither needs LASTVAL(), which
+    makes a second round-trip and can pick up a sequence bumped by a trigger.
+    """
+    compiled = compile_sql(query, dialect)
+    if not compiled.is_insert:
+        raise ValueError("compile_insert() only accepts INSERT statements")
+    if dialect == SQLITE or compiled.returning:
+        return compiled
+
+    clause = f" RETURNING {id_column}"
+    prepare_sql = compiled.prepare_sql
+    if prepare_sql is not None:
+        prepare_sql = prepare_sql.rstrip().rstrip(';') + clause
+    return compiled._replace(sql=compiled.sql.rstrip().rstrip(';') + clause,
+                             returning=True, prepare_sql=prepare_sql)
+
+
+def _add_before_returning(sql, clause, has_returning):
+    stripped = sql.rstrip().rstrip(';')
+    if not has_returning:
+        return stripped + clause
+    match = _RETURNING_RE.search(stripped)
+    return stripped[:match.start()] + clause + stripped[match.start():]
+
+
+def _strip_returning(chunks):
+    sql = ''.join(text for _, text in chunks).rstrip().rstrip(';')
+    match = _RETURNING_RE.search(sql)
+    return sql[:match.start()] if match else sql
+
+
+def statement_cache_info():
+    """Hit/miss counters of the compiled statement cache"""
+    return compile_sql.cache_info()._asdict()
+
+
+# ================================
+# PREPARED STATEMENTS (POSTGRESQL)
+# ================================
+
+# SQLSTATEs meaning a prepared statement has to be prepared again:
+# 26000 - it no longer exists (DEALLOCATE ALL / DISCARD ALL)
+# 0A000 - "cached plan must not change result type" after a schema change
+INVALID_SQL_STATEMENT_NAME = '26000'
+_REPREPARE_PGCODES = (INVALID_SQL_STATEMENT_NAME, '0A000')
+
+_prepared_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_prepared_stats_lock = threading.Lock()
+
+
+def _count_prepared(counter):
+    with _prepared_stats_lock:
+        _prepared_stats[counter] += 1
+
+
+class PreparedStatementRegistry:
+    """Server-side prepared statements of one PostgreSQL connection.
+
+    The first execute() of a statement runs PREPARE, later calls only send
+    EXECUTE with the parameters, so PostgreSQL skips parsing and planning.
+    At most `max_size` statements are kept; the least recently used one is
+    DEALLOCATEd to make room.
+    """
+
+    def __init__(self, max_size=PREPARED_STATEMENTS_PER_CONNECTION):
+        self.max_size = max_size
+        self._statements = OrderedDict()  # prepare_sql -> (name, EXECUTE text)
+        self._next_id = 0
+
+    def __len__(self):
+        return len(self._statements)
+
+    def clear(self):
+        """Forget every statement - the session was reset, so the server has none of them"""
+        self._statements.clear()
+
+    def _deallocate(self, cursor, name):
+        """DEALLOCATE a statement the server may already have dropped.
+
+        A savepoint keeps the "does not exist" error from aborting the
+        caller's transaction; finding one gone means the session was reset.
+        """
+        in_transaction = not getattr(getattr(cursor, 'connection', None), 'autocommit', False)
+        if in_transaction:
+            cursor.execute("SAVEPOINT crib_deallocate")
+        try:
+            cursor.execute(f"DEALLOCATE {name}")
+        except Exception as e:
+            if getattr(e, 'pgcode', None) != INVALID_SQL_STATEMENT_NAME:
+                raise
+            if in_transaction:
+                cursor.execute("ROLLBACK TO SAVEPOINT crib_deallocate")
+            self.clear()
+            _count_prepared('invalidations')
+        if in_transaction:
+            cursor.execute("RELEASE SAVEPOINT crib_deallocate")
+
+    def execute(self, cursor, compiled, params):
+        """Run a compiled statement through its prepared counterpart"""
+        entry = self._statements.get(compiled.prepare_sql)
+        if entry is None:
+            _count_prepared('misses')
+            if len(self._statements) >= self.max_size:
+                _, (old_name, _) = self._statements.popitem(last=False)
+                _count_prepared('evictions')
+                self._deallocate(cursor, old_name)
+
+            self._next_id += 1
+            name = f"crib_stmt_{self._next_id}"
+            cursor.execute(f"PREPARE {name} AS {compiled.prepare_sql}")
+            args = ', '.join(['%s'] * compiled.param_count)
+            entry = (name, f"EXECUTE {name} ({args})" if args else f"EXECUTE {name}")
+            self._statements[compiled.prepare_sql] = entry
+        else:
+            _count_prepared('hits')
+            self._statements.move_to_end(compiled.prepare_sql)
+
+        try:
+            cursor.execute(entry[1], params)
+        except Exception as e:
+            pgcode = getattr(e, 'pgcode', None)
+            if pgcode == INVALID_SQL_STATEMENT_NAME:
+                # The session was reset and took every prepared statement with it
+                self.clear()
+                _count_prepared('invalidations')
+            elif pgcode in _REPREPARE_PGCODES:
+                # Forget it so the next call prepares it again
+                self._statements.pop(compiled.prepare_sql, None)
+                _count_prepared('invalidations')
+            raise
+
+
+_registries = weakref.WeakKeyDictionary()
+_registries_lock = threading.Lock()
+
+
+def get_prepared_statements(conn):
+    """Get the prepared statement registry of a PostgreSQL connection"""
+    registry = _registries.get(conn)
+    if registry is None:
+        with _registries_lock:
+            registry = _registries.setdefault(conn, PreparedStatementRegistry())
+    return registry
+
+
+def forget_prepared_statements(conn):
+    """Drop a connection's registry - call it when the connection is closed or reset"""
+    with _registries_lock:
+        try:
+            _registries.pop(conn, None)
+        except TypeError:
+            pass  # not weak-referenceable, so it never had a registry
+
+
+def execute_compiled(cursor, compiled, params, prepare=False):
+    """Execute a compiled statement, through a server-side prepared statement if asked to"""
+    if prepare and compiled.prepare_sql is not None:
+        get_prepared_statements(cursor.connection).execute(cursor, compiled, params)
+    else:
+        cursor.execute(compiled.sql, params)
+
+
+def prepared_statement_stats():
+    """Hit/miss counters for prepared statements across this worker's connections"""
+    with _prepared_stats_lock:
+        stats = dict(_prepared_stats)
+    with _registries_lock:
+        stats['prepared'] = sum(len(registry) for registry in list(_registries.values()))
+    return stats
+
+
+# ================================
+# BULK WRITES
+# ================================
+#
+# Importing a season of games one INSERT at a time costs a round trip (and on
+# SQLite a journal sync per commit) for every row. write_rows() sends a whole
+# chunk in one call instead:
+#   - SQLite: executemany() of a single INSERT
+#   - PostgreSQL: COPY FROM STDIN for plain inserts, execute_values() for
+#     upserts (COPY cannot skip or update rows that already exist)
+# The caller decides when to commit; iter_chunks() splits any iterable so the
+# rows never have to be in memory all at once.
+
+BULK_CHUNK_SIZE = int(os.environ.get('DB_BULK_CHUNK_SIZE', '1000'))
+
+_IDENTIFIER_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+def _check_identifier(name):
+    """Table and column names are put into the SQL text, so only allow plain identifiers"""
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"Invalid SQL identifier: {name!r}")
+    return name
+
+
+def iter_chunks(rows, size=BULK_CHUNK_SIZE):
+    """Yield lists of at most size rows from any iterable (generators included)"""
+    if size < 1:
+        raise ValueError("Chunk size must be at least 1")
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@lru_cache(maxsize=STATEMENT_CACHE_SIZE)
+def compile_bulk_insert(table, columns, dialect, conflict_columns=None, update_columns=None):
+    """Build the multi-row INSERT for table/columns (tuples, so the result can be cached).
+
+    Without conflict_columns it is a plain INSERT. With conflict_columns rows
+    that already exist are skipped, or updated from the new row when
+    update_columns are given. ON CONFLICT ... DO UPDATE works the same on
+    PostgreSQL and SQLite 3.24+.
+
+    On PostgreSQL the statement has a single VALUES %s for execute_values().
+    """
+    _check_identifier(table)
+    column_list = ', '.join(_check_identifier(c) for c in columns)
+
+    if dialect == POSTGRESQL:
+        sql = f"INSERT INTO {table} ({column_list}) VALUES %s"
+    else:
+        sql = f"INSERT INTO {table} ({column_list}) VALUES ({', '.join('?' for _ in columns)})"
+
+    if conflict_columns:
+        target = ', '.join(_check_identifier(c) for c in conflict_columns)
+        if update_columns:
+            assignments = ', '.join(f"{_check_identifier(c)} = excluded.{c}" for c in update_columns)
+            sql += f" ON CONFLICT ({target}) DO UPDATE SET {assignments}"
+        else:
+            sql += f" ON CONFLICT ({target}) DO NOTHING"
+    return sql
+
+
+def _column_value(value):
+    """The flag columns are INTEGER, which PostgreSQL won't fill from a bool - send 0/1"""
+    return int(value) if isinstance(value, bool) else value
+
+
+def _row_values(row, columns):
+    """Rows may be sequences in column order or dicts keyed by column name"""
+    if isinstance(row, dict):
+        return tuple(_column_value(row.get(c)) for c in columns)
+    return tuple(_column_value(v) for v in row)
+
+
+def _copy_value(value):
+    """Encode one value for COPY's text format"""
+    if value is None:
+        return '\\N'
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def _copy_rows(cursor, table, columns, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write('\t'.join(_copy_value(v) for v in row))
+        buffer.write('\n')
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+
+
+def write_rows(cursor, dialect, table, columns, rows, conflict_columns=None, update_columns=None):
+    """Write one chunk of rows with a single driver call and return how many were sent.
+
+    Does not commit - see iter_chunks() and the bulk_insert() helpers.
+    """
+    columns = tuple(columns)
+    conflict_columns = tuple(conflict_columns) if conflict_columns else None
+    update_columns = tuple(update_columns) if update_columns else None
+    values = [_row_values(row, columns) for row in rows]
+    if not values:
+        return 0
+
+    for row in values:
+        if len(row) != len(columns):
+            raise ValueError(f"Expected {len(columns)} values per row for {table}, got {len(row)}")
+
+    sql = compile_bulk_insert(table, columns, dialect, conflict_columns, update_columns)
+
+    if dialect == POSTGRESQL:
+        if conflict_columns is None:
+            _copy_rows(cursor, table, columns, values)
+        else:
+            from psycopg2.extras import execute_values
+            execute_values(cursor, sql, values, page_size=len(values))
+    else:
+        cursor.executemany(sql, values)
+    return len(values)
+
+
+# ================================
+# STREAMING READS
+# ================================
+#
+# fetchall() builds the whole result in the worker's memory. stream_rows()
+# hands rows out as they arrive instead: PostgreSQL keeps the result on the
+# server behind a named (server-side) cursor and sends itersize rows per
+# round trip, SQLite steps through the result with fetchmany().
+
+STREAM_ITERSIZE = int(os.environ.get('DB_STREAM_ITERSIZE', '2000'))
+
+_stream_cursor_ids = itertools.count(1)
+
+
+def stream_rows(conn, dialect, query, params=None, itersize=STREAM_ITERSIZE):
+    """Yield the rows of a SELECT one at a time.
+
+    A PostgreSQL named cursor only lives inside a transaction, so don't
+    commit on conn until the generator is exhausted or closed.
+    """
+    compiled = compile_sql(query, dialect)
+    if dialect == POSTGRESQL:
+        from psycopg2.extras import RealDictCursor
+        cursor = conn.cursor(name=f"crib_stream_{next(_stream_cursor_ids)}", cursor_factory=RealDictCursor)
+        cursor.itersize = itersize
+    else:
+        cursor = conn.cursor()
+
+    try:
+        cursor.execute(compiled.sql, params or [])
+        if dialect == POSTGRESQL:
+            # Iterating a named cursor fetches itersize rows at a time
+            for row in cursor:
+                yield row
+        else:
+            while True:
+                rows = cursor.fetchmany(itersize)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+    finally:
+        cursor.close()
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the pool timeout"""
+
+
+def connect_postgresql(dsn=None):
+    """Open a new PostgreSQL connection that returns dict rows"""
+    # Import here to avoid errors when psycopg2 is not installed locally
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    return psycopg2.connect(dsn or DATABASE_URL, cursor_factory=RealDictCursor)
+
+
+class ConnectionPool:
+    """Bounded connection pool with health checks and a maximum connection lifetime.
+
+    Connections are handed out with getconn() and must be given back with
+    putconn(). Idle connections are reused most-recently-used first, pinged
+    with SELECT 1 when they have been idle for a while, and closed once they
+    exceed max_lifetime.
+    """
+
+    def __init__(self, connect, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout=POOL_TIMEOUT, max_lifetime=POOL_MAX_LIFETIME,
+                 health_check_idle=POOL_HEALTH_CHECK_IDLE):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1")
+        self._connect = connect
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_idle = health_check_idle
+        self.pid = os.getpid()
+
+        self._cond = threading.Condition()
+        self._idle = []       # [(conn, last_used)] - most recently used at the end
+        self._born = {}       # id(conn) -> creation time
+        self._in_use = set()  # id(conn) of borrowed connections
+        self._opening = 0     # connections currently being opened
+        self._closed = False
+        self._stats = {
+            'connections_created': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'checkins': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'recycled': 0,
+        }
+
+        for _ in range(self.min_size):
+            conn = self._new_connection()
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+
+    def _new_connection(self):
+        conn = self._connect()
+        with self._cond:
+            self._born[id(conn)] = time.monotonic()
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _close_connection(self, conn):
+        # Caller must hold self._cond
+        self._born.pop(id(conn), None)
+        self._stats['connections_closed'] += 1
+        forget_prepared_statements(conn)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _size(self):
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _expired(self, conn, now):
+        born = self._born.get(id(conn), now)
+        return self.max_lifetime is not None and now - born >= self.max_lifetime
+
+    def _is_healthy(self, conn):
+        """Ping a connection with SELECT 1"""
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def getconn(self):
+        """Borrow a connection, waiting up to `timeout` seconds if the pool is exhausted"""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            needs_ping = False
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        now = time.monotonic()
+                        if getattr(conn, 'closed', False) or self._expired(conn, now):
+                            self._stats['recycled'] += 1
+                            self._close_connection(conn)
+                            conn = None
+                            continue
+                        needs_ping = now - last_used >= self.health_check_idle
+                        self._in_use.add(id(conn))
+                        break
+                    if self._size() < self.max_size:
+                        # Reserve a slot, then connect without holding the lock
+                        self._opening += 1
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"No database connection available after {self.timeout}s "
+                                          f"(pool size {self.max_size})")
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+            if conn is None:
+                try:
+                    conn = self._new_connection()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if conn is None:
+                            self._cond.notify()
+                        else:
+                            self._in_use.add(id(conn))
+                            self._stats['checkouts'] += 1
+                return conn
+
+            if needs_ping:
+                healthy = self._is_healthy(conn)
+                with self._cond:
+                    self._stats['health_checks'] += 1
+                    if not healthy:
+                        self._stats['health_check_failures'] += 1
+                        self._in_use.discard(id(conn))
+                        self._close_connection(conn)
+                        self._cond.notify()
+                        continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Return a borrowed connection; pass close=True to discard it"""
+        if not close and not getattr(conn, 'closed', False):
+            try:
+                # Never hand out a connection with an open transaction
+                conn.rollback()
+            except Exception:
+                close = True
+
+        with self._cond:
+            if id(conn) not in self._in_use:
+                return
+            self._in_use.discard(id(conn))
+            self._stats['checkins'] += 1
+
+            now = time.monotonic()
+            if self._closed or close or getattr(conn, 'closed', False):
+                self._close_connection(conn)
+            elif self._expired(conn, now):
+                self._stats['recycled'] += 1
+                self._close_connection(conn)
+            else:
+                self._idle.append((conn, now))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with-block"""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._cond:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._close_connection(conn)
+            self._cond.notify_all()
+
+    def stats(self):
+        """Snapshot of pool counters for debugging"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'pid': self.pid,
+                'max_size': self.max_size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'size': self._size(),
+            })
+            return snapshot
+
+
+def resolve_sqlite_path():
+    """Locate the local SQLite database - SQLITE_DB_PATH if set, else data/database.db,
+    falling back to app/database.db"""
+    if os.environ.get('SQLITE_DB_PATH'):
+        return os.environ['SQLITE_DB_PATH']
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    db_path = os.path.join(base_dir, "data", "database.db")
+    if not os.path.exists(db_path):
+        db_path = os.path.join(base_dir, "app", "database.db")
+    return db_path
+
+
+# Resolved once at startup instead of probing the filesystem on every query
+SQLITE_DB_PATH = resolve_sqlite_path()
+
+_sqlite_local = threading.local()
+
+
+def connect_sqlite(db_path=None):
+    """Open a new SQLite connection with the local-mode PRAGMAs applied"""
+    conn = sqlite3.connect(db_path or SQLITE_DB_PATH, timeout=SQLITE_BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    for name, value in SQLITE_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
+
+
+def get_sqlite_connection(db_path=None):
+    """Get this thread's cached SQLite connection, opening it on first use"""
+    db_path = db_path or SQLITE_DB_PATH
+    connections = getattr(_sqlite_local, 'connections', None)
+    if connections is None or getattr(_sqlite_local, 'pid', None) != os.getpid():
+        connections = _sqlite_local.connections = {}
+        _sqlite_local.pid = os.getpid()
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = connections[db_path] = connect_sqlite(db_path)
+    return conn
+
+
+def release_sqlite_connection(conn):
+    """Hand a cached SQLite connection back - it stays open for the next query"""
+    if conn.in_transaction:
+        conn.rollback()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Get the PostgreSQL pool for this worker process.
+
+    gunicorn forks its workers, and a psycopg2 connection must never be shared
+    across processes, so a new pool is created whenever the pid changes.
+    """
+    global _pool
+    pid = os.getpid()
+    if _pool is None or _pool.pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool.pid != pid:
+                _pool = ConnectionPool(connect_postgresql)
+    return _pool
+
+
+def pool_stats():
+    """Stats for the current worker's pool, or None if no pool has been created"""
+    if _pool is None or _pool.pid != os.getpid():
+        return None
+    return _pool.stats()
+
 
 class DatabaseManager:
     def __init__(self):
-        self.database_url = os.environ.get('DATABASE_URL')
+        self.database_url = DATABASE_URL
         self.is_postgresql = bool(self.database_url)
-        
+
     @contextmanager
     def get_db_connection(self):
         """Get database connection with proper context management"""
         if self.is_postgresql:
-            conn = psycopg2.connect(self.database_url)
-            try:
+            with get_pool().connection() as conn:
                 yield conn
-            finally:
-                conn.close()
         else:
-            # SQLite fallback for local development
-            from pathlib import Path
-            base_dir = Path(__file__).parent.parent
-            data_dir = base_dir / "data"
-            db_path = data_dir / "database.db"
-            
-            # Fallback to app directory if data directory doesn't exist
-            if not db_path.exists():
-                app_dir = base_dir / "app"
-                db_path = app_dir / "database.db"
-            
-            conn = sqlite3.connect(str(db_path))
-            conn.row_factory = sqlite3.Row
+            # SQLite fallback for local development - cached per thread
+            conn = get_sqlite_connection()
             try:
                 yield conn
             finally:
-                conn.close()
-    
+                release_sqlite_connection(conn)
+
+    @property
+    def dialect(self):
+        return POSTGRESQL if self.is_postgresql else SQLITE
+
+    def execute_insert(self, query, params=None, id_column='id'):
+        """Run an INSERT and return the new row's ID (RETURNING on PostgreSQL, lastrowid on SQLite)"""
+        compiled = compile_insert(query, self.dialect, id_column)
+
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(compiled.sql, params or [])
+            if compiled.returning:
+                row = cursor.fetchone()
+                new_id = row[id_column] if row is not None else None
+            else:
+                new_id = cursor.lastrowid
+            conn.commit()
+            cursor.close()
+            return new_id
+
+    def bulk_insert(self, table, columns, rows, chunk_size=BULK_CHUNK_SIZE,
+                    conflict_columns=None, update_columns=None):
+        """Insert (or upsert) many rows, committing after every chunk. Returns the row count."""
+        total = 0
+        with self.get_db_connection() as conn:
+            cursor = conn.cursor()
+            try:
+                for chunk in iter_chunks(rows, chunk_size):
+                    total += write_rows(cursor, self.dialect, table, columns, chunk,
+                                        conflict_columns, update_columns)
+                    conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return total
+
     def execute_query(self, query, params=None, fetch=False):
         """Execute a query with proper parameter handling for both databases"""
         if params is None:
             params = []
-        
-        # Convert SQLite-style parameters to PostgreSQL if needed
-        if self.is_postgresql and '?' in query:
-            # Convert ? placeholders to $1, $2, etc. for PostgreSQL
-            count = query.count('?')
-            for i in range(count, 0, -1):
-                query = query.replace('?', f'${i}', 1)
-        
+
+        compiled = compile_sql(query, self.dialect)
+
         with self.get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute(query, params)
-            
+            cursor.execute(compiled.sql, params)
+
             if fetch:
                 if self.is_postgresql:
-                    # Convert PostgreSQL results to dict-like objects
-                    columns = [desc[0] for desc in cursor.description] if cursor.description else []
-                    rows = cursor.fetchall()
-                    result = [dict(zip(columns, row)) for row in rows]
+                    # Rows are already dicts (RealDictCursor)
+                    result = [dict(row) for row in cursor.fetchall()]
                 else:
                     result = cursor.fetchall()
                 cursor.close()
@@ -71,14 +860,6 @@ class DatabaseManager:
             else:
                 conn.commit()
                 cursor.close()
-    
-    def get_last_insert_id(self, cursor):
-        """Get the last inserted row ID (database-specific)"""
-        if self.is_postgresql:
-            cursor.execute("SELECT LASTVAL()")
-            return cursor.fetchone()[0]
-        else:
-            return cursor.lastrowid
 
 # Global database manager instance
 db_manager = DatabaseManager()
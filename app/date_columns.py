@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Typed date columns for Cribbage Board Collection
+boards.date and games.date_played are free text - the board form asks for
+MM/DD/YYYY, the game form and imports write YYYY-MM-DD - so ordering and
+range filters on them compare strings. boards.board_date and
+games.played_on are DATE columns the database generates from that text,
+kept next to the original so nothing typed in is lost, and indexed so date
+filters and newest-first lists are index range scans.
+
+Text in neither format (or not a real date) gives NULL.
+"""
+
+import re
+from datetime import date
+
+# The text the generated columns understand: YYYY-MM-DD (anything may follow) and M/D/YYYY
+ISO_DATE = re.compile(r'(?P<year>[0-9]{4})-(?P<month>[0-9]{2})-(?P<day>[0-9]{2})')
+US_DATE = re.compile(r'(?P<month>[0-9]{1,2})/(?P<day>[0-9]{1,2})/(?P<year>[0-9]{4})')
+
+# (table, typed column, text column it is generated from)
+COLUMNS = (('boards', 'board_date', 'date'), ('games', 'played_on', 'date_played'))
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_boards_board_date ON boards (board_date)",
+    "CREATE INDEX IF NOT EXISTS idx_games_played_on ON games (played_on, id)",
+]
+
+# PostgreSQL generated columns need an IMMUTABLE function; bad dates give NULL instead of an error
+POSTGRES_ISO_DATE = r"""
+    CREATE OR REPLACE FUNCTION iso_date(value TEXT) RETURNS DATE AS $$
+    DECLARE
+      parts TEXT[];
+    BEGIN
+      parts := regexp_match(value, '^(\d{4})-(\d{2})-(\d{2})');
+      IF parts IS NOT NULL THEN
+        RETURN make_date(parts[1]::INTEGER, parts[2]::INTEGER, parts[3]::INTEGER);
+      END IF;
+      parts := regexp_match(value, '^(\d{1,2})/(\d{1,2})/(\d{4})$');
+      IF parts IS NOT NULL THEN
+        RETURN make_date(parts[3]::INTEGER, parts[1]::INTEGER, parts[2]::INTEGER);
+      END IF;
+      RETURN NULL;
+    EXCEPTION WHEN OTHERS THEN
+      RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+
+def _part(column, start, width):
+    """SUBSTR of a one- or two-digit month or day, zero-padded to two"""
+    if width == 1:
+        return f"'0' || SUBSTR({column}, {start}, 1)"
+    return f"SUBSTR({column}, {start}, 2)"
+
+
+def sqlite_iso_date(column):
+    """SQLite expression turning a text column into YYYY-MM-DD (or NULL).
+
+    SQLite parses nothing but ISO dates, so each M/D/YYYY shape gets its own
+    GLOB and fixed SUBSTR positions. DATE() rejects impossible months and
+    days past 31, though it lets a 30 February through.
+    """
+    digits = lambda count: '[0-9]' * count
+    branches = [f"WHEN {column} GLOB '{digits(4)}-{digits(2)}-{digits(2)}*' THEN DATE(SUBSTR({column}, 1, 10))"]
+    for month in (1, 2):
+        for day in (1, 2):
+            year_at = month + day + 3
+            branches.append(f"WHEN {column} GLOB '{digits(month)}/{digits(day)}/{digits(4)}' "
+                            f"THEN DATE(SUBSTR({column}, {year_at}, 4) || '-' || {_part(column, 1, month)} "
+                            f"|| '-' || {_part(column, month + 2, day)})")
+    return "CASE " + " ".join(branches) + " END"
+
+
+def iso_date(value):
+    """YYYY-MM-DD for date text the generated columns understand, else None.
+
+    Use it on dates typed into filters before comparing them with board_date or played_on.
+    """
+    text = str(value or '')
+    match = ISO_DATE.match(text) or US_DATE.fullmatch(text)
+    if not match:
+        return None
+    year, month, day = map(int, match.group('year', 'month', 'day'))
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+
+def has_column(execute_query, table, column, postgresql=False):
+    """True when table exists and has column"""
+    if postgresql:
+        return bool(execute_query("SELECT 1 FROM information_schema.columns WHERE table_name = ? AND column_name = ?",
+                                  [table, column], fetch=True))
+    # table_xinfo, unlike table_info, lists generated columns
+    return column in {row['name'] for row in execute_query(f"PRAGMA table_xinfo({table})", fetch=True)}
+
+
+def add_columns(execute_query, postgresql=False):
+    """Add the typed date columns to existing boards and games tables, then their indexes"""
+    if postgresql:
+        execute_query(POSTGRES_ISO_DATE)
+        for table, name, source in COLUMNS:
+            execute_query(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} DATE "
+                          f"GENERATED ALWAYS AS (iso_date({source})) STORED")
+    else:
+        for table, name, source in COLUMNS:
+            if not has_column(execute_query, table, name):
+                execute_query(f"ALTER TABLE {table} ADD COLUMN {name} DATE "
+                              f"GENERATED ALWAYS AS ({sqlite_iso_date(source)}) VIRTUAL")
+    for statement in INDEXES:
+        execute_query(statement)
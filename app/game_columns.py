@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Columnar in-memory games for Cribbage Board Collection
+An optional per-worker copy of games held as packed columns - winner,
+loser, board, scores, skunk flags and the day played as a date ordinal -
+instead of a list of row dicts. It is loaded once, patched in place on
+every game_events change, and reloaded when games_version shows another
+worker has written since.
+
+Leaderboard totals, rivalries and streaks are computed over whole columns.
+With NumPy installed that is bincount, boolean masks and a lexsort over
+zero-copy views of the columns; without it the same answers come from
+plain loops over the array module's columns.
+
+Turned on with COLUMNAR_STATS=1; otherwise the stats page keeps using the
+tables kept from games.
+"""
+
+import os
+import threading
+from array import array
+from datetime import date
+
+try:
+    import numpy
+except ImportError:  # optional - the loops below give the same answers, only slower
+    numpy = None
+
+try:
+    from stats_engine import leaderboard_entries
+    import date_columns
+    import game_events
+except ImportError:
+    from app.stats_engine import leaderboard_entries
+    from app import date_columns
+    from app import game_events
+
+COLUMNAR_STATS = os.environ.get('COLUMNAR_STATS', '').lower() in ('1', 'true', 'yes')
+
+# Column name -> array typecode. IDs, scores and days fit a C int; flags a byte.
+# 0 stands for a missing player, board or date, -1 for a missing score.
+COLUMNS = (
+    ('id', 'i'),
+    ('winner_id', 'i'),
+    ('loser_id', 'i'),
+    ('board_id', 'i'),
+    ('winner_score', 'i'),
+    ('loser_score', 'i'),
+    ('day', 'i'),
+    ('skunk', 'b'),          # skunk_class > 0 - a double skunk is also a skunk
+    ('double_skunk', 'b'),
+    ('live', 'b'),           # 0 once the game has been deleted
+)
+
+GAME_COLUMNS_QUERY = """
+    SELECT id, winner_id, loser_id, board_id, winner_score, loser_score,
+           is_skunk, is_double_skunk, date_played
+    FROM games
+    ORDER BY id
+"""
+
+# One row counting every game write, so a worker can tell its copy is behind
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS games_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL DEFAULT 0)",
+    "INSERT INTO games_version (id, version) SELECT 1, 0 WHERE NOT EXISTS (SELECT 1 FROM games_version WHERE id = 1)",
+]
+
+
+def _day(value):
+    """Date ordinal of a date_played value - the day played_on holds - or 0 without one"""
+    played_on = date_columns.iso_date(value)
+    return date.fromisoformat(played_on).toordinal() if played_on else 0
+
+
+def _score(value):
+    return -1 if value is None or value == '' else int(value)
+
+
+def _values(game):
+    """A game dict as a tuple in COLUMNS order"""
+    skunk_class = game_events.skunk_class(game)
+    return (int(game['id']),
+            game_events.as_id(game.get('winner_id')) or 0,
+            game_events.as_id(game.get('loser_id')) or 0,
+            game_events.as_id(game.get('board_id')) or 0,
+            _score(game.get('winner_score')),
+            _score(game.get('loser_score')),
+            _day(game.get('date_played')),
+            int(skunk_class > 0),
+            int(skunk_class == 2),
+            1)
+
+
+def _record(wins=0, losses=0, skunks_given=0, skunks_received=0, double_skunks_given=0, double_skunks_received=0):
+    """A head_to_head.PairRecord.as_dict() shaped record"""
+    return {'wins': wins, 'losses': losses,
+            'skunks_given': skunks_given, 'skunks_received': skunks_received,
+            'double_skunks_given': double_skunks_given, 'double_skunks_received': double_skunks_received,
+            'total_games': wins + losses}
+
+
+def _streak(current_length, current_won, longest_win, longest_loss):
+    """A stats_engine.player_streaks() entry"""
+    return {'current_streak': f"{current_length}{'W' if current_won else 'L'}",
+            'longest_win_streak': longest_win,
+            'longest_loss_streak': longest_loss}
+
+
+class GameColumns:
+    """Every game as packed columns, for one worker process"""
+
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.RLock()
+        self._columns = None   # name -> array, None until loaded
+        self._rows = {}        # game ID -> row index
+        self._deleted = 0      # rows left behind by deleted games
+        self._version = None   # games_version when loaded
+        self._local_writes = 0  # writes patched in since
+        self._results = {}     # computed totals and streaks, until the next change
+
+    # ---- games_version --------------------------------------------------
+
+    def create_tables(self, execute_query):
+        for statement in SCHEMA:
+            execute_query(statement)
+
+    def bump_version(self, execute_query):
+        """Count a game write and return its version.
+
+        Call it in the write's transaction, whether or not the store is
+        enabled - the row stays locked until then, so the version is this write's.
+        """
+        execute_query("UPDATE games_version SET version = version + 1 WHERE id = 1")
+        return self.games_version(execute_query)
+
+    def games_version(self, execute_query):
+        return game_events.games_version(execute_query)
+
+    # ---- loading -------------------------------------------------------
+
+    def enable(self):
+        """Keep the columns patched from game_events"""
+        self.enabled = True
+        game_events.subscribe(self)
+        return self
+
+    def load(self, execute_query, version=None):
+        """Read every game into fresh columns"""
+        if version is None:
+            version = self.games_version(execute_query)
+        columns = {name: array(typecode) for name, typecode in COLUMNS}
+        appends = [columns[name].append for name, _ in COLUMNS]
+        rows = {}
+        for row in execute_query(GAME_COLUMNS_QUERY, fetch=True):
+            rows[row['id']] = len(rows)
+            for append, value in zip(appends, _values(dict(row))):
+                append(value)
+        with self._lock:
+            self._columns, self._rows, self._deleted = columns, rows, 0
+            self._version, self._local_writes = version, 0
+            self._results = {}
+        return self
+
+    def ensure_current(self, execute_query):
+        """Reload if never loaded, or if games_version counts writes this worker hasn't patched in"""
+        version = self.games_version(execute_query)
+        with self._lock:
+            current = self._columns is not None and version == self._version + self._local_writes
+        if not current:
+            self.load(execute_query, version)
+        return self
+
+    # ---- game_events listener -----------------------------------------
+
+    def game_changed(self, old_game, new_game, version=None):
+        # Writes by game ID, so patching a game a reload already picked up is harmless
+        with self._lock:
+            if self._columns is None:
+                return  # the first load will include the change
+            if version is not None and version <= self._version:
+                return  # ... and so did this one, so it isn't a write still to count
+            if new_game is not None:
+                self._put(_values(new_game))
+            elif old_game is not None:
+                index = self._rows.pop(int(old_game['id']), None)
+                if index is not None:
+                    self._columns['live'][index] = 0
+                    self._deleted += 1
+            self._local_writes += 1
+            self._results = {}
+
+    def reset(self):
+        with self._lock:
+            self._columns = None
+            self._rows = {}
+            self._version = None
+            self._results = {}
+
+    def _put(self, values):
+        index = self._rows.get(values[0])
+        if index is None:
+            self._rows[values[0]] = len(self._columns['id'])
+            for (name, _), value in zip(COLUMNS, values):
+                self._columns[name].append(value)
+        else:
+            for (name, _), value in zip(COLUMNS, values):
+                self._columns[name][index] = value
+
+    def _live(self, names):
+        """The live games' columns - NumPy arrays when available, else sequences. Call with the lock held."""
+        if numpy is None:
+            if not self._deleted:
+                return {name: self._columns[name] for name in names}
+            live = self._columns['live']
+            return {name: [value for value, keep in zip(self._columns[name], live) if keep] for name in names}
+        # Zero-copy views while nothing has been deleted; only what is computed from them leaves the lock
+        typecodes = dict(COLUMNS)
+        views = {name: numpy.frombuffer(self._columns[name], dtype=numpy.dtype(typecodes[name]))
+                 for name in names}
+        if not self._deleted:
+            return views
+        keep = numpy.frombuffer(self._columns['live'], dtype=numpy.int8) == 1
+        return {name: view[keep] for name, view in views.items()}
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if self._columns is None:
+                raise RuntimeError("Game columns are not loaded - call ensure_current() first")
+            if key not in self._results:
+                self._results[key] = compute()
+            return self._results[key]
+
+    # ---- leaderboard -----------------------------------------------------
+
+    def player_totals(self):
+        """{player_id: wins, losses, total_games and skunks given and received}, for players with games"""
+        return self._cached('player_totals', self._player_totals)
+
+    def _player_totals(self):
+        c = self._live(('winner_id', 'loser_id', 'skunk', 'double_skunk'))
+        if numpy is not None:
+            size = int(max(c['winner_id'].max(initial=0), c['loser_id'].max(initial=0))) + 1
+            counts = {
+                'wins': numpy.bincount(c['winner_id'], minlength=size),
+                'losses': numpy.bincount(c['loser_id'], minlength=size),
+                'skunks_given': numpy.bincount(c['winner_id'], weights=c['skunk'], minlength=size),
+                'skunks_received': numpy.bincount(c['loser_id'], weights=c['skunk'], minlength=size),
+                'double_skunks_given': numpy.bincount(c['winner_id'], weights=c['double_skunk'], minlength=size),
+                'double_skunks_received': numpy.bincount(c['loser_id'], weights=c['double_skunk'], minlength=size),
+            }
+            counts = {key: values.astype(numpy.int64).tolist() for key, values in counts.items()}
+            return {player_id: _record(**{key: values[player_id] for key, values in counts.items()})
+                    for player_id in numpy.flatnonzero(numpy.add(counts['wins'], counts['losses'])).tolist()
+                    if player_id}
+
+        totals = {}
+        for winner_id, loser_id, skunk, double_skunk in zip(c['winner_id'], c['loser_id'], c['skunk'], c['double_skunk']):
+            if winner_id:
+                record = totals.setdefault(winner_id, _record())
+                record['wins'] += 1
+                record['skunks_given'] += skunk
+                record['double_skunks_given'] += double_skunk
+            if loser_id:
+                record = totals.setdefault(loser_id, _record())
+                record['losses'] += 1
+                record['skunks_received'] += skunk
+                record['double_skunks_received'] += double_skunk
+        for record in totals.values():
+            record['total_games'] = record['wins'] + record['losses']
+        return totals
+
+    def leaderboard(self, players):
+        """stats_engine.build_leaderboard() entries for the given player rows (id, names, photo)"""
+        totals = self.player_totals()
+        return leaderboard_entries(
+            dict({key: player[key] for key in ('id', 'first_name', 'last_name', 'photo')}, **totals[player['id']])
+            for player in players if player['id'] in totals)
+
+    # ---- head-to-head ----------------------------------------------------
+
+    def rivalry_grid(self, player_ids):
+        """head_to_head.rivalry_grid() for player_ids, counted from the columns"""
+        player_ids = tuple(dict.fromkeys(player_ids))
+        grid = {player_id: {} for player_id in player_ids}
+        for winner_id, loser_id, games, skunks, doubles in self._cached(('pairs', player_ids),
+                                                                       lambda: self._pair_totals(player_ids)):
+            won = grid[winner_id].setdefault(loser_id, _record())
+            won.update(wins=games, skunks_given=skunks, double_skunks_given=doubles)
+            won['total_games'] = won['wins'] + won['losses']
+            lost = grid[loser_id].setdefault(winner_id, _record())
+            lost.update(losses=games, skunks_received=skunks, double_skunks_received=doubles)
+            lost['total_games'] = lost['wins'] + lost['losses']
+        return grid
+
+    def _pair_totals(self, player_ids):
+        """(winner_id, loser_id, games, skunks, double_skunks) for each pair within player_ids"""
+        c = self._live(('winner_id', 'loser_id', 'skunk', 'double_skunk'))
+        if numpy is not None:
+            ids = numpy.array(player_ids, dtype=numpy.int64)
+            keep = (numpy.isin(c['winner_id'], ids) & numpy.isin(c['loser_id'], ids)
+                    & (c['winner_id'] != c['loser_id']))
+            size = int(ids.max(initial=0)) + 1
+            keys, index = numpy.unique(c['winner_id'][keep].astype(numpy.int64) * size + c['loser_id'][keep],
+                                       return_inverse=True)
+            games = numpy.bincount(index, minlength=len(keys))
+            skunks = numpy.bincount(index, weights=c['skunk'][keep], minlength=len(keys)).astype(numpy.int64)
+            doubles = numpy.bincount(index, weights=c['double_skunk'][keep], minlength=len(keys)).astype(numpy.int64)
+            return list(zip((keys // size).tolist(), (keys % size).tolist(),
+                            games.tolist(), skunks.tolist(), doubles.tolist()))
+
+        wanted = set(player_ids)
+        counts = {}
+        for winner_id, loser_id, skunk, double_skunk in zip(c['winner_id'], c['loser_id'], c['skunk'], c['double_skunk']):
+            if winner_id in wanted and loser_id in wanted and winner_id != loser_id:
+                pair = counts.setdefault((winner_id, loser_id), [0, 0, 0])
+                pair[0] += 1
+                pair[1] += skunk
+                pair[2] += double_skunk
+        return [(winner_id, loser_id, *pair) for (winner_id, loser_id), pair in counts.items()]
+
+    # ---- streaks ---------------------------------------------------------
+
+    def streaks(self, player_ids=None):
+        """stats_engine.player_streaks(): games in date order, then by ID; undated games first"""
+        streaks = self._cached('streaks', self._streaks)
+        if player_ids is None:
+            return dict(streaks)
+        return {player_id: streaks[player_id] for player_id in player_ids if player_id in streaks}
+
+    def _streaks(self):
+        c = self._live(('id', 'day', 'winner_id', 'loser_id'))
+        if numpy is not None:
+            return self._streaks_vectorized(c)
+
+        results = {}
+        for game_id, day, winner_id, loser_id in zip(c['id'], c['day'], c['winner_id'], c['loser_id']):
+            for player_id, won in ((winner_id, 1), (loser_id, 0)):
+                if player_id:
+                    results.setdefault(player_id, []).append((day, game_id, won))
+        streaks = {}
+        for player_id, games in results.items():
+            games.sort()
+            longest, length, previous = {0: 0, 1: 0}, 0, None
+            for _, _, won in games:
+                length = length + 1 if won == previous else 1
+                previous = won
+                longest[won] = max(longest[won], length)
+            streaks[player_id] = _streak(length, previous, longest[1], longest[0])
+        return streaks
+
+    @staticmethod
+    def _streaks_vectorized(c):
+        # Games in play order (day and ID packed into one sort key), then each player's
+        # games in that order (player and position packed the same way)
+        games = len(c['id'])
+        order = numpy.argsort((c['day'].astype(numpy.int64) << 32) | c['id'])
+        player = numpy.concatenate([c['winner_id'][order], c['loser_id'][order]]).astype(numpy.int64)
+        won = numpy.concatenate([numpy.ones(games, numpy.int8), numpy.zeros(games, numpy.int8)])
+        sequence = numpy.concatenate([numpy.arange(games), numpy.arange(games)])
+        keep = player > 0
+        player, won, sequence = player[keep], won[keep], sequence[keep]
+        if not len(player):
+            return {}
+        by_player = numpy.argsort((player << 32) | sequence)
+        player, won = player[by_player], won[by_player]
+
+        # A run starts wherever the player or the result changes
+        starts = numpy.flatnonzero(numpy.concatenate([[True], (player[1:] != player[:-1]) | (won[1:] != won[:-1])]))
+        lengths = numpy.diff(numpy.append(starts, len(player)))
+        run_player, run_won = player[starts], won[starts]
+
+        size = int(run_player.max()) + 1
+        longest_win = numpy.zeros(size, numpy.int64)
+        longest_loss = numpy.zeros(size, numpy.int64)
+        numpy.maximum.at(longest_win, run_player[run_won == 1], lengths[run_won == 1])
+        numpy.maximum.at(longest_loss, run_player[run_won == 0], lengths[run_won == 0])
+
+        # Each player's last run is their current streak
+        last = numpy.flatnonzero(numpy.append(run_player[1:] != run_player[:-1], True))
+        return {player_id: _streak(length, current_won, win, loss)
+                for player_id, length, current_won, win, loss in zip(
+                    run_player[last].tolist(), lengths[last].tolist(), run_won[last].tolist(),
+                    longest_win[run_player[last]].tolist(), longest_loss[run_player[last]].tolist())}
+
+
+# Shared by the whole worker process; enabled with COLUMNAR_STATS
+game_columns = GameColumns()
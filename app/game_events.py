@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Game change notifications for Cribbage Board Collection
+Lets statistics kept in memory be patched when a game is added, edited or
+deleted, instead of being recomputed from the whole games table
+"""
+
+_listeners = []
+
+# games_version (see game_columns.SCHEMA) counts every committed game write
+GAMES_VERSION_QUERY = "SELECT version FROM games_version WHERE id = 1"
+
+
+def as_id(value):
+    """Player or board ID from a game dict as an int - form values arrive as strings"""
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def as_flag(value):
+    """1 or 0 for an is_skunk / is_double_skunk value from a form, a row or an import"""
+    if isinstance(value, str):
+        return 1 if value.strip().lower() in ('1', 'true', 't', 'yes', 'on') else 0
+    return 1 if value else 0
+
+
+def skunk_class(game):
+    """0, 1 for a skunk or 2 for a double skunk - games.skunk_class for a game dict"""
+    if as_flag(game.get('is_double_skunk')):
+        return 2
+    return 1 if as_flag(game.get('is_skunk')) else 0
+
+
+def games_version(execute_query):
+    """How many game writes games_version has counted"""
+    rows = execute_query(GAMES_VERSION_QUERY, fetch=True)
+    return rows[0]['version'] if rows else 0
+
+
+def with_games_version(query):
+    """query with a games_version column added, read by the same statement.
+
+    One statement sees one snapshot, so the version says exactly which
+    writes the rows include. A query with no rows gives one row that is
+    NULL apart from games_version.
+    """
+    return (f"SELECT v.version as games_version, q.* FROM games_version v "
+            f"LEFT JOIN ({query}) q ON 1 = 1 WHERE v.id = 1")
+
+
+def subscribe(listener):
+    """Register an object with game_changed(old, new, version) and reset() methods.
+
+    game_changed gets the game before and after the change as dicts - old is
+    None for a new game, new is None for a deleted one - and the
+    games_version the write committed as (None if unknown). reset() means
+    too much changed to patch (a bulk import) and the listener should
+    reload. Both are called after the change has been committed.
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+    return listener
+
+
+def unsubscribe(listener):
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def game_changed(old_game, new_game, version=None):
+    """Tell every listener about one committed add, edit or delete"""
+    old_game = dict(old_game) if old_game is not None else None
+    new_game = dict(new_game) if new_game is not None else None
+    for listener in list(_listeners):
+        try:
+            listener.game_changed(old_game, new_game, version)
+        except Exception as e:
+            # A listener that can't patch itself has to start again
+            print(f"⚠️  {type(listener).__name__} could not apply game change: {e}")
+            listener.reset()
+
+
+def games_reset():
+    """Tell every listener that games changed in bulk"""
+    for listener in list(_listeners):
+        listener.reset()
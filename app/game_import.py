@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Streaming import of game history for Cribbage Board Collection
+Reads CSV or NDJSON one row at a time and writes games in batches
+"""
+
+import csv
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+try:
+    import game_events
+except ImportError:
+    from app import game_events
+
+# Column order of the rows handed to bulk_insert()
+GAME_COLUMNS = ('board_id', 'winner_id', 'loser_id', 'date_played',
+                'winner_score', 'loser_score', 'is_skunk', 'is_double_skunk')
+
+WINNING_SCORE = 121
+SKUNK_LINE = 91          # a loser below 91 points is skunked
+DOUBLE_SKUNK_LINE = 61   # ... and below 61 double skunked
+
+FORMATS = ('csv', 'ndjson')
+DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%d.%m.%Y')
+MAX_REPORTED_ERRORS = 100  # keep memory flat on a file full of bad rows
+MAX_IMPORT_JOBS = 20       # finished background imports whose progress is still kept
+
+# Accepted spellings for each field (CSV headers / JSON keys, case-insensitive)
+FIELD_ALIASES = {
+    'date_played': ('date_played', 'date', 'played'),
+    'winner': ('winner', 'winner_id', 'winner_name'),
+    'loser': ('loser', 'loser_id', 'loser_name'),
+    'board': ('board', 'board_id', 'roman_number'),
+    'winner_score': ('winner_score',),
+    'loser_score': ('loser_score',),
+    'is_skunk': ('is_skunk', 'skunk'),
+    'is_double_skunk': ('is_double_skunk', 'double_skunk'),
+}
+
+_TRUE = {'1', 'true', 't', 'yes', 'y', 'x'}
+_FALSE = {'', '0', 'false', 'f', 'no', 'n'}
+
+
+class ImportResult:
+    """Progress and outcome of one import"""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []     # (line number, message), capped at MAX_REPORTED_ERRORS
+        self.finished = False
+        self.failure = None  # set if the import stopped on a database error
+
+    def add_error(self, line_no, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line_no, str(message)))
+
+    def as_dict(self):
+        return {
+            'rows_read': self.rows_read,
+            'imported': self.imported,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'finished': self.finished,
+            'failure': self.failure,
+        }
+
+
+def detect_format(filename):
+    """Pick csv or ndjson from a file name"""
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext in ('.csv', '.txt'):
+        return 'csv'
+    if ext in ('.ndjson', '.jsonl', '.json'):
+        return 'ndjson'
+    raise ValueError("Unsupported file type - use .csv or .ndjson")
+
+
+def iter_records(stream, fmt):
+    """Yield (line number, record) from a text stream without reading it all.
+
+    CSV records are dicts keyed by the header row. NDJSON records are the raw
+    line - parse_game() decodes them, so one bad line is just a skipped row.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, 1):
+            if line.strip():
+                yield line_no, line
+    else:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+
+class GameLookups:
+    """Player and board name -> ID maps, loaded once per import"""
+
+    def __init__(self, players, boards):
+        self.players = {}
+        self.boards = {}
+        for player in players:
+            self._add(self.players, str(player['id']), player['id'])
+            full_name = f"{player['first_name'] or ''} {player['last_name'] or ''}"
+            self._add(self.players, _name_key(full_name), player['id'])
+        for board in boards:
+            self._add(self.boards, str(board['id']), board['id'])
+            if board['roman_number']:
+                self._add(self.boards, _name_key(board['roman_number']), board['id'])
+
+    @classmethod
+    def from_database(cls, execute_query):
+        players = execute_query("SELECT id, first_name, last_name FROM players", fetch=True)
+        boards = execute_query("SELECT id, roman_number FROM boards", fetch=True)
+        return cls(players, boards)
+
+    @staticmethod
+    def _add(mapping, key, value):
+        # Two players with the same name can't be told apart by name
+        if key in mapping and mapping[key] != value:
+            mapping[key] = None
+        else:
+            mapping[key] = value
+
+    def player_id(self, value, role):
+        return self._find(self.players, value, role)
+
+    def board_id(self, value):
+        if value is None or str(value).strip() == '':
+            return None  # the board is optional, as in the add game form
+        return self._find(self.boards, value, 'board')
+
+    @staticmethod
+    def _find(mapping, value, what):
+        if value is None or str(value).strip() == '':
+            raise ValueError(f"Missing {what}")
+        key = str(value).strip()
+        key = key if key.isdigit() else _name_key(key)
+        if key not in mapping:
+            raise ValueError(f"Unknown {what}: {value}")
+        if mapping[key] is None:
+            raise ValueError(f"Ambiguous {what} name: {value} - use the ID instead")
+        return mapping[key]
+
+
+def _name_key(name):
+    return ' '.join(str(name).split()).lower()
+
+
+def _field(record, name):
+    for alias in FIELD_ALIASES[name]:
+        if alias in record:
+            value = record[alias]
+            return value.strip() if isinstance(value, str) else value
+    return None
+
+
+def _parse_date(value):
+    if not value:
+        raise ValueError("Missing date_played")
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(str(value), fmt).strftime('%Y-%m-%d')
+        except ValueError:
+            continue
+    raise ValueError(f"Invalid date: {value}")
+
+
+def _parse_score(value, name, default):
+    if value is None or value == '':
+        return default
+    try:
+        score = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {name}: {value}")
+    if not 0 <= score <= WINNING_SCORE:
+        raise ValueError(f"{name} must be between 0 and {WINNING_SCORE}")
+    return score
+
+
+def _parse_flag(value, name):
+    if value is None or isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f"Invalid {name}: {value}")
+
+
+def parse_game(record, lookups):
+    """Validate one record and return it as a tuple in GAME_COLUMNS order.
+
+    Raises ValueError describing the first problem found.
+    """
+    if isinstance(record, str):
+        try:
+            record = json.loads(record)
+        except ValueError:
+            raise ValueError("Invalid JSON")
+        if not isinstance(record, dict):
+            raise ValueError("Each line must be a JSON object")
+    record = {str(k).strip().lower(): v for k, v in record.items() if k is not None}
+
+    date_played = _parse_date(_field(record, 'date_played'))
+    winner_id = lookups.player_id(_field(record, 'winner'), 'winner')
+    loser_id = lookups.player_id(_field(record, 'loser'), 'loser')
+    if winner_id == loser_id:
+        raise ValueError("Winner and loser cannot be the same player")
+    board_id = lookups.board_id(_field(record, 'board'))
+
+    # A game without scores keeps them NULL rather than passing for a 121-0 game;
+    # with only the loser's score, the winner pegged out at 121
+    loser_score = _parse_score(_field(record, 'loser_score'), 'loser_score', None)
+    winner_score = _parse_score(_field(record, 'winner_score'), 'winner_score',
+                                None if loser_score is None else WINNING_SCORE)
+    if None not in (winner_score, loser_score) and loser_score >= winner_score:
+        raise ValueError("Loser score must be below the winner score")
+
+    is_skunk = _parse_flag(_field(record, 'is_skunk'), 'is_skunk')
+    is_double_skunk = _parse_flag(_field(record, 'is_double_skunk'), 'is_double_skunk')
+
+    if loser_score is not None:
+        # The score decides when the file leaves a flag out, and must agree when it doesn't.
+        # A double skunk may be flagged as a skunk too or not (app.py stores it without).
+        if is_double_skunk is None:
+            is_double_skunk = loser_score < DOUBLE_SKUNK_LINE
+        if is_skunk is None:
+            is_skunk = loser_score < SKUNK_LINE
+        flagged = 2 if is_double_skunk else 1 if is_skunk else 0
+        expected = 2 if loser_score < DOUBLE_SKUNK_LINE else 1 if loser_score < SKUNK_LINE else 0
+        if flagged != expected:
+            raise ValueError(f"Skunk flags do not match a loser score of {loser_score}")
+
+    return (board_id, winner_id, loser_id, date_played, winner_score, loser_score,
+            int(bool(is_skunk)), int(bool(is_double_skunk)))
+
+
+def import_games(records, lookups, bulk_insert, chunk_size=None, result=None):
+    """Validate records and write the good ones through bulk_insert().
+
+    Bad rows are counted and reported, not fatal. Rows are consumed lazily,
+    so memory stays flat however long the file is.
+    """
+    result = result or ImportResult()
+
+    def valid_rows():
+        for line_no, record in records:
+            result.rows_read += 1
+            try:
+                row = parse_game(record, lookups)
+            except ValueError as e:
+                result.add_error(line_no, e)
+                continue
+            yield row
+
+    kwargs = {'chunk_size': chunk_size} if chunk_size else {}
+    try:
+        result.imported = bulk_insert('games', GAME_COLUMNS, valid_rows(), **kwargs)
+    except Exception as e:
+        result.failure = str(e)
+        raise
+    finally:
+        result.finished = True
+    return result
+
+
+def import_games_file(path, execute_query, bulk_insert, fmt=None, chunk_size=None, result=None):
+    """Import a CSV or NDJSON file from disk"""
+    fmt = fmt or detect_format(path)
+    lookups = GameLookups.from_database(execute_query)
+    # utf-8-sig drops the byte order mark spreadsheet exports like to add
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        return import_games(iter_records(stream, fmt), lookups, bulk_insert, chunk_size, result)
+
+
+class ImportJobs:
+    """Background game imports of one worker process, keyed by job ID.
+
+    A large file imports in a thread so it can't hit the worker timeout.
+    Only the last `max_jobs` are remembered - once there are more, the
+    oldest finished ones are forgotten (running ones are always kept).
+    """
+
+    def __init__(self, max_jobs=MAX_IMPORT_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # job ID -> ImportResult, oldest first
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+    def get(self, job_id):
+        """ImportResult of a job, or None if it is unknown or was forgotten"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def add(self, result):
+        """Remember a result under a new job ID and return the ID"""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._jobs[job_id] = result
+            finished = [old_id for old_id, old in self._jobs.items() if old.finished]
+            for old_id in finished[:max(len(self._jobs) - self.max_jobs, 0)]:
+                del self._jobs[old_id]
+        return job_id
+
+    def start(self, path, fmt, execute_query, bulk_insert, rebuild):
+        """Import a spooled upload in a background thread and return its job ID.
+
+        When the import ends, successful or not, rebuild() recomputes the
+        tables kept from games, in-memory statistics reload and the file is
+        removed.
+        """
+        result = ImportResult()
+        job_id = self.add(result)
+        threading.Thread(target=run_import, args=(path, fmt, result, execute_query, bulk_insert, rebuild),
+                         daemon=True).start()
+        return job_id
+
+
+def run_import(path, fmt, result, execute_query, bulk_insert, rebuild):
+    """Body of a background import - see ImportJobs.start()"""
+    try:
+        import_games_file(path, execute_query, bulk_insert, fmt=fmt, result=result)
+        print(f"✅ Game import finished: {result.imported} imported, {result.skipped} skipped")
+    except Exception as e:
+        result.failure = result.failure or str(e)
+        print(f"❌ Game import failed: {e}")
+    finally:
+        result.finished = True
+        # Too many games to patch in - derived tables are rebuilt and in-memory statistics reload
+        try:
+            rebuild()
+        except Exception as e:
+            print(f"❌ Rebuilding tables kept from games failed: {e}")
+        game_events.games_reset()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+# This worker's background imports
+import_jobs = ImportJobs()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Game participants for Cribbage Board Collection
+One row per player per game - the winner's and the loser's - so a player's
+games are found with an index range scan on (player_id, played_on, game_id)
+instead of `winner_id = ? OR loser_id = ?`, which no single index can serve.
+
+Rows are rewritten from the games row whenever a game is added, edited or
+deleted (sync_game); rebuild() and check() cover the whole table.
+"""
+
+try:
+    import date_columns
+except ImportError:
+    from app import date_columns
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS game_participants (
+      game_id INTEGER NOT NULL,
+      player_id INTEGER NOT NULL,
+      role VARCHAR(10) NOT NULL,
+      score INTEGER,
+      opponent_id INTEGER,
+      played_on DATE,
+      PRIMARY KEY (game_id, role)
+    )
+    """,
+    # played_on is copied from games so a player's history is one range scan, already in order
+    "CREATE INDEX IF NOT EXISTS idx_game_participants_player_played_on "
+    "ON game_participants (player_id, played_on, game_id)",
+]
+
+COLUMNS = ('game_id', 'player_id', 'role', 'score', 'opponent_id', 'played_on')
+
+# Both participants of every game matching {where}
+PARTICIPANTS_FROM_GAMES = """
+    SELECT id as game_id, winner_id as player_id, 'winner' as role, winner_score as score,
+           loser_id as opponent_id, played_on
+    FROM games WHERE winner_id IS NOT NULL {where}
+    UNION ALL
+    SELECT id as game_id, loser_id as player_id, 'loser' as role, loser_score as score,
+           winner_id as opponent_id, played_on
+    FROM games WHERE loser_id IS NOT NULL {where}
+"""
+
+_INSERT = f"INSERT INTO game_participants ({', '.join(COLUMNS)}) "
+
+
+def upgrade_tables(execute_query, postgresql=False):
+    """Drop a game_participants from before played_on; create_tables makes it
+    again and needs_rebuild then refills it"""
+    if not date_columns.has_column(execute_query, 'game_participants', 'played_on', postgresql=postgresql):
+        execute_query("DROP TABLE IF EXISTS game_participants")
+
+
+def create_tables(execute_query):
+    for statement in SCHEMA:
+        execute_query(statement)
+
+
+def sync_game(execute_query, game_id):
+    """Rewrite one game's participant rows from games (none if it was deleted).
+
+    Call it in the same transaction as the write to games.
+    """
+    execute_query("DELETE FROM game_participants WHERE game_id = ?", [game_id])
+    execute_query(_INSERT + PARTICIPANTS_FROM_GAMES.format(where="AND id = ?"), [game_id, game_id])
+
+
+def rebuild(execute_query):
+    """Rewrite the whole table from games. Run it inside a transaction."""
+    execute_query("DELETE FROM game_participants")
+    execute_query(_INSERT + PARTICIPANTS_FROM_GAMES.format(where=""))
+
+
+def needs_rebuild(execute_query):
+    """True when there are games but no participant rows yet"""
+    if execute_query("SELECT COUNT(*) as count FROM game_participants", fetch=True)[0]['count']:
+        return False
+    return execute_query("SELECT COUNT(*) as count FROM games", fetch=True)[0]['count'] > 0
+
+
+def check(execute_query):
+    """Participant rows that disagree with games, as readable lines (empty = consistent)"""
+    def by_key(rows):
+        return {(row['game_id'], row['role']): tuple(row[c] for c in COLUMNS) for row in rows}
+
+    expected = by_key(execute_query(PARTICIPANTS_FROM_GAMES.format(where=""), fetch=True))
+    actual = by_key(execute_query("SELECT * FROM game_participants", fetch=True))
+    return [f"game_participants game {game_id} {role}: expected {expected.get((game_id, role))}, "
+            f"found {actual.get((game_id, role))}"
+            for game_id, role in sorted(set(expected) | set(actual))
+            if expected.get((game_id, role)) != actual.get((game_id, role))]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tables kept from games for Cribbage Board Collection
+One place that creates, patches and rebuilds everything derived from the
+games table - the player summaries, game_participants, ratings, rollups,
+board stats, the stats cube and the games version counter - so app.py and
+app_hybrid.py keep them the same way. Each app passes in its own
+execute_query, bulk_insert and transaction.
+"""
+
+try:
+    import board_stats
+    import date_columns
+    import game_participants
+    import ratings
+    import rollups
+    import skunk_columns
+    import stats_cube
+    import summary_tables
+    from game_columns import game_columns
+except ImportError:
+    from app import board_stats
+    from app import date_columns
+    from app import game_participants
+    from app import ratings
+    from app import rollups
+    from app import skunk_columns
+    from app import stats_cube
+    from app import summary_tables
+    from app.game_columns import game_columns
+
+# (module, label) for every table kept from games, in rebuild order
+MODULES = (
+    (summary_tables, "Player summary tables"),
+    (game_participants, "Game participants"),
+    (ratings, "Player ratings"),
+    (rollups, "Daily and monthly rollups"),
+    (board_stats, "Board play stats"),
+    (stats_cube, "Stats cube"),
+)
+
+
+def _rebuild_module(module, execute_query, bulk_insert):
+    if module is ratings:
+        ratings.rebuild(execute_query, bulk_insert)
+    else:
+        module.rebuild(execute_query)
+
+
+def init(execute_query, bulk_insert, transaction, postgresql=False):
+    """Add the generated game columns and create the tables kept from games,
+    filling any that are new, all in one transaction.
+
+    Returns the labels of the tables that were built. Raises on any failure,
+    which rolls everything back rather than leaving tables half built.
+    """
+    built = []
+    with transaction():
+        skunk_columns.add_columns(execute_query, postgresql=postgresql)
+        date_columns.add_columns(execute_query, postgresql=postgresql)
+        # Tables from before played_on ordered them are dropped, then built again below
+        game_participants.upgrade_tables(execute_query, postgresql=postgresql)
+        ratings.upgrade_tables(execute_query, postgresql=postgresql)
+        for module, label in MODULES:
+            module.create_tables(execute_query)
+            if module.needs_rebuild(execute_query):
+                _rebuild_module(module, execute_query, bulk_insert)
+                built.append(label)
+        # Write counter that tells a worker its in-memory game columns are behind
+        game_columns.create_tables(execute_query)
+    return built
+
+
+def sync(execute_query, bulk_insert, game_id, old_game, new_game):
+    """Bring the tables kept from games up to date after one game write.
+
+    Call it inside the write's transaction() so they commit or roll back
+    together. Returns the games version of the write, to pass on to
+    game_events.game_changed once it commits.
+    """
+    summary_tables.apply_change(execute_query, old_game, new_game)
+    game_participants.sync_game(execute_query, game_id)
+    ratings.apply_change(execute_query, bulk_insert, old_game, new_game)
+    rollups.apply_change(execute_query, old_game, new_game)
+    board_stats.apply_change(execute_query, old_game, new_game)
+    stats_cube.apply_change(execute_query, old_game, new_game)
+    return game_columns.bump_version(execute_query)  # workers holding games in memory reload
+
+
+def delete_player_games(execute_query, bulk_insert, player_id):
+    """Delete every game a player took part in, ahead of deleting the player.
+
+    schema_postgresql.sql cascades a player's delete to their games behind
+    the app's back; deleting them here first keeps the tables kept from
+    games in step on either database. Call it inside the delete's
+    transaction() and announce the returned (old, None, version) changes
+    through game_events once it commits.
+    """
+    games = execute_query("""
+        SELECT g.* FROM games g JOIN game_participants gp ON gp.game_id = g.id
+        WHERE gp.player_id = ? ORDER BY g.id
+    """, [player_id], fetch=True)
+    changes = []
+    for game in games:
+        old_game = dict(game)
+        execute_query("DELETE FROM games WHERE id = ?", [old_game['id']])
+        version = sync(execute_query, bulk_insert, old_game['id'], old_game, None)
+        changes.append((old_game, None, version))
+    return changes
+
+
+def clear_board(execute_query, bulk_insert, board_id):
+    """Take a board off its games (board_id NULL), ahead of deleting the board.
+
+    The same as schema_postgresql.sql's ON DELETE SET NULL, done where the
+    tables kept from games can follow. Call it inside the delete's
+    transaction() and announce the returned (old, new, version) changes once
+    it commits.
+    """
+    games = execute_query("SELECT * FROM games WHERE board_id = ? ORDER BY id", [board_id], fetch=True)
+    changes = []
+    for game in games:
+        old_game = dict(game)
+        new_game = dict(old_game, board_id=None)
+        execute_query("UPDATE games SET board_id = NULL WHERE id = ?", [old_game['id']])
+        version = sync(execute_query, bulk_insert, old_game['id'], old_game, new_game)
+        changes.append((old_game, new_game, version))
+    return changes
+
+
+def rebuild(execute_query, bulk_insert, transaction):
+    """Recompute every table kept from games, in one transaction"""
+    with transaction():
+        for module, _ in MODULES:
+            _rebuild_module(module, execute_query, bulk_insert)
+        game_columns.bump_version(execute_query)
+
+
+def check(execute_query):
+    """Rows of every table kept from games that disagree with games (empty = consistent)"""
+    return [problem for module, _ in MODULES for problem in module.check(execute_query)]
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Head-to-head matrix for Cribbage Board Collection
+Wins, losses and skunks for every pair of players, loaded with one grouped
+query and then patched as games are added, edited or deleted
+
+Nemesis, favorite opponent and the rivalry grid are read straight from it.
+games_version tells when another worker has written games since the load.
+"""
+
+import threading
+
+try:
+    import game_events
+except ImportError:
+    from app import game_events
+
+PAIR_TOTALS_QUERY = """
+    SELECT winner_id, loser_id, COUNT(*) as games,
+           SUM(CASE WHEN skunk_class > 0 THEN 1 ELSE 0 END) as skunks,
+           SUM(CASE WHEN skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks
+    FROM games
+    WHERE winner_id IS NOT NULL AND loser_id IS NOT NULL AND winner_id <> loser_id
+    GROUP BY winner_id, loser_id
+"""
+
+
+class PairRecord:
+    """One player's record against one opponent"""
+
+    __slots__ = ('wins', 'losses', 'skunks_given', 'skunks_received',
+                 'double_skunks_given', 'double_skunks_received')
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    @property
+    def total_games(self):
+        return self.wins + self.losses
+
+    def as_dict(self):
+        record = {name: getattr(self, name) for name in self.__slots__}
+        record['total_games'] = self.total_games
+        return record
+
+
+def _summary(opponent_id, record):
+    """Nemesis / favorite opponent dict in the shape the templates use (without the name)"""
+    return {
+        'id': opponent_id,
+        'wins_against_them': record.wins,
+        'losses_to_them': record.losses,
+        'total_games': record.total_games,
+        'win_rate_against': round((record.wins / record.total_games * 100), 1) if record.total_games > 0 else 0
+    }
+
+
+class HeadToHeadMatrix:
+    """(player, opponent) -> PairRecord, kept for both players of every pair"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._pairs = {}      # player_id -> {opponent_id: PairRecord}
+        self._best = {}       # player_id -> (nemesis, favorite), cleared when their games change
+        self._version = None  # games_version the load read, None until loaded
+        self._local_writes = 0  # writes patched in since
+        self._applied = {}    # game ID -> version of the last change patched in for it
+
+    # ---- loading -------------------------------------------------------
+
+    def load(self, execute_query, query=PAIR_TOTALS_QUERY):
+        """Build the whole matrix with one query over games (or any query with the same columns).
+
+        games_version is read by the same statement, so a change announced
+        later for a write the load already saw is recognised and skipped.
+        """
+        pairs = {}
+        version = 0
+        for row in execute_query(game_events.with_games_version(query), fetch=True):
+            version = row['games_version']
+            if row['winner_id'] is not None:
+                self._add(pairs, row['winner_id'], row['loser_id'],
+                          row['games'], row['skunks'] or 0, row['double_skunks'] or 0)
+        with self._lock:
+            self._pairs = pairs
+            self._best = {}
+            self._version, self._local_writes, self._applied = version, 0, {}
+        return self
+
+    def ensure_loaded(self, execute_query, query=PAIR_TOTALS_QUERY):
+        """Load the matrix if it never has been, or if games_version counts
+        writes it hasn't patched in - another worker's"""
+        version = game_events.games_version(execute_query)
+        with self._lock:
+            current = self._version is not None and version == self._version + self._local_writes
+        if not current:
+            self.load(execute_query, query)
+        return self
+
+    # ---- game_events listener -----------------------------------------
+
+    def game_changed(self, old_game, new_game, version=None):
+        with self._lock:
+            if self._version is None:
+                return  # the first load will include the change
+            if version is not None:
+                game_id = game_events.as_id((new_game or old_game).get('id'))
+                # Counted already - by the load, or by an earlier call for the same write
+                if version <= max(self._version, self._applied.get(game_id, 0)):
+                    return
+                self._applied[game_id] = version
+                self._local_writes += 1
+            if old_game is not None:
+                self._apply(old_game, -1)
+            if new_game is not None:
+                self._apply(new_game, 1)
+
+    def reset(self):
+        with self._lock:
+            self._pairs = {}
+            self._best = {}
+            self._version, self._local_writes, self._applied = None, 0, {}
+
+    def _apply(self, game, sign):
+        winner_id = game_events.as_id(game.get('winner_id'))
+        loser_id = game_events.as_id(game.get('loser_id'))
+        if winner_id is None or loser_id is None or winner_id == loser_id:
+            return
+        skunk_class = game_events.skunk_class(game)
+        skunk, double_skunk = int(skunk_class > 0), int(skunk_class == 2)
+        self._add(self._pairs, winner_id, loser_id, sign, sign * skunk, sign * double_skunk)
+        self._best.pop(winner_id, None)
+        self._best.pop(loser_id, None)
+
+    @staticmethod
+    def _add(pairs, winner_id, loser_id, games, skunks, double_skunks):
+        won = pairs.setdefault(winner_id, {}).setdefault(loser_id, PairRecord())
+        won.wins += games
+        won.skunks_given += skunks
+        won.double_skunks_given += double_skunks
+
+        lost = pairs.setdefault(loser_id, {}).setdefault(winner_id, PairRecord())
+        lost.losses += games
+        lost.skunks_received += skunks
+        lost.double_skunks_received += double_skunks
+
+        # Forget pairs whose only game was deleted
+        if won.total_games <= 0:
+            del pairs[winner_id][loser_id]
+            del pairs[loser_id][winner_id]
+
+    # ---- lookups -------------------------------------------------------
+
+    def record(self, player_id, opponent_id):
+        """player_id's record against opponent_id as a dict"""
+        with self._lock:
+            record = self._pairs.get(player_id, {}).get(opponent_id)
+            return (record or PairRecord()).as_dict()
+
+    def opponents(self, player_id):
+        """{opponent_id: record dict} for everyone player_id has played"""
+        with self._lock:
+            return {opponent_id: record.as_dict()
+                    for opponent_id, record in self._pairs.get(player_id, {}).items()}
+
+    def _best_opponents(self, player_id):
+        best = self._best.get(player_id)
+        if best is None:
+            nemesis = favorite = None
+            nemesis_key = favorite_key = None
+            for opponent_id, record in self._pairs.get(player_id, {}).items():
+                # Nemesis: lost to most, then beaten least; favorite: beaten most, then played most
+                if record.losses > 0:
+                    key = (record.losses, -record.wins, -opponent_id)
+                    if nemesis_key is None or key > nemesis_key:
+                        nemesis_key, nemesis = key, _summary(opponent_id, record)
+                if record.wins > 0:
+                    key = (record.wins, record.total_games, -opponent_id)
+                    if favorite_key is None or key > favorite_key:
+                        favorite_key, favorite = key, _summary(opponent_id, record)
+            best = self._best[player_id] = (nemesis, favorite)
+        return best
+
+    def nemesis(self, player_id):
+        """The opponent player_id has lost to most, or None"""
+        with self._lock:
+            nemesis = self._best_opponents(player_id)[0]
+            return dict(nemesis) if nemesis else None
+
+    def favorite_opponent(self, player_id):
+        """The opponent player_id has beaten most, or None"""
+        with self._lock:
+            favorite = self._best_opponents(player_id)[1]
+            return dict(favorite) if favorite else None
+
+    def rivalry_grid(self, player_ids):
+        """{player_id: {opponent_id: record dict}} for every pair in player_ids that has played"""
+        with self._lock:
+            grid = {}
+            for player_id in player_ids:
+                row = self._pairs.get(player_id, {})
+                grid[player_id] = {opponent_id: row[opponent_id].as_dict()
+                                   for opponent_id in player_ids if opponent_id in row}
+            return grid
+
+
+def player_names(execute_query, player_ids):
+    """{player_id: "First Last"} for the given IDs, in one query"""
+    player_ids = [player_id for player_id in set(player_ids) if player_id is not None]
+    if not player_ids:
+        return {}
+    placeholders = ', '.join('?' for _ in player_ids)
+    rows = execute_query(f"SELECT id, first_name, last_name FROM players WHERE id IN ({placeholders})",
+                         player_ids, fetch=True)
+    return {row['id']: f"{row['first_name']} {row['last_name']}" for row in rows}
+
+
+def with_name(summary, names):
+    """Add the opponent's name to a nemesis / favorite opponent summary"""
+    if summary is not None:
+        summary['name'] = names.get(summary['id'], 'Unknown')
+    return summary
+
+
+# Shared by the whole worker process and kept current by game_events
+head_to_head = game_events.subscribe(HeadToHeadMatrix())
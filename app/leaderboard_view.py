@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Materialized leaderboard for Cribbage Board Collection
+On PostgreSQL the per-player totals live in a materialized view, so the
+leaderboard pages read one small precomputed row per player. The view is
+refreshed CONCURRENTLY - readers keep seeing the previous contents and are
+never blocked - a few seconds after games change, with a burst of writes
+on game night folded into a single refresh.
+
+SQLite has no materialized views; there the same grouped query runs directly.
+"""
+
+import os
+import threading
+
+try:
+    from stats_engine import PLAYER_RESULTS
+    import game_events
+except ImportError:
+    from app.stats_engine import PLAYER_RESULTS
+    from app import game_events
+
+LEADERBOARD_VIEW = 'leaderboard_mv'
+
+# Seconds to wait after a write before refreshing; later writes in the window share the refresh
+LEADERBOARD_REFRESH_DELAY = float(os.environ.get('LEADERBOARD_REFRESH_DELAY', '5'))
+
+# One row per player who has played. Skunks read games.skunk_class, where a
+# double skunk is also a skunk.
+LEADERBOARD_SOURCE = f"""
+    SELECT p.id, p.first_name, p.last_name, p.photo,
+           SUM(r.won) as wins,
+           COUNT(*) - SUM(r.won) as losses,
+           COUNT(*) as total_games,
+           SUM(CASE WHEN r.won = 1 AND r.skunk_class > 0 THEN 1 ELSE 0 END) as skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk_class > 0 THEN 1 ELSE 0 END) as skunks_received,
+           SUM(CASE WHEN r.won = 1 AND r.skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks_received
+    FROM ({PLAYER_RESULTS}) r
+    JOIN players p ON p.id = r.player_id
+    GROUP BY p.id, p.first_name, p.last_name, p.photo
+"""
+
+VIEW_SCHEMA = [
+    f"CREATE MATERIALIZED VIEW IF NOT EXISTS {LEADERBOARD_VIEW} AS {LEADERBOARD_SOURCE}",
+    # REFRESH ... CONCURRENTLY needs a unique index to match old rows to new ones
+    f"CREATE UNIQUE INDEX IF NOT EXISTS {LEADERBOARD_VIEW}_id ON {LEADERBOARD_VIEW} (id)",
+]
+
+# The columns stats_engine.build_leaderboard() uses, read from the view
+LEADERBOARD_QUERY = f"""
+    SELECT id, first_name, last_name, photo, wins, losses, total_games,
+           skunks_given, skunks_received, double_skunks_given, double_skunks_received
+    FROM {LEADERBOARD_VIEW}
+"""
+
+
+class LeaderboardView:
+    """The materialized view and its debounced refresh, for one worker process"""
+
+    def __init__(self, delay=LEADERBOARD_REFRESH_DELAY):
+        self.delay = delay
+        self.enabled = False
+        self._execute_query = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def enable(self, execute_query):
+        """Create the view if needed and refresh it whenever games change (PostgreSQL only)"""
+        for statement in VIEW_SCHEMA:
+            execute_query(statement)
+        self._execute_query = execute_query
+        self.enabled = True
+        game_events.subscribe(self)
+        return self
+
+    def leaderboard_query(self, fallback):
+        """LEADERBOARD_QUERY when the view is enabled, otherwise fallback"""
+        return LEADERBOARD_QUERY if self.enabled else fallback
+
+    def rows(self, execute_query):
+        """Every player's leaderboard row - from the view when enabled, else computed"""
+        query = f"SELECT * FROM {LEADERBOARD_VIEW}" if self.enabled else LEADERBOARD_SOURCE
+        return execute_query(query, fetch=True)
+
+    # ---- game_events listener -----------------------------------------
+
+    def game_changed(self, old_game, new_game, version=None):
+        self.request_refresh()
+
+    def reset(self):
+        self.request_refresh()
+
+    # ---- refreshing ----------------------------------------------------
+
+    def request_refresh(self):
+        """Refresh after the debounce delay, unless a refresh is already waiting"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(self.delay, self._run_refresh)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _run_refresh(self):
+        # Clear the timer first so a write made during the refresh schedules another
+        with self._lock:
+            self._timer = None
+        try:
+            self.refresh()
+        except Exception as e:
+            print(f"⚠️  Leaderboard refresh failed: {e}")
+
+    def refresh(self):
+        self._execute_query(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {LEADERBOARD_VIEW}")
+
+
+# Enabled by the app at startup when it is running on PostgreSQL
+leaderboard_view = LeaderboardView()
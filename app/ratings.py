@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+"""
+Elo ratings for Cribbage Board Collection
+Games are rated in (played_on, id) order. rating_history keeps every
+player's rating after every game and player_ratings their current rating,
+so pages read ratings without replaying anything.
+
+A new game only rates itself. An edited, deleted or back-dated game
+replays from the earliest game it affects: history from that point on is
+dropped, each player restarts from their last stored rating before it
+(their checkpoint) and the later games are rated again.
+"""
+
+try:
+    import date_columns
+    from game_events import as_id
+except ImportError:
+    from app import date_columns
+    from app.game_events import as_id
+
+INITIAL_RATING = 1500.0
+K_FACTOR = 32
+
+# rating_history.played_on is the game's as YYYY-MM-DD text, '' without one, so it compares like START
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS rating_history (
+      game_id INTEGER NOT NULL,
+      player_id INTEGER NOT NULL,
+      played_on VARCHAR(10) NOT NULL,
+      rating_before REAL NOT NULL,
+      rating_after REAL NOT NULL,
+      PRIMARY KEY (game_id, player_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_rating_history_order ON rating_history (played_on, game_id)",
+    "CREATE INDEX IF NOT EXISTS idx_rating_history_player ON rating_history (player_id, played_on, game_id)",
+    """
+    CREATE TABLE IF NOT EXISTS player_ratings (
+      player_id INTEGER PRIMARY KEY,
+      rating REAL NOT NULL,
+      games INTEGER NOT NULL
+    )
+    """,
+]
+
+HISTORY_COLUMNS = ('game_id', 'player_id', 'played_on', 'rating_before', 'rating_after')
+
+# (played_on, game_id) before every game
+START = ('', 0)
+
+# played_on as YYYY-MM-DD text on either database; games without one sort first
+_PLAYED_ON = "COALESCE(CAST(played_on AS TEXT), '')"
+
+GAMES_FROM = f"""
+    SELECT id, winner_id, loser_id, {_PLAYED_ON} as played_on
+    FROM games
+    WHERE {_PLAYED_ON} > ? OR ({_PLAYED_ON} = ? AND id >= ?)
+    ORDER BY {_PLAYED_ON}, id
+"""
+
+# Each player's latest stored rating and how many games it covers
+CHECKPOINTS_QUERY = """
+    SELECT player_id, rating_after, games FROM (
+        SELECT player_id, rating_after,
+               ROW_NUMBER() OVER (PARTITION BY player_id ORDER BY played_on DESC, game_id DESC) as rn,
+               COUNT(*) OVER (PARTITION BY player_id) as games
+        FROM rating_history
+        WHERE player_id IN ({placeholders})
+    ) latest
+    WHERE rn = 1
+"""
+
+
+def expected_score(rating, opponent_rating):
+    """Chance of beating opponent_rating, 0 to 1"""
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def rate_game(winner_rating, loser_rating, k=K_FACTOR):
+    """New (winner, loser) ratings after one game"""
+    change = k * (1 - expected_score(winner_rating, loser_rating))
+    return winner_rating + change, loser_rating - change
+
+
+def _game_key(game):
+    return (date_columns.iso_date(game.get('date_played')) or '', int(game['id']))
+
+
+def _games_from(execute_query, start):
+    played_on, game_id = start
+    return execute_query(GAMES_FROM, [played_on, played_on, game_id], fetch=True)
+
+
+def _rate_games(games, ratings, counts):
+    """Rate games in order, updating ratings and counts in place; returns the history rows"""
+    history = []
+    for game in games:
+        winner_id, loser_id = game['winner_id'], game['loser_id']
+        if winner_id is None or loser_id is None or winner_id == loser_id:
+            continue
+        winner_before = ratings.get(winner_id, INITIAL_RATING)
+        loser_before = ratings.get(loser_id, INITIAL_RATING)
+        ratings[winner_id], ratings[loser_id] = rate_game(winner_before, loser_before)
+        counts[winner_id] = counts.get(winner_id, 0) + 1
+        counts[loser_id] = counts.get(loser_id, 0) + 1
+        history.append((game['id'], winner_id, game['played_on'], winner_before, ratings[winner_id]))
+        history.append((game['id'], loser_id, game['played_on'], loser_before, ratings[loser_id]))
+    return history
+
+
+def upgrade_tables(execute_query, postgresql=False):
+    """Drop a rating_history from before played_on; create_tables makes it
+    again and needs_rebuild then rates every game afresh"""
+    if not date_columns.has_column(execute_query, 'rating_history', 'played_on', postgresql=postgresql):
+        execute_query("DROP TABLE IF EXISTS rating_history")
+
+
+def create_tables(execute_query):
+    for statement in SCHEMA:
+        execute_query(statement)
+
+
+def needs_rebuild(execute_query):
+    """True when there are games but nothing has been rated yet"""
+    if execute_query("SELECT COUNT(*) as count FROM rating_history", fetch=True)[0]['count']:
+        return False
+    return execute_query("SELECT COUNT(*) as count FROM games", fetch=True)[0]['count'] > 0
+
+
+def replay_from(execute_query, bulk_insert, start=START, players=()):
+    """Rate every game from start = (played_on, game_id) onward again.
+
+    Ratings before start are kept and used as each player's checkpoint.
+    players lists anyone else whose current rating may have changed (the
+    players of a deleted game). Run it inside a transaction.
+    """
+    played_on, game_id = start
+    execute_query("DELETE FROM rating_history WHERE played_on > ? OR (played_on = ? AND game_id >= ?)",
+                  [played_on, played_on, game_id])
+    games = _games_from(execute_query, start)
+
+    touched = {player_id for player_id in players if player_id is not None}
+    for game in games:
+        touched.update(player_id for player_id in (game['winner_id'], game['loser_id']) if player_id is not None)
+    if not touched:
+        return 0
+
+    ratings, counts = {}, {}
+    placeholders = ', '.join('?' for _ in touched)
+    if start != START:
+        for row in execute_query(CHECKPOINTS_QUERY.format(placeholders=placeholders), list(touched), fetch=True):
+            ratings[row['player_id']] = row['rating_after']
+            counts[row['player_id']] = row['games']
+
+    bulk_insert('rating_history', HISTORY_COLUMNS, _rate_games(games, ratings, counts))
+
+    execute_query(f"DELETE FROM player_ratings WHERE player_id IN ({placeholders})", list(touched))
+    bulk_insert('player_ratings', ('player_id', 'rating', 'games'),
+                [(player_id, ratings[player_id], counts[player_id]) for player_id in touched if counts.get(player_id)])
+    return len(games)
+
+
+def rebuild(execute_query, bulk_insert):
+    """Rate every game from the start. Run it inside a transaction."""
+    execute_query("DELETE FROM rating_history")
+    execute_query("DELETE FROM player_ratings")
+    return replay_from(execute_query, bulk_insert)
+
+
+def apply_change(execute_query, bulk_insert, old_game, new_game):
+    """Re-rate after one game write, from the earlier of its old and new place in the order.
+
+    A game added after every other only rates itself. Call it in the same
+    transaction as the write to games, with the games as stored (they need
+    id and date_played).
+    """
+    games = [dict(game) for game in (old_game, new_game) if game is not None]
+    if not games:
+        return 0
+    players = [as_id(game.get(column)) for game in games for column in ('winner_id', 'loser_id')]
+    return replay_from(execute_query, bulk_insert, min(_game_key(game) for game in games), players)
+
+
+def check(execute_query):
+    """Players whose stored rating differs from rating every game afresh (empty = consistent)"""
+    ratings, counts = {}, {}
+    _rate_games(_games_from(execute_query, START), ratings, counts)
+    expected = {player_id: (round(ratings[player_id], 6), counts[player_id]) for player_id in counts}
+    actual = {row['player_id']: (round(row['rating'], 6), row['games'])
+              for row in execute_query("SELECT * FROM player_ratings", fetch=True)}
+    return [f"player_ratings player {player_id}: expected {expected.get(player_id)}, found {actual.get(player_id)}"
+            for player_id in sorted(set(expected) | set(actual))
+            if expected.get(player_id) != actual.get(player_id)]
+
+
+def current_ratings(execute_query, player_ids=None):
+    """{player_id: {'rating': ..., 'games': ...}} from player_ratings"""
+    query = "SELECT player_id, rating, games FROM player_ratings"
+    params = []
+    if player_ids is not None:
+        player_ids = list(player_ids)
+        if not player_ids:
+            return {}
+        query += f" WHERE player_id IN ({', '.join('?' for _ in player_ids)})"
+        params = player_ids
+    return {row['player_id']: {'rating': round(row['rating']), 'games': row['games']}
+            for row in execute_query(query, params, fetch=True)}
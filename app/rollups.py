@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Time-bucketed rollups for Cribbage Board Collection
+player_daily_stats and player_monthly_stats hold each player's games, wins,
+skunks and point margin per day and per month of games.played_on. They
+are kept current inside the same transaction as every game add, edit and
+delete, so trend charts read a few dozen rollup rows instead of scanning
+games.
+
+Games without a played_on - no date, or one in neither format date_columns
+reads - are left out of both tables.
+"""
+
+try:
+    from stats_engine import PLAYER_RESULTS
+    from date_columns import iso_date
+    from game_events import as_id, skunk_class
+except ImportError:
+    from app.stats_engine import PLAYER_RESULTS
+    from app.date_columns import iso_date
+    from app.game_events import as_id, skunk_class
+
+# bucket name: (table, leading characters of the YYYY-MM-DD played_on that name the bucket)
+BUCKETS = {
+    'day': ('player_daily_stats', 10),
+    'month': ('player_monthly_stats', 7),
+}
+
+# margin_total is the player's points minus their opponent's, over scored_games
+ROLLUP_COLUMNS = ('games', 'wins', 'skunks_given', 'skunks_received', 'scored_games', 'margin_total')
+
+# Buckets averaged into each point's rolling win rate
+ROLLING_BUCKETS = 3
+
+# Months of history the trends sections chart
+TREND_MONTHS = 24
+
+SCHEMA = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {table} (
+      player_id INTEGER NOT NULL,
+      bucket VARCHAR(10) NOT NULL,
+      games INTEGER NOT NULL DEFAULT 0,
+      wins INTEGER NOT NULL DEFAULT 0,
+      skunks_given INTEGER NOT NULL DEFAULT 0,
+      skunks_received INTEGER NOT NULL DEFAULT 0,
+      scored_games INTEGER NOT NULL DEFAULT 0,
+      margin_total INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (player_id, bucket)
+    )
+    """
+    for table, _ in BUCKETS.values()
+] + [
+    # Trends across every player read by bucket
+    f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)"
+    for table, _ in BUCKETS.values()
+]
+
+_SKUNK = "r.skunk_class > 0"
+_SCORED = "r.winner_score IS NOT NULL AND r.loser_score IS NOT NULL"
+
+# played_on as YYYY-MM-DD text on either database
+_PLAYED_ON = "CAST(r.played_on AS TEXT)"
+
+# What a rollup table should hold, computed from games
+ROLLUP_FROM_GAMES = f"""
+    SELECT r.player_id, SUBSTR({_PLAYED_ON}, 1, {{length}}) as bucket,
+           COUNT(*) as games,
+           SUM(r.won) as wins,
+           SUM(CASE WHEN r.won = 1 AND {_SKUNK} THEN 1 ELSE 0 END) as skunks_given,
+           SUM(CASE WHEN r.won = 0 AND {_SKUNK} THEN 1 ELSE 0 END) as skunks_received,
+           SUM(CASE WHEN {_SCORED} THEN 1 ELSE 0 END) as scored_games,
+           SUM(CASE WHEN {_SCORED} THEN (r.winner_score - r.loser_score) * (2 * r.won - 1) ELSE 0 END) as margin_total
+    FROM ({PLAYER_RESULTS}) r
+    WHERE r.player_id IS NOT NULL AND r.played_on IS NOT NULL
+    GROUP BY r.player_id, SUBSTR({_PLAYED_ON}, 1, {{length}})
+"""
+
+# Every player's buckets added together; each game has one winner, so wins counts games
+OVERALL_QUERY = """
+    SELECT bucket, SUM(wins) as games, SUM(skunks_given) as skunks
+    FROM {table}
+    {where}
+    GROUP BY bucket
+    ORDER BY bucket
+"""
+
+
+def _upsert(table):
+    """INSERT that adds to the existing bucket's counters on conflict"""
+    all_columns = ('player_id', 'bucket') + ROLLUP_COLUMNS
+    updates = ', '.join(f"{c} = {table}.{c} + excluded.{c}" for c in ROLLUP_COLUMNS)
+    return (f"INSERT INTO {table} ({', '.join(all_columns)}) "
+            f"VALUES ({', '.join('?' for _ in all_columns)}) "
+            f"ON CONFLICT (player_id, bucket) DO UPDATE SET {updates}")
+
+UPSERTS = {table: _upsert(table) for table, _ in BUCKETS.values()}
+
+
+def _score(value):
+    if value is None or value == '':
+        return None
+    return int(value)
+
+
+def _apply(execute_query, game, sign):
+    """Add (sign=1) or back out (sign=-1) one game's counts; returns the (table, player, bucket) rows touched"""
+    played_on = iso_date(game.get('date_played'))
+    if not played_on:
+        return []
+    skunk = int(skunk_class(game) > 0)
+    winner_score, loser_score = _score(game.get('winner_score')), _score(game.get('loser_score'))
+    scored = winner_score is not None and loser_score is not None
+    margin = winner_score - loser_score if scored else 0
+
+    touched = []
+    for player_id, won in ((as_id(game.get('winner_id')), 1), (as_id(game.get('loser_id')), 0)):
+        if player_id is None:
+            continue
+        counts = (1, won, skunk * won, skunk * (1 - won), int(scored), margin if won else -margin)
+        for table, length in BUCKETS.values():
+            bucket = played_on[:length]
+            execute_query(UPSERTS[table], [player_id, bucket, *(sign * count for count in counts)])
+            touched.append((table, player_id, bucket))
+    return touched
+
+
+def apply_change(execute_query, old_game, new_game):
+    """Move the rollups from old_game to new_game (either may be None).
+
+    Call it in the same transaction as the write to games.
+    """
+    touched = set()
+    if old_game is not None:
+        touched.update(_apply(execute_query, dict(old_game), -1))
+    if new_game is not None:
+        touched.update(_apply(execute_query, dict(new_game), 1))
+
+    # Buckets whose only games were backed out drop out again
+    for table, player_id, bucket in touched:
+        execute_query(f"DELETE FROM {table} WHERE player_id = ? AND bucket = ? AND games = 0", [player_id, bucket])
+
+
+def create_tables(execute_query):
+    for statement in SCHEMA:
+        execute_query(statement)
+
+
+def rebuild(execute_query):
+    """Recompute both rollups from games. Run it inside a transaction."""
+    for table, length in BUCKETS.values():
+        execute_query(f"DELETE FROM {table}")
+        execute_query(f"INSERT INTO {table} (player_id, bucket, {', '.join(ROLLUP_COLUMNS)}) "
+                      f"{ROLLUP_FROM_GAMES.format(length=length)}")
+
+
+def needs_rebuild(execute_query):
+    """True when there are dated games but nothing has been rolled up yet, or
+    there are buckets cut from date_played text rather than played_on"""
+    if execute_query("SELECT COUNT(*) as count FROM player_monthly_stats WHERE bucket NOT LIKE '____-__'",
+                     fetch=True)[0]['count']:
+        return True
+    if execute_query("SELECT COUNT(*) as count FROM player_monthly_stats", fetch=True)[0]['count']:
+        return False
+    return execute_query("SELECT COUNT(*) as count FROM games WHERE played_on IS NOT NULL",
+                         fetch=True)[0]['count'] > 0
+
+
+def check(execute_query):
+    """Rollup rows that disagree with games, as readable lines (empty = consistent)"""
+    problems = []
+    for table, length in BUCKETS.values():
+        def by_key(rows):
+            return {(row['player_id'], row['bucket']): tuple(row[c] for c in ROLLUP_COLUMNS) for row in rows}
+
+        expected = by_key(execute_query(ROLLUP_FROM_GAMES.format(length=length), fetch=True))
+        actual = by_key(execute_query(f"SELECT * FROM {table}", fetch=True))
+        for key in sorted(set(expected) | set(actual)):
+            if expected.get(key) != actual.get(key):
+                problems.append(f"{table} player {key[0]} {key[1]}: expected {expected.get(key)}, found {actual.get(key)}")
+    return problems
+
+
+def _with_trend(rows):
+    """Chart points from rollup rows in bucket order, with a rolling win rate"""
+    points = []
+    for row in rows:
+        point = {key: row[key] for key in row.keys()}
+        points.append(point)
+        window = points[-ROLLING_BUCKETS:]
+        window_games = sum(p['games'] for p in window)
+        point['win_rate'] = round(point['wins'] / point['games'] * 100, 1) if point['games'] else 0
+        point['rolling_win_rate'] = round(sum(p['wins'] for p in window) / window_games * 100, 1) if window_games else 0
+        point['avg_margin'] = round(point['margin_total'] / point['scored_games'], 1) if point['scored_games'] else None
+    return points
+
+
+def player_trend(execute_query, player_id, bucket='month', since=None):
+    """The player's buckets, oldest first, from since (a bucket such as '2024-01') on.
+
+    Each point has the rollup columns plus win_rate, rolling_win_rate over
+    the last ROLLING_BUCKETS buckets, and avg_margin (None without scores).
+    """
+    table, _ = BUCKETS[bucket]
+    query = f"SELECT bucket, {', '.join(ROLLUP_COLUMNS)} FROM {table} WHERE player_id = ?"
+    params = [player_id]
+    if since:
+        query += " AND bucket >= ?"
+        params.append(since)
+    return _with_trend(execute_query(query + " ORDER BY bucket", params, fetch=True))
+
+
+def overall_trend(execute_query, bucket='month', since=None):
+    """Games played and skunks per bucket across every player, oldest first"""
+    table, _ = BUCKETS[bucket]
+    where, params = ("WHERE bucket >= ?", [since]) if since else ("", [])
+    return [{'bucket': row['bucket'], 'games': row['games'], 'skunks': row['skunks']}
+            for row in execute_query(OVERALL_QUERY.format(table=table, where=where), params, fetch=True)]
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Score and margin distributions for Cribbage Board Collection
+Histograms, percentiles and average margins by player and by board, from
+three grouped queries. The score query returns one row per distinct
+(winner_score, loser_score) pair - a few hundred rows however many games
+there are - and the histograms and percentiles are read off those counts.
+
+Results are cached per worker until games_version shows a game write by
+any worker.
+"""
+
+import math
+import threading
+
+try:
+    from stats_engine import PLAYER_RESULTS
+    import game_events
+except ImportError:
+    from app.stats_engine import PLAYER_RESULTS
+    from app import game_events
+
+# Points per histogram bar
+HISTOGRAM_BIN = 10
+PERCENTILES = (10, 25, 50, 75, 90)
+
+SCORE_COUNTS_QUERY = """
+    SELECT winner_score, loser_score, COUNT(*) as games
+    FROM games
+    WHERE winner_score IS NOT NULL AND loser_score IS NOT NULL
+    GROUP BY winner_score, loser_score
+"""
+
+PLAYER_MARGINS_QUERY = f"""
+    SELECT r.player_id, COUNT(*) as games,
+           AVG(CASE WHEN r.won = 1 THEN r.winner_score - r.loser_score END) as avg_margin_won,
+           AVG(CASE WHEN r.won = 0 THEN r.winner_score - r.loser_score END) as avg_margin_lost,
+           AVG(CASE WHEN r.won = 1 THEN r.winner_score ELSE r.loser_score END) as avg_score
+    FROM ({PLAYER_RESULTS}) r
+    WHERE r.player_id IS NOT NULL AND r.winner_score IS NOT NULL AND r.loser_score IS NOT NULL
+    GROUP BY r.player_id
+"""
+
+BOARD_MARGINS_QUERY = """
+    SELECT b.id, b.roman_number, COUNT(*) as games,
+           AVG(g.winner_score - g.loser_score) as avg_margin,
+           AVG(g.loser_score) as avg_loser_score
+    FROM games g
+    JOIN boards b ON b.id = g.board_id
+    WHERE g.winner_score IS NOT NULL AND g.loser_score IS NOT NULL
+    GROUP BY b.id, b.roman_number
+    ORDER BY games DESC, b.roman_number
+"""
+
+
+def _average(value):
+    # PostgreSQL's AVG over integers is a Decimal
+    return round(float(value), 1) if value is not None else None
+
+
+def histogram(counts, bin_size=HISTOGRAM_BIN):
+    """[{'low', 'high', 'games', 'percent'}] bars from {value: games}"""
+    total = sum(counts.values())
+    bins = {}
+    for value, games in counts.items():
+        low = (value // bin_size) * bin_size
+        bins[low] = bins.get(low, 0) + games
+    return [{'low': low, 'high': low + bin_size - 1, 'games': bins[low],
+             'percent': round(bins[low] / total * 100, 1)}
+            for low in sorted(bins)]
+
+
+def percentiles(counts, points=PERCENTILES):
+    """{percentile: value} from {value: games}, by nearest rank"""
+    total = sum(counts.values())
+    if not total:
+        return {}
+    values = sorted(counts)
+    result = {}
+    for point in points:
+        rank = max(1, math.ceil(point / 100 * total))
+        seen = 0
+        for value in values:
+            seen += counts[value]
+            if seen >= rank:
+                result[point] = value
+                break
+    return result
+
+
+def compute(execute_query):
+    """Every distribution, from three grouped queries"""
+    margins, loser_scores = {}, {}
+    for row in execute_query(SCORE_COUNTS_QUERY, fetch=True):
+        margin = row['winner_score'] - row['loser_score']
+        margins[margin] = margins.get(margin, 0) + row['games']
+        loser_scores[row['loser_score']] = loser_scores.get(row['loser_score'], 0) + row['games']
+    games = sum(margins.values())
+
+    by_player = {
+        row['player_id']: {
+            'games': row['games'],
+            'avg_margin_won': _average(row['avg_margin_won']),
+            'avg_margin_lost': _average(row['avg_margin_lost']),
+            'avg_score': _average(row['avg_score']),
+        }
+        for row in execute_query(PLAYER_MARGINS_QUERY, fetch=True)
+    }
+    by_board = [
+        {'id': row['id'], 'roman_number': row['roman_number'], 'games': row['games'],
+         'avg_margin': _average(row['avg_margin']), 'avg_loser_score': _average(row['avg_loser_score'])}
+        for row in execute_query(BOARD_MARGINS_QUERY, fetch=True)
+    ]
+
+    return {
+        'games': games,
+        'average_margin': round(sum(m * n for m, n in margins.items()) / games, 1) if games else None,
+        'margin_histogram': histogram(margins),
+        'margin_percentiles': percentiles(margins),
+        'loser_score_histogram': histogram(loser_scores),
+        'loser_score_percentiles': percentiles(loser_scores),
+        'by_player': by_player,
+        'by_board': by_board,
+    }
+
+
+class ScoreDistribution:
+    """compute() cached until a game changes here or games_version moves on"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = None
+        self._version = None  # games_version read before computing
+        self._generation = 0  # bumped on every reset, so a stale compute() is not cached
+
+    def get(self, execute_query):
+        # Version first: a write committing during compute() then costs a recompute, never a stale cache
+        version = game_events.games_version(execute_query)
+        with self._lock:
+            stats, cached_version, generation = self._stats, self._version, self._generation
+        if stats is None or cached_version != version:
+            stats = compute(execute_query)
+            with self._lock:
+                if self._generation == generation:
+                    self._stats, self._version = stats, version
+        return stats
+
+    def player(self, execute_query, player_id):
+        """The player's average margins and score, or None without scored games"""
+        return self.get(execute_query)['by_player'].get(player_id)
+
+    # ---- game_events listener -----------------------------------------
+
+    def game_changed(self, old_game, new_game, version=None):
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stats = None
+            self._version = None
+            self._generation += 1
+
+
+score_distribution = game_events.subscribe(ScoreDistribution())
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Margin and skunk class columns for Cribbage Board Collection
+games.margin (winner_score - loser_score) and games.skunk_class (0 none,
+1 skunk, 2 double skunk) are generated by the database from the scores
+and the is_skunk / is_double_skunk flags, so every query reads the same
+skunk definition and no write path has to remember to fill them in.
+
+The flags are the definition: they are what the game forms record, and
+imports and app.py's score entry set them from the loser's score (below
+91 a skunk, below 61 a double skunk). A double skunk is also a skunk.
+
+Partial indexes hold only skunked games, so skunk leaderboards read a
+handful of index entries instead of every game.
+"""
+
+SKUNK_CLASS_SQL = "CASE WHEN is_double_skunk <> 0 THEN 2 WHEN is_skunk <> 0 THEN 1 ELSE 0 END"
+MARGIN_SQL = "winner_score - loser_score"
+
+# Column -> expression; SQLite can only add VIRTUAL generated columns, PostgreSQL only STORED
+COLUMNS = (('margin', MARGIN_SQL), ('skunk_class', SKUNK_CLASS_SQL))
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_games_skunks_by_winner ON games (winner_id, skunk_class) WHERE skunk_class > 0",
+    "CREATE INDEX IF NOT EXISTS idx_games_skunks_by_loser ON games (loser_id, skunk_class) WHERE skunk_class > 0",
+]
+
+# Skunks given and received per player, read from the partial indexes alone
+SKUNK_LEADERS_QUERY = """
+    SELECT player_id,
+           SUM(given) as skunks_given,
+           SUM(double_given) as double_skunks_given,
+           SUM(received) as skunks_received,
+           SUM(double_received) as double_skunks_received
+    FROM (
+        SELECT winner_id as player_id, COUNT(*) as given,
+               SUM(CASE WHEN skunk_class = 2 THEN 1 ELSE 0 END) as double_given,
+               0 as received, 0 as double_received
+        FROM games WHERE skunk_class > 0 AND winner_id IS NOT NULL
+        GROUP BY winner_id
+        UNION ALL
+        SELECT loser_id as player_id, 0, 0, COUNT(*),
+               SUM(CASE WHEN skunk_class = 2 THEN 1 ELSE 0 END)
+        FROM games WHERE skunk_class > 0 AND loser_id IS NOT NULL
+        GROUP BY loser_id
+    ) s
+    GROUP BY player_id
+"""
+
+
+def add_columns(execute_query, postgresql=False):
+    """Add the generated columns to an existing games table, then the partial indexes"""
+    if postgresql:
+        for name, expression in COLUMNS:
+            execute_query(f"ALTER TABLE games ADD COLUMN IF NOT EXISTS {name} INTEGER "
+                          f"GENERATED ALWAYS AS ({expression}) STORED")
+    else:
+        # table_xinfo, unlike table_info, lists generated columns
+        existing = {row['name'] for row in execute_query("PRAGMA table_xinfo(games)", fetch=True)}
+        for name, expression in COLUMNS:
+            if name not in existing:
+                execute_query(f"ALTER TABLE games ADD COLUMN {name} INTEGER "
+                              f"GENERATED ALWAYS AS ({expression}) VIRTUAL")
+    for statement in INDEXES:
+        execute_query(statement)
+
+
+def skunk_leaders(execute_query):
+    """{player_id: skunks and double skunks given and received}, for players in a skunked game"""
+    return {row['player_id']: {key: row[key] for key in row.keys() if key != 'player_id'}
+            for row in execute_query(SKUNK_LEADERS_QUERY, fetch=True)}
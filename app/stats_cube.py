@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Player x board x month stats cube for Cribbage Board Collection
+stats_cube holds games, wins and skunks at the grain of one player on one
+board in one month, kept current inside the same transaction as every game
+add, edit and delete. Board attributes (wood and material type) are joined
+from boards when a question is asked, so editing a board never leaves the
+cube stale.
+
+query() answers roll-ups and slices - "who wins most on walnut boards in
+winter" is group_by=('player',), filters={'wood_type': 'Walnut',
+'season': 'Winter'} - from these compact rows instead of joining games,
+boards and players.
+"""
+
+try:
+    from date_columns import iso_date
+    from game_events import as_id, skunk_class
+except ImportError:
+    from app.date_columns import iso_date
+    from app.game_events import as_id, skunk_class
+
+MEASURES = ('games', 'wins', 'skunks_given', 'skunks_received')
+
+# Games without a board or a played_on are kept under board 0 / month ''
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS stats_cube (
+      player_id INTEGER NOT NULL,
+      board_id INTEGER NOT NULL,
+      month VARCHAR(7) NOT NULL,
+      games INTEGER NOT NULL DEFAULT 0,
+      wins INTEGER NOT NULL DEFAULT 0,
+      skunks_given INTEGER NOT NULL DEFAULT 0,
+      skunks_received INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (player_id, board_id, month)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_stats_cube_board_month ON stats_cube (board_id, month)",
+]
+
+_SEASON = """CASE WHEN SUBSTR(c.month, 6, 2) IN ('12', '01', '02') THEN 'Winter'
+                 WHEN SUBSTR(c.month, 6, 2) IN ('03', '04', '05') THEN 'Spring'
+                 WHEN SUBSTR(c.month, 6, 2) IN ('06', '07', '08') THEN 'Summer'
+                 WHEN SUBSTR(c.month, 6, 2) IN ('09', '10', '11') THEN 'Autumn'
+                 ELSE '' END"""
+
+# Dimension name -> SQL over the cube (c) and its boards (b)
+DIMENSIONS = {
+    'player': "c.player_id",
+    'board': "c.board_id",
+    'wood_type': "COALESCE(b.wood_type, '')",
+    'material_type': "COALESCE(b.material_type, '')",
+    'month': "c.month",
+    'year': "SUBSTR(c.month, 1, 4)",
+    'season': _SEASON,
+}
+
+SEASONS = ('Winter', 'Spring', 'Summer', 'Autumn')
+
+# YYYY-MM of played_on on either database, '' without one
+_MONTH = "COALESCE(SUBSTR(CAST(r.played_on AS TEXT), 1, 7), '')"
+
+# What the cube should hold, computed from games
+CUBE_FROM_GAMES = f"""
+    SELECT r.player_id, COALESCE(r.board_id, 0) as board_id,
+           {_MONTH} as month,
+           COUNT(*) as games, SUM(r.won) as wins,
+           SUM(CASE WHEN r.won = 1 AND r.skunk = 1 THEN 1 ELSE 0 END) as skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk = 1 THEN 1 ELSE 0 END) as skunks_received
+    FROM (
+        SELECT winner_id as player_id, board_id, played_on, 1 as won,
+               CASE WHEN skunk_class > 0 THEN 1 ELSE 0 END as skunk
+        FROM games WHERE winner_id IS NOT NULL
+        UNION ALL
+        SELECT loser_id as player_id, board_id, played_on, 0 as won,
+               CASE WHEN skunk_class > 0 THEN 1 ELSE 0 END as skunk
+        FROM games WHERE loser_id IS NOT NULL
+    ) r
+    GROUP BY r.player_id, COALESCE(r.board_id, 0), {_MONTH}
+"""
+
+_KEY = ('player_id', 'board_id', 'month')
+CUBE_UPSERT = (f"INSERT INTO stats_cube ({', '.join(_KEY + MEASURES)}) "
+               f"VALUES ({', '.join('?' for _ in _KEY + MEASURES)}) "
+               f"ON CONFLICT ({', '.join(_KEY)}) DO UPDATE SET "
+               + ', '.join(f"{m} = stats_cube.{m} + excluded.{m}" for m in MEASURES))
+
+
+def _cell(game):
+    """(board_id, month) a game is counted under"""
+    board_id = as_id(game.get('board_id')) or 0
+    return board_id, (iso_date(game.get('date_played')) or '')[:7]
+
+
+def _apply(execute_query, game, sign):
+    board_id, month = _cell(game)
+    skunk = int(skunk_class(game) > 0)
+    touched = []
+    for player_id, won in ((as_id(game.get('winner_id')), 1), (as_id(game.get('loser_id')), 0)):
+        if player_id is None:
+            continue
+        measures = (1, won, skunk * won, skunk * (1 - won))
+        execute_query(CUBE_UPSERT, [player_id, board_id, month, *(sign * m for m in measures)])
+        touched.append((player_id, board_id, month))
+    return touched
+
+
+def apply_change(execute_query, old_game, new_game):
+    """Move the cube from old_game to new_game (either may be None).
+
+    Call it in the same transaction as the write to games.
+    """
+    touched = set()
+    if old_game is not None:
+        touched.update(_apply(execute_query, dict(old_game), -1))
+    if new_game is not None:
+        touched.update(_apply(execute_query, dict(new_game), 1))
+    for key in touched:
+        execute_query("DELETE FROM stats_cube WHERE player_id = ? AND board_id = ? AND month = ? AND games = 0",
+                      list(key))
+
+
+def create_tables(execute_query):
+    for statement in SCHEMA:
+        execute_query(statement)
+
+
+def rebuild(execute_query):
+    """Recompute the cube from games. Run it inside a transaction."""
+    execute_query("DELETE FROM stats_cube")
+    execute_query(f"INSERT INTO stats_cube ({', '.join(_KEY + MEASURES)}) {CUBE_FROM_GAMES}")
+
+
+def needs_rebuild(execute_query):
+    """True when there are games but the cube is empty, or it has months cut
+    from date_played text rather than played_on"""
+    if execute_query("SELECT COUNT(*) as count FROM stats_cube WHERE month <> '' AND month NOT LIKE '____-__'",
+                     fetch=True)[0]['count']:
+        return True
+    if execute_query("SELECT COUNT(*) as count FROM stats_cube", fetch=True)[0]['count']:
+        return False
+    return execute_query("SELECT COUNT(*) as count FROM games", fetch=True)[0]['count'] > 0
+
+
+def check(execute_query):
+    """Cube cells that disagree with games, as readable lines (empty = consistent)"""
+    def by_key(rows):
+        return {tuple(row[k] for k in _KEY): tuple(row[m] for m in MEASURES) for row in rows}
+
+    expected = by_key(execute_query(CUBE_FROM_GAMES, fetch=True))
+    actual = by_key(execute_query("SELECT * FROM stats_cube", fetch=True))
+    return [f"stats_cube {dict(zip(_KEY, key))}: expected {expected.get(key)}, found {actual.get(key)}"
+            for key in sorted(set(expected) | set(actual))
+            if expected.get(key) != actual.get(key)]
+
+
+def query(execute_query, group_by=(), filters=None):
+    """Roll up the cube to group_by dimensions, sliced by filters.
+
+    group_by names DIMENSIONS; filters maps a dimension to a value or a
+    list of values. Rows have the group_by dimensions, the MEASURES summed,
+    plus losses and win_rate, most games first. With no group_by it is one
+    grand-total row.
+    """
+    unknown = [d for d in list(group_by) + list(filters or {}) if d not in DIMENSIONS]
+    if unknown:
+        raise ValueError(f"Unknown stats cube dimension(s): {', '.join(unknown)}")
+
+    conditions, params = [], []
+    for dimension, chosen in (filters or {}).items():
+        chosen = list(chosen) if isinstance(chosen, (list, tuple, set)) else [chosen]
+        conditions.append(f"{DIMENSIONS[dimension]} IN ({', '.join('?' for _ in chosen)})")
+        params.extend(chosen)
+
+    selects = [f"{DIMENSIONS[d]} as {d}" for d in group_by]
+    selects += [f"SUM(c.{m}) as {m}" for m in MEASURES]
+    sql = f"SELECT {', '.join(selects)} FROM stats_cube c LEFT JOIN boards b ON b.id = c.board_id"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    if group_by:
+        sql += " GROUP BY " + ", ".join(DIMENSIONS[d] for d in group_by)
+
+    rows = []
+    for row in execute_query(sql, params, fetch=True):
+        entry = {key: row[key] for key in row.keys()}
+        if entry['games'] is None:
+            continue  # nothing matched the filters
+        entry['losses'] = entry['games'] - entry['wins']
+        entry['win_rate'] = round(entry['wins'] / entry['games'] * 100, 1) if entry['games'] else 0
+        rows.append(entry)
+    rows.sort(key=lambda r: (-r['games'], [str(r[d]) for d in group_by]))
+    return rows
+
+
+def values(execute_query, dimension):
+    """The distinct values of a dimension present in the cube, for filter choices"""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown stats cube dimension: {dimension}")
+    rows = execute_query(f"SELECT DISTINCT {DIMENSIONS[dimension]} as value "
+                         f"FROM stats_cube c LEFT JOIN boards b ON b.id = c.board_id", fetch=True)
+    return sorted(row['value'] for row in rows if row['value'] not in (None, '', 0))
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Set-based player statistics for Cribbage Board Collection
+Aggregates in the database with GROUP BY instead of looping over every game per player
+
+Functions take the app's execute_query so both app_hybrid and app can use them.
+"""
+
+try:
+    from head_to_head import player_names, with_name
+except ImportError:
+    from app.head_to_head import player_names, with_name
+
+# Every game twice: once from the winner's side (won = 1), once from the loser's
+PLAYER_RESULTS = """
+    SELECT id as game_id, played_on, winner_id as player_id, loser_id as opponent_id, 1 as won,
+           winner_score, loser_score, is_skunk, is_double_skunk, skunk_class
+    FROM games
+    UNION ALL
+    SELECT id as game_id, played_on, loser_id as player_id, winner_id as opponent_id, 0 as won,
+           winner_score, loser_score, is_skunk, is_double_skunk, skunk_class
+    FROM games
+"""
+
+RECENT_GAMES = 10
+
+# One row per player who has played, counted in a single pass over PLAYER_RESULTS.
+# Skunks read games.skunk_class (see skunk_columns.py), where a double skunk is also a skunk.
+LEADERBOARD_QUERY = f"""
+    SELECT p.id, p.first_name, p.last_name, p.photo,
+           SUM(r.won) as wins,
+           COUNT(*) - SUM(r.won) as losses,
+           COUNT(*) as total_games,
+           SUM(CASE WHEN r.won = 1 AND r.skunk_class > 0 THEN 1 ELSE 0 END) as skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk_class > 0 THEN 1 ELSE 0 END) as skunks_received,
+           SUM(CASE WHEN r.won = 1 AND r.skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks_received
+    FROM ({PLAYER_RESULTS}) r
+    JOIN players p ON p.id = r.player_id
+    GROUP BY p.id, p.first_name, p.last_name, p.photo
+"""
+
+
+def build_leaderboard(execute_query, query=LEADERBOARD_QUERY):
+    """Leaderboard entries for every player with games, best win percentage first.
+
+    Entries have id, first_name, last_name, photo, wins, losses, total_games,
+    win_percentage and skunks/double skunks given and received - what
+    stats.html expects. Ties keep alphabetical order. query can swap in
+    another source of the same columns, such as the player_stats table.
+    """
+    return leaderboard_entries({key: row[key] for key in row.keys()} for row in execute_query(query, fetch=True))
+
+
+def leaderboard_entries(rows):
+    """build_leaderboard() for rows already in hand (dicts with the same columns)"""
+    leaderboard = []
+    for entry in rows:
+        entry['win_percentage'] = (entry['wins'] / entry['total_games']) * 100
+        leaderboard.append(entry)
+
+    leaderboard.sort(key=lambda e: (-e['win_percentage'], e['first_name'] or '', e['last_name'] or ''))
+    return leaderboard
+
+
+# ================================
+# BATCHED PLAYER STATS
+# ================================
+#
+# Four queries for any number of players, instead of about ten per player.
+# {where} optionally narrows PLAYER_RESULTS to a list of players.
+
+PLAYER_TOTALS_QUERY = f"""
+    SELECT r.player_id,
+           SUM(r.won) as wins,
+           COUNT(*) - SUM(r.won) as losses,
+           SUM(CASE WHEN r.won = 1 AND r.skunk_class > 0 THEN 1 ELSE 0 END) as skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk_class > 0 THEN 1 ELSE 0 END) as skunks_received,
+           SUM(CASE WHEN r.won = 1 AND r.skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks_given,
+           SUM(CASE WHEN r.won = 0 AND r.skunk_class = 2 THEN 1 ELSE 0 END) as double_skunks_received,
+           AVG(CASE WHEN r.won = 1 THEN r.winner_score END) as avg_winning_score,
+           AVG(CASE WHEN r.won = 0 THEN r.loser_score END) as avg_losing_score
+    FROM ({PLAYER_RESULTS}) r
+    {{where}}
+    GROUP BY r.player_id
+"""
+
+# Each player's last RECENT_GAMES results, newest first (undated games count as oldest)
+RECENT_RESULTS_QUERY = f"""
+    SELECT player_id, won FROM (
+        SELECT r.player_id, r.won,
+               ROW_NUMBER() OVER (PARTITION BY r.player_id ORDER BY r.played_on DESC NULLS LAST, r.game_id DESC) as rn
+        FROM ({PLAYER_RESULTS}) r
+        {{where}}
+    ) recent
+    WHERE rn <= {RECENT_GAMES}
+    ORDER BY player_id, rn
+"""
+
+# game_participants in PLAYER_RESULTS' shape, for the queries that only need
+# player_id, won and the game's place in time - served by its (player_id, played_on) index
+PARTICIPANT_RESULTS = """
+    SELECT game_id, played_on, player_id, CASE WHEN role = 'winner' THEN 1 ELSE 0 END as won
+    FROM game_participants
+"""
+
+# Current, longest winning and longest losing streak per player in one pass.
+# Numbering each player's games, and separately their wins and their losses,
+# gives a difference that stays constant along a run of results (gaps and
+# islands); the current run is the one holding the player's last game.
+STREAKS_QUERY = """
+    WITH ordered AS (
+        SELECT r.player_id, r.won,
+               ROW_NUMBER() OVER (PARTITION BY r.player_id ORDER BY r.played_on NULLS FIRST, r.game_id) as seq,
+               COUNT(*) OVER (PARTITION BY r.player_id) as games
+        FROM ({source}) r
+        {where}
+    ), runs AS (
+        SELECT player_id, won, seq, games,
+               seq - ROW_NUMBER() OVER (PARTITION BY player_id, won ORDER BY seq) as run
+        FROM ordered
+    ), lengths AS (
+        SELECT player_id, won, run, COUNT(*) as length, MAX(seq) as last_seq, MAX(games) as games
+        FROM runs
+        GROUP BY player_id, won, run
+    )
+    SELECT player_id,
+           MAX(CASE WHEN last_seq = games THEN length END) as current_length,
+           MAX(CASE WHEN last_seq = games THEN won END) as current_won,
+           MAX(CASE WHEN won = 1 THEN length ELSE 0 END) as longest_win_streak,
+           MAX(CASE WHEN won = 0 THEN length ELSE 0 END) as longest_loss_streak
+    FROM lengths
+    GROUP BY player_id
+"""
+
+# Wins and losses against each opponent
+HEAD_TO_HEAD_QUERY = f"""
+    SELECT r.player_id, r.opponent_id, o.first_name || ' ' || o.last_name as name,
+           SUM(r.won) as wins_against_them,
+           COUNT(*) - SUM(r.won) as losses_to_them,
+           COUNT(*) as total_games
+    FROM ({PLAYER_RESULTS}) r
+    JOIN players o ON o.id = r.opponent_id
+    {{where}}
+    GROUP BY r.player_id, r.opponent_id, o.first_name, o.last_name
+"""
+
+
+def empty_player_stats():
+    """Stats of a player with no games"""
+    return {
+        'wins': 0, 'losses': 0, 'total_games': 0, 'win_percentage': 0,
+        'skunks_given': 0, 'skunks_received': 0,
+        'double_skunks_given': 0, 'double_skunks_received': 0,
+        'avg_winning_score': 0, 'avg_losing_score': 0,
+        'recent_form': '0/0', 'recent_wins': 0, 'recent_games_count': 0,
+        'current_streak': '0', 'longest_win_streak': 0, 'longest_loss_streak': 0,
+        'favorite_opponent': None
+    }
+
+
+def _player_filter(player_ids, *conditions):
+    """WHERE clause and params limiting PLAYER_RESULTS to player_ids (None = everyone)"""
+    conditions = list(conditions)
+    params = []
+    if player_ids is not None:
+        conditions.append(f"r.player_id IN ({', '.join('?' for _ in player_ids)})")
+        params = list(player_ids)
+    return ("WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def player_streaks(execute_query, player_ids=None, source=PLAYER_RESULTS):
+    """Streaks keyed by player ID: current_streak ('3W', '2L'), longest_win_streak
+    and longest_loss_streak, counted over every game a player has played.
+
+    Players without games are left out. source can swap in
+    PARTICIPANT_RESULTS where the game_participants table is kept.
+    """
+    if player_ids is not None:
+        player_ids = list(dict.fromkeys(player_ids))
+        if not player_ids:
+            return {}
+    where, params = _player_filter(player_ids)
+    streaks = {}
+    for row in execute_query(STREAKS_QUERY.format(source=source, where=where), params, fetch=True):
+        streaks[row['player_id']] = {
+            'current_streak': f"{row['current_length']}{'W' if row['current_won'] else 'L'}",
+            'longest_win_streak': row['longest_win_streak'],
+            'longest_loss_streak': row['longest_loss_streak'],
+        }
+    return streaks
+
+
+def player_stats_batch(execute_query, player_ids=None, matrix=None, streak_source=PLAYER_RESULTS):
+    """Full stats for many players at once, keyed by player ID.
+
+    Returns the same dict calculate_player_stats() always has. With
+    player_ids, every requested player gets an entry (empty stats if they
+    have not played). Without it, every player who has played does.
+
+    Pass a loaded HeadToHeadMatrix as matrix to take favorite opponents from
+    it instead of the head-to-head query, and PARTICIPANT_RESULTS as streak_source
+    to count streaks from game_participants.
+    """
+    if player_ids is not None:
+        player_ids = list(dict.fromkeys(player_ids))
+        if not player_ids:
+            return {}
+
+    where, params = _player_filter(player_ids)
+    stats = {player_id: empty_player_stats() for player_id in (player_ids or [])}
+
+    for row in execute_query(PLAYER_TOTALS_QUERY.format(where=where), params, fetch=True):
+        entry = stats.setdefault(row['player_id'], empty_player_stats())
+        wins, losses = row['wins'], row['losses']
+        entry.update({
+            'wins': wins,
+            'losses': losses,
+            'total_games': wins + losses,
+            'win_percentage': round((wins / (wins + losses) * 100), 1) if (wins + losses) > 0 else 0,
+            'skunks_given': row['skunks_given'],
+            'skunks_received': row['skunks_received'],
+            'double_skunks_given': row['double_skunks_given'],
+            'double_skunks_received': row['double_skunks_received'],
+            'avg_winning_score': round(row['avg_winning_score'] or 0, 1),
+            'avg_losing_score': round(row['avg_losing_score'] or 0, 1),
+        })
+
+    recent = {}
+    for row in execute_query(RECENT_RESULTS_QUERY.format(where=where), params, fetch=True):
+        recent.setdefault(row['player_id'], []).append('W' if row['won'] else 'L')
+    for player_id, results in recent.items():
+        entry = stats.setdefault(player_id, empty_player_stats())
+        recent_wins = results.count('W')
+        entry.update({
+            'recent_form': f"{recent_wins}/{len(results)}",
+            'recent_wins': recent_wins,
+            'recent_games_count': len(results),
+        })
+
+    for player_id, streaks in player_streaks(execute_query, player_ids, streak_source).items():
+        stats.setdefault(player_id, empty_player_stats()).update(streaks)
+
+    if matrix is not None:
+        favorites = {player_id: matrix.favorite_opponent(player_id) for player_id in stats}
+        names = player_names(execute_query, [f['id'] for f in favorites.values() if f])
+        for player_id, favorite in favorites.items():
+            stats[player_id]['favorite_opponent'] = with_name(favorite, names)
+        return stats
+
+    # Favorite opponent: the one beaten most often, then the one played most
+    favorites = {}
+    h2h_where, h2h_params = _player_filter(player_ids, "r.player_id <> r.opponent_id")
+    for row in execute_query(HEAD_TO_HEAD_QUERY.format(where=h2h_where), h2h_params, fetch=True):
+        if row['wins_against_them'] <= 0:
+            continue
+        key = (row['wins_against_them'], row['total_games'], -row['opponent_id'])
+        best = favorites.get(row['player_id'])
+        if best is None or key > best[0]:
+            favorites[row['player_id']] = (key, row)
+    for player_id, (_, opp) in favorites.items():
+        stats.setdefault(player_id, empty_player_stats())['favorite_opponent'] = {
+            'id': opp['opponent_id'],
+            'name': opp['name'],
+            'wins_against_them': opp['wins_against_them'],
+            'losses_to_them': opp['losses_to_them'],
+            'total_games': opp['total_games'],
+            'win_rate_against': round((opp['wins_against_them'] / opp['total_games'] * 100), 1) if opp['total_games'] > 0 else 0
+        }
+
+    return stats
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Precomputed player statistics for Cribbage Board Collection
+player_stats holds each player's totals and player_pair_stats their record
+against each opponent. Both are kept current inside the same transaction as
+every game add, edit and delete, so the stats pages read a few summary rows
+instead of scanning the games table.
+
+rebuild() recomputes both tables from games and check() reports any drift
+(see scripts/rebuild_stats.py).
+"""
+
+try:
+    from stats_engine import PLAYER_RESULTS
+    from game_events import as_id, skunk_class
+except ImportError:
+    from app.stats_engine import PLAYER_RESULTS
+    from app.game_events import as_id, skunk_class
+
+# Same columns in both tables; a double skunk also counts as a skunk
+COUNTER_COLUMNS = ('wins', 'losses', 'skunks_given', 'skunks_received',
+                   'double_skunks_given', 'double_skunks_received')
+PLAYER_COLUMNS = COUNTER_COLUMNS + ('winning_score_total', 'losing_score_total')
+
+# INTEGER columns and composite keys read the same in SQLite and PostgreSQL
+SUMMARY_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS player_stats (
+      player_id INTEGER PRIMARY KEY,
+      wins INTEGER NOT NULL DEFAULT 0,
+      losses INTEGER NOT NULL DEFAULT 0,
+      skunks_given INTEGER NOT NULL DEFAULT 0,
+      skunks_received INTEGER NOT NULL DEFAULT 0,
+      double_skunks_given INTEGER NOT NULL DEFAULT 0,
+      double_skunks_received INTEGER NOT NULL DEFAULT 0,
+      winning_score_total INTEGER NOT NULL DEFAULT 0,
+      losing_score_total INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS player_pair_stats (
+      player_id INTEGER NOT NULL,
+      opponent_id INTEGER NOT NULL,
+      wins INTEGER NOT NULL DEFAULT 0,
+      losses INTEGER NOT NULL DEFAULT 0,
+      skunks_given INTEGER NOT NULL DEFAULT 0,
+      skunks_received INTEGER NOT NULL DEFAULT 0,
+      double_skunks_given INTEGER NOT NULL DEFAULT 0,
+      double_skunks_received INTEGER NOT NULL DEFAULT 0,
+      PRIMARY KEY (player_id, opponent_id)
+    )
+    """,
+]
+
+_SKUNK = "r.skunk_class > 0"
+_DOUBLE_SKUNK = "r.skunk_class = 2"
+_COUNTERS_SQL = f"""
+           SUM(r.won) as wins,
+           COUNT(*) - SUM(r.won) as losses,
+           SUM(CASE WHEN r.won = 1 AND {_SKUNK} THEN 1 ELSE 0 END) as skunks_given,
+           SUM(CASE WHEN r.won = 0 AND {_SKUNK} THEN 1 ELSE 0 END) as skunks_received,
+           SUM(CASE WHEN r.won = 1 AND {_DOUBLE_SKUNK} THEN 1 ELSE 0 END) as double_skunks_given,
+           SUM(CASE WHEN r.won = 0 AND {_DOUBLE_SKUNK} THEN 1 ELSE 0 END) as double_skunks_received"""
+
+# What the tables should hold, computed from games
+PLAYER_TOTALS_FROM_GAMES = f"""
+    SELECT r.player_id,{_COUNTERS_SQL},
+           SUM(CASE WHEN r.won = 1 THEN COALESCE(r.winner_score, 0) ELSE 0 END) as winning_score_total,
+           SUM(CASE WHEN r.won = 0 THEN COALESCE(r.loser_score, 0) ELSE 0 END) as losing_score_total
+    FROM ({PLAYER_RESULTS}) r
+    WHERE r.player_id IS NOT NULL
+    GROUP BY r.player_id
+"""
+
+PAIR_TOTALS_FROM_GAMES = f"""
+    SELECT r.player_id, r.opponent_id,{_COUNTERS_SQL}
+    FROM ({PLAYER_RESULTS}) r
+    WHERE r.player_id IS NOT NULL AND r.opponent_id IS NOT NULL AND r.player_id <> r.opponent_id
+    GROUP BY r.player_id, r.opponent_id
+"""
+
+# Leaderboard rows in the shape stats_engine.build_leaderboard() expects
+LEADERBOARD_QUERY = """
+    SELECT p.id, p.first_name, p.last_name, p.photo,
+           s.wins, s.losses, s.wins + s.losses as total_games,
+           s.skunks_given, s.skunks_received, s.double_skunks_given, s.double_skunks_received
+    FROM player_stats s
+    JOIN players p ON p.id = s.player_id
+    WHERE s.wins + s.losses > 0
+"""
+
+# The head-to-head matrix's load query, answered from the pair table
+PAIR_MATRIX_QUERY = """
+    SELECT player_id as winner_id, opponent_id as loser_id, wins as games,
+           skunks_given as skunks, double_skunks_given as double_skunks
+    FROM player_pair_stats
+    WHERE wins > 0
+"""
+
+
+def _upsert(table, key_columns, columns):
+    """INSERT that adds to the existing row's counters on conflict"""
+    all_columns = key_columns + columns
+    updates = ', '.join(f"{c} = {table}.{c} + excluded.{c}" for c in columns)
+    return (f"INSERT INTO {table} ({', '.join(all_columns)}) "
+            f"VALUES ({', '.join('?' for _ in all_columns)}) "
+            f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET {updates}")
+
+PLAYER_UPSERT = _upsert('player_stats', ('player_id',), PLAYER_COLUMNS)
+PAIR_UPSERT = _upsert('player_pair_stats', ('player_id', 'opponent_id'), COUNTER_COLUMNS)
+
+
+def _score(value):
+    if value is None or value == '':
+        return 0
+    return int(value)
+
+
+def _apply(execute_query, game, sign):
+    """Add (sign=1) or back out (sign=-1) one game's counts"""
+    winner_id = as_id(game.get('winner_id'))
+    loser_id = as_id(game.get('loser_id'))
+    skunk = sign * int(skunk_class(game) > 0)
+    double_skunk = sign * int(skunk_class(game) == 2)
+
+    won = (sign, 0, skunk, 0, double_skunk, 0)
+    lost = (0, sign, 0, skunk, 0, double_skunk)
+    if winner_id is not None:
+        execute_query(PLAYER_UPSERT, [winner_id, *won, sign * _score(game.get('winner_score')), 0])
+    if loser_id is not None:
+        execute_query(PLAYER_UPSERT, [loser_id, *lost, 0, sign * _score(game.get('loser_score'))])
+    if winner_id is not None and loser_id is not None and winner_id != loser_id:
+        execute_query(PAIR_UPSERT, [winner_id, loser_id, *won])
+        execute_query(PAIR_UPSERT, [loser_id, winner_id, *lost])
+    return [player_id for player_id in (winner_id, loser_id) if player_id is not None]
+
+
+def apply_change(execute_query, old_game, new_game):
+    """Move the summary tables from old_game to new_game.
+
+    old_game is None for a new game and new_game is None for a deleted one;
+    an edit backs the old values out and applies the new ones. Call it in
+    the same transaction as the write to games.
+    """
+    touched = set()
+    if old_game is not None:
+        touched.update(_apply(execute_query, dict(old_game), -1))
+    if new_game is not None:
+        touched.update(_apply(execute_query, dict(new_game), 1))
+
+    # Players and pairs whose only games were backed out drop out again
+    for player_id in touched:
+        execute_query("DELETE FROM player_stats WHERE player_id = ? AND wins = 0 AND losses = 0", [player_id])
+        execute_query("DELETE FROM player_pair_stats WHERE player_id = ? AND wins = 0 AND losses = 0", [player_id])
+        execute_query("DELETE FROM player_pair_stats WHERE opponent_id = ? AND wins = 0 AND losses = 0", [player_id])
+
+
+def create_tables(execute_query):
+    for statement in SUMMARY_SCHEMA:
+        execute_query(statement)
+
+
+def rebuild(execute_query):
+    """Recompute both tables from games. Run it inside a transaction."""
+    execute_query("DELETE FROM player_stats")
+    execute_query("DELETE FROM player_pair_stats")
+    execute_query(f"INSERT INTO player_stats (player_id, {', '.join(PLAYER_COLUMNS)}) {PLAYER_TOTALS_FROM_GAMES}")
+    execute_query(f"INSERT INTO player_pair_stats (player_id, opponent_id, {', '.join(COUNTER_COLUMNS)}) {PAIR_TOTALS_FROM_GAMES}")
+
+
+def needs_rebuild(execute_query):
+    """True when there are games but nothing has been summarized yet"""
+    summarized = execute_query("SELECT COUNT(*) as count FROM player_stats", fetch=True)[0]['count']
+    if summarized:
+        return False
+    return execute_query("SELECT COUNT(*) as count FROM games", fetch=True)[0]['count'] > 0
+
+
+def _by_key(rows, key_columns, columns):
+    return {tuple(row[k] for k in key_columns): tuple(row[c] for c in columns) for row in rows}
+
+
+def check(execute_query):
+    """Differences between the summary tables and games, as readable lines (empty = consistent)"""
+    problems = []
+    for table, key_columns, columns, expected_query in (
+            ('player_stats', ('player_id',), PLAYER_COLUMNS, PLAYER_TOTALS_FROM_GAMES),
+            ('player_pair_stats', ('player_id', 'opponent_id'), COUNTER_COLUMNS, PAIR_TOTALS_FROM_GAMES)):
+        expected = _by_key(execute_query(expected_query, fetch=True), key_columns, columns)
+        actual = _by_key(execute_query(f"SELECT * FROM {table}", fetch=True), key_columns, columns)
+        for key in sorted(set(expected) | set(actual)):
+            if expected.get(key) != actual.get(key):
+                problems.append(f"{table} {dict(zip(key_columns, key))}: "
+                                f"expected {expected.get(key)}, found {actual.get(key)}")
+    return problems
+
+
+def player_summary(execute_query, player_id):
+    """The player's totals from player_stats, in the shape player_detail.html uses"""
+    rows = execute_query("SELECT * FROM player_stats WHERE player_id = ?", [player_id], fetch=True)
+    stats = {column: (rows[0][column] if rows else 0) for column in PLAYER_COLUMNS}
+    stats['total_games'] = stats['wins'] + stats['losses']
+    stats['win_percentage'] = (stats['wins'] / stats['total_games'] * 100) if stats['total_games'] > 0 else 0
+    return stats
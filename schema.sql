@@ -27,7 +27,9 @@ CREATE TABLE boards (
   is_gift INTEGER DEFAULT 0,
   gifted_to TEXT,
   gifted_from TEXT,
-  in_collection INTEGER DEFAULT 1
+  in_collection INTEGER DEFAULT 1,
+  -- Generated from date (see app/date_columns.py)
+  board_date DATE GENERATED ALWAYS AS (CASE WHEN date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' THEN DATE(SUBSTR(date, 1, 10)) WHEN date GLOB '[0-9]/[0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date, 5, 4) || '-' || '0' || SUBSTR(date, 1, 1) || '-' || '0' || SUBSTR(date, 3, 1)) WHEN date GLOB '[0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date, 6, 4) || '-' || '0' || SUBSTR(date, 1, 1) || '-' || SUBSTR(date, 3, 2)) WHEN date GLOB '[0-9][0-9]/[0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date, 6, 4) || '-' || SUBSTR(date, 1, 2) || '-' || '0' || SUBSTR(date, 4, 1)) WHEN date GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date, 7, 4) || '-' || SUBSTR(date, 1, 2) || '-' || SUBSTR(date, 4, 2)) END) VIRTUAL
 );
 
 CREATE TABLE players (
@@ -48,7 +50,20 @@ CREATE TABLE games (
   is_skunk INTEGER DEFAULT 0,
   is_double_skunk INTEGER DEFAULT 0,
   date_played TEXT DEFAULT (DATE('now')),
+  -- Generated from date_played (see app/date_columns.py)
+  played_on DATE GENERATED ALWAYS AS (CASE WHEN date_played GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' THEN DATE(SUBSTR(date_played, 1, 10)) WHEN date_played GLOB '[0-9]/[0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date_played, 5, 4) || '-' || '0' || SUBSTR(date_played, 1, 1) || '-' || '0' || SUBSTR(date_played, 3, 1)) WHEN date_played GLOB '[0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date_played, 6, 4) || '-' || '0' || SUBSTR(date_played, 1, 1) || '-' || SUBSTR(date_played, 3, 2)) WHEN date_played GLOB '[0-9][0-9]/[0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date_played, 6, 4) || '-' || SUBSTR(date_played, 1, 2) || '-' || '0' || SUBSTR(date_played, 4, 1)) WHEN date_played GLOB '[0-9][0-9]/[0-9][0-9]/[0-9][0-9][0-9][0-9]' THEN DATE(SUBSTR(date_played, 7, 4) || '-' || SUBSTR(date_played, 1, 2) || '-' || SUBSTR(date_played, 4, 2)) END) VIRTUAL,
+  -- Generated from the scores and flags (see app/skunk_columns.py)
+  margin INTEGER GENERATED ALWAYS AS (winner_score - loser_score) VIRTUAL,
+  skunk_class INTEGER GENERATED ALWAYS AS (CASE WHEN is_double_skunk <> 0 THEN 2 WHEN is_skunk <> 0 THEN 1 ELSE 0 END) VIRTUAL,
   FOREIGN KEY (board_id) REFERENCES boards(id),
   FOREIGN KEY (winner_id) REFERENCES players(id),
   FOREIGN KEY (loser_id) REFERENCES players(id)
 );
+
+-- Skunked games only, for skunk leaderboards
+CREATE INDEX idx_games_skunks_by_winner ON games(winner_id, skunk_class) WHERE skunk_class > 0;
+CREATE INDEX idx_games_skunks_by_loser ON games(loser_id, skunk_class) WHERE skunk_class > 0;
+
+-- Typed dates, for date filters and newest-first lists
+CREATE INDEX idx_boards_board_date ON boards(board_date);
+CREATE INDEX idx_games_played_on ON games(played_on, id);
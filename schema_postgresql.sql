@@ -7,6 +7,25 @@ DROP TABLE IF EXISTS boards CASCADE;
 DROP TABLE IF EXISTS wood_types CASCADE;
 DROP TABLE IF EXISTS material_types CASCADE;
 
+-- Date text to DATE for the generated date columns (see app/date_columns.py)
+CREATE OR REPLACE FUNCTION iso_date(value TEXT) RETURNS DATE AS $$
+DECLARE
+  parts TEXT[];
+BEGIN
+  parts := regexp_match(value, '^(\d{4})-(\d{2})-(\d{2})');
+  IF parts IS NOT NULL THEN
+    RETURN make_date(parts[1]::INTEGER, parts[2]::INTEGER, parts[3]::INTEGER);
+  END IF;
+  parts := regexp_match(value, '^(\d{1,2})/(\d{1,2})/(\d{4})$');
+  IF parts IS NOT NULL THEN
+    RETURN make_date(parts[3]::INTEGER, parts[1]::INTEGER, parts[2]::INTEGER);
+  END IF;
+  RETURN NULL;
+EXCEPTION WHEN OTHERS THEN
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql IMMUTABLE;
+
 CREATE TABLE wood_types (
   id SERIAL PRIMARY KEY,
   name VARCHAR(255) UNIQUE NOT NULL
@@ -29,7 +48,9 @@ CREATE TABLE boards (
   is_gift INTEGER DEFAULT 0,
   gifted_to VARCHAR(255),
   gifted_from VARCHAR(255),
-  in_collection INTEGER DEFAULT 1
+  in_collection INTEGER DEFAULT 1,
+  -- Generated from date (see app/date_columns.py)
+  board_date DATE GENERATED ALWAYS AS (iso_date(date)) STORED
 );
 
 CREATE TABLE players (
@@ -50,6 +71,11 @@ CREATE TABLE games (
   is_skunk INTEGER DEFAULT 0,
   is_double_skunk INTEGER DEFAULT 0,
   date_played VARCHAR(255) DEFAULT CURRENT_DATE::TEXT,
+  -- Generated from date_played (see app/date_columns.py)
+  played_on DATE GENERATED ALWAYS AS (iso_date(date_played)) STORED,
+  -- Generated from the scores and flags (see app/skunk_columns.py)
+  margin INTEGER GENERATED ALWAYS AS (winner_score - loser_score) STORED,
+  skunk_class INTEGER GENERATED ALWAYS AS (CASE WHEN is_double_skunk <> 0 THEN 2 WHEN is_skunk <> 0 THEN 1 ELSE 0 END) STORED,
   FOREIGN KEY (board_id) REFERENCES boards(id) ON DELETE SET NULL,
   FOREIGN KEY (winner_id) REFERENCES players(id) ON DELETE CASCADE,
   FOREIGN KEY (loser_id) REFERENCES players(id) ON DELETE CASCADE
@@ -60,7 +86,11 @@ CREATE INDEX idx_boards_roman_number ON boards(roman_number);
 CREATE INDEX idx_boards_material_type ON boards(material_type);
 CREATE INDEX idx_boards_wood_type ON boards(wood_type);
 CREATE INDEX idx_boards_in_collection ON boards(in_collection);
+CREATE INDEX idx_boards_board_date ON boards(board_date);
 CREATE INDEX idx_games_board_id ON games(board_id);
 CREATE INDEX idx_games_winner_id ON games(winner_id);
 CREATE INDEX idx_games_loser_id ON games(loser_id);
 CREATE INDEX idx_games_date_played ON games(date_played);
+CREATE INDEX idx_games_played_on ON games(played_on, id);
+CREATE INDEX idx_games_skunks_by_winner ON games(winner_id, skunk_class) WHERE skunk_class > 0;
+CREATE INDEX idx_games_skunks_by_loser ON games(loser_id, skunk_class) WHERE skunk_class > 0;
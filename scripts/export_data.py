@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Export boards, players or games as CSV, NDJSON or JSON
+Uses DATABASE_URL when set (Railway), otherwise the local SQLite database
+
+Usage: python scripts/export_data.py games [csv|ndjson|json] [output file]
+"""
+
+import contextlib
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+# app_hybrid prints startup messages - keep them off stdout so it can be piped
+with contextlib.redirect_stdout(sys.stderr):
+    from app_hybrid import iter_query
+from data_export import EXPORT_FORMATS, export_query, iter_export
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        return 1
+
+    table = sys.argv[1]
+    fmt = sys.argv[2] if len(sys.argv) > 2 else 'csv'
+    output = sys.argv[3] if len(sys.argv) > 3 else None
+
+    try:
+        query = export_query(table)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    if fmt not in EXPORT_FORMATS:
+        print(f"❌ Unknown format: {fmt} (use {', '.join(EXPORT_FORMATS)})")
+        return 1
+
+    out = open(output, 'w', newline='', encoding='utf-8') if output else sys.stdout
+    try:
+        for chunk in iter_export(iter_query(query), fmt):
+            out.write(chunk)
+    finally:
+        if output:
+            out.close()
+    if output:
+        print(f"✅ Exported {table} to {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
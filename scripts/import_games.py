@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Import game history from a CSV or NDJSON file
+Uses DATABASE_URL when set (Railway), otherwise the local SQLite database
+
+Usage: python scripts/import_games.py games.csv [csv|ndjson]
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from app_hybrid import execute_query, bulk_insert, rebuild_game_tables
+from game_import import import_games_file
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__.strip())
+        return 1
+
+    path = sys.argv[1]
+    fmt = sys.argv[2] if len(sys.argv) > 2 else None
+    if not os.path.exists(path):
+        print(f"❌ File not found: {path}")
+        return 1
+
+    print(f"📥 Importing games from {path}...")
+    try:
+        result = import_games_file(path, execute_query, bulk_insert, fmt=fmt)
+    except Exception as e:
+        print(f"❌ Import failed: {e}")
+        return 1
+    finally:
+        # Batches already written count too - bring the tables kept from games up to date,
+        # which also tells running workers to reload their in-memory statistics
+        try:
+            rebuild_game_tables()
+        except Exception as e:
+            print(f"❌ Rebuilding tables kept from games failed: {e}")
+
+    for line_no, message in result.errors:
+        print(f"⚠️  Line {line_no}: {message}")
+    if result.skipped > len(result.errors):
+        print(f"⚠️  ... and {result.skipped - len(result.errors)} more bad rows")
+    print(f"✅ {result.imported} games imported, {result.skipped} rows skipped")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Rebuild the tables kept from games - the player_stats and player_pair_stats
+summaries, game_participants, the Elo ratings, the daily and monthly rollups,
+the board play stats and the player x board x month stats cube
+Uses DATABASE_URL when set (Railway), otherwise the local SQLite database
+
+Usage: python scripts/rebuild_stats.py [--check]
+  --check   only report differences between those tables and games
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from app_hybrid import execute_query, bulk_insert, transaction, rebuild_game_tables, IS_RAILWAY
+import game_tables
+
+
+def main():
+    check_only = '--check' in sys.argv[1:]
+    if any(arg != '--check' for arg in sys.argv[1:]):
+        print(__doc__.strip())
+        return 1
+
+    try:
+        game_tables.init(execute_query, bulk_insert, transaction, postgresql=IS_RAILWAY)
+        if not check_only:
+            print("🔄 Rebuilding tables kept from games...")
+            rebuild_game_tables()
+        problems = game_tables.check(execute_query)
+    except Exception as e:
+        print(f"❌ Failed: {e}")
+        return 1
+
+    for problem in problems:
+        print(f"⚠️  {problem}")
+    if problems:
+        print(f"❌ {len(problems)} rows out of step with games - run without --check to rebuild")
+        return 1
+    print("✅ Tables kept from games all match games")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
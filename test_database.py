@@ -0,0 +1,618 @@
+#!/usr/bin/env python3
+"""
+Unit Tests for the database layer (app/database.py and app_hybrid)
+Runs against SQLite so no PostgreSQL server is needed
+"""
+
+import os
+import sys
+import sqlite3
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+# Importing app_hybrid initializes its database - keep that off the developer's real one
+_import_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+_import_db.close()
+os.environ['SQLITE_DB_PATH'] = _import_db.name
+
+from database import (ConnectionPool, PoolTimeout, get_sqlite_connection, release_sqlite_connection,
+                      compile_sql, compile_insert, SQLITE, POSTGRESQL, PreparedStatementRegistry,
+                      compile_bulk_insert, iter_chunks, write_rows, stream_rows)
+import app_hybrid
+from data_export import iter_export
+from game_import import ImportResult
+
+
+def tearDownModule():
+    for path in (_import_db.name, _import_db.name + '-wal', _import_db.name + '-shm'):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+def sqlite_connect():
+    return sqlite3.connect(":memory:", check_same_thread=False)
+
+
+class TestCompileSQL(unittest.TestCase):
+
+    def test_postgresql_placeholders(self):
+        """? becomes %s for psycopg2, and literal % signs are escaped"""
+        compiled = compile_sql("SELECT * FROM boards WHERE id = ? AND LOWER(wood_type) LIKE '%oak%'", POSTGRESQL)
+        self.assertEqual(compiled.sql, "SELECT * FROM boards WHERE id = %s AND LOWER(wood_type) LIKE '%%oak%%'")
+        self.assertEqual(compiled.param_count, 1)
+
+    def test_quoted_question_marks_untouched(self):
+        """? inside strings, identifiers and comments is not a placeholder"""
+        compiled = compile_sql("SELECT 'why?' AS \"huh?\", id FROM games -- really?\nWHERE id = ?", POSTGRESQL)
+        self.assertEqual(compiled.sql, "SELECT 'why?' AS \"huh?\", id FROM games -- really?\nWHERE id = %s")
+        self.assertEqual(compiled.param_count, 1)
+
+    def test_sqlite_unchanged(self):
+        """Portable SQL is already SQLite SQL"""
+        query = "SELECT first_name || ' ' || last_name AS name FROM players WHERE id = ?"
+        self.assertEqual(compile_sql(query, SQLITE).sql, query)
+
+    def test_insert_detection(self):
+        """INSERT statements are flagged so execute_query returns the new ID"""
+        self.assertTrue(compile_sql("  insert into players (first_name) VALUES (?)", SQLITE).is_insert)
+        self.assertFalse(compile_sql("UPDATE players SET first_name = ?", SQLITE).is_insert)
+        self.assertTrue(compile_sql("INSERT INTO players (first_name) VALUES (?) RETURNING id", POSTGRESQL).returning)
+
+    def test_insert_or_ignore(self):
+        """INSERT OR IGNORE becomes ON CONFLICT DO NOTHING on PostgreSQL"""
+        compiled = compile_sql("INSERT OR IGNORE INTO wood_types (name) VALUES (?)", POSTGRESQL)
+        self.assertEqual(compiled.sql, "INSERT INTO wood_types (name) VALUES (%s) ON CONFLICT DO NOTHING")
+
+    def test_compile_insert(self):
+        """Inserts return their ID via RETURNING on PostgreSQL and lastrowid on SQLite"""
+        query = "INSERT INTO players (first_name, last_name) VALUES (?, ?)"
+        compiled = compile_insert(query, POSTGRESQL)
+        self.assertEqual(compiled.sql, "INSERT INTO players (first_name, last_name) VALUES (%s, %s) RETURNING id")
+        self.assertTrue(compiled.returning)
+        self.assertEqual(compiled.prepare_sql, "INSERT INTO players (first_name, last_name) VALUES ($1, $2) RETURNING id")
+        self.assertFalse(compile_insert(query, SQLITE).returning)
+        with self.assertRaises(ValueError):
+            compile_insert("UPDATE players SET first_name = ?", POSTGRESQL)
+
+    def test_cached(self):
+        """The same statement is only compiled once"""
+        query = "SELECT * FROM players WHERE id = ? /* cache test */"
+        first = compile_sql(query, POSTGRESQL)
+        self.assertIs(compile_sql(query, POSTGRESQL), first)
+
+
+class RecordingCursor:
+    """Stands in for a psycopg2 cursor and records the SQL it is given"""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def copy_expert(self, sql, file):
+        self.executed.append((sql, file.read()))
+
+
+class TestPreparedStatements(unittest.TestCase):
+
+    def test_prepare_sql(self):
+        """PostgreSQL statements get a $n version for PREPARE"""
+        compiled = compile_sql("SELECT * FROM games WHERE winner_id = ? OR loser_id = ?", POSTGRESQL)
+        self.assertEqual(compiled.prepare_sql, "SELECT * FROM games WHERE winner_id = $1 OR loser_id = $2")
+        self.assertIsNone(compile_sql("CREATE TABLE t (x INTEGER)", POSTGRESQL).prepare_sql)
+
+    def test_prepare_once_then_execute(self):
+        """The first call PREPAREs, later calls only EXECUTE"""
+        registry = PreparedStatementRegistry()
+        cursor = RecordingCursor()
+        compiled = compile_sql("SELECT * FROM players WHERE id = ?", POSTGRESQL)
+
+        registry.execute(cursor, compiled, [1])
+        registry.execute(cursor, compiled, [2])
+        self.assertEqual(cursor.executed, [
+            ("PREPARE crib_stmt_1 AS SELECT * FROM players WHERE id = $1", None),
+            ("EXECUTE crib_stmt_1 (%s)", [1]),
+            ("EXECUTE crib_stmt_1 (%s)", [2]),
+        ])
+
+    def test_evicts_least_recently_used(self):
+        """A full registry DEALLOCATEs its least recently used statement"""
+        registry = PreparedStatementRegistry(max_size=1)
+        cursor = RecordingCursor()
+        registry.execute(cursor, compile_sql("SELECT * FROM boards", POSTGRESQL), [])
+        registry.execute(cursor, compile_sql("SELECT * FROM players", POSTGRESQL), [])
+        self.assertIn(("DEALLOCATE crib_stmt_1", None), cursor.executed)
+        self.assertEqual(len(registry), 1)
+
+    def test_deallocate_after_session_reset(self):
+        """Evicting a statement the server already dropped neither raises nor aborts the transaction"""
+        class Gone(Exception):
+            pgcode = '26000'
+
+        class ResetCursor(RecordingCursor):
+            def execute(self, sql, params=None):
+                super().execute(sql, params)
+                if sql.startswith("DEALLOCATE"):
+                    raise Gone("prepared statement does not exist")
+
+        registry = PreparedStatementRegistry(max_size=2)
+        cursor = ResetCursor()
+        registry.execute(cursor, compile_sql("SELECT * FROM boards", POSTGRESQL), [])
+        registry.execute(cursor, compile_sql("SELECT * FROM players", POSTGRESQL), [])
+        registry.execute(cursor, compile_sql("SELECT * FROM games", POSTGRESQL), [])
+        self.assertIn(("ROLLBACK TO SAVEPOINT crib_deallocate", None), cursor.executed)
+        # The reset dropped every statement, so none are remembered but the new one
+        self.assertEqual(len(registry), 1)
+        self.assertEqual(cursor.executed[-1], ("EXECUTE crib_stmt_3", []))
+
+
+class TestBulkWrites(unittest.TestCase):
+
+    def test_compile_bulk_insert(self):
+        """Plain inserts, skip-existing and upserts for both databases"""
+        self.assertEqual(compile_bulk_insert('players', ('first_name', 'last_name'), SQLITE),
+                         "INSERT INTO players (first_name, last_name) VALUES (?, ?)")
+        self.assertEqual(compile_bulk_insert('wood_types', ('name',), POSTGRESQL, ('name',)),
+                         "INSERT INTO wood_types (name) VALUES %s ON CONFLICT (name) DO NOTHING")
+        self.assertEqual(compile_bulk_insert('boards', ('roman_number', 'description'), SQLITE,
+                                             ('roman_number',), ('description',)),
+                         "INSERT INTO boards (roman_number, description) VALUES (?, ?) "
+                         "ON CONFLICT (roman_number) DO UPDATE SET description = excluded.description")
+
+    def test_rejects_bad_identifiers(self):
+        with self.assertRaises(ValueError):
+            compile_bulk_insert('players; DROP TABLE games', ('first_name',), SQLITE)
+
+    def test_iter_chunks(self):
+        self.assertEqual(list(iter_chunks(iter(range(5)), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(iter_chunks([], 2)), [])
+
+    def test_postgresql_copy(self):
+        """Plain inserts go through COPY with NULLs, flags and control characters encoded"""
+        cursor = RecordingCursor()
+        count = write_rows(cursor, POSTGRESQL, 'games', ('winner_score', 'is_skunk', 'notes'),
+                           [(121, True, None), {'winner_score': 121, 'is_skunk': False, 'notes': 'tab\there\nback\\slash'}])
+        self.assertEqual(count, 2)
+        sql, data = cursor.executed[0]
+        self.assertEqual(sql, "COPY games (winner_score, is_skunk, notes) FROM STDIN")
+        self.assertEqual(data, "121\t1\t\\N\n121\t0\ttab\\there\\nback\\\\slash\n")
+
+    def test_postgresql_upsert_converts_flags(self):
+        """Upserts go through execute_values with bools sent as 0/1, like COPY"""
+        with patch('psycopg2.extras.execute_values') as execute_values:
+            write_rows(RecordingCursor(), POSTGRESQL, 'games', ('id', 'is_skunk'),
+                       [(1, True), {'id': 2, 'is_skunk': False}], conflict_columns=['id'], update_columns=['is_skunk'])
+        values = execute_values.call_args[0][2]
+        self.assertEqual(values, [(1, 1), (2, 0)])
+        self.assertEqual({type(flag) for _, flag in values}, {int})
+
+    def test_sqlite_executemany(self):
+        conn = sqlite_connect()
+        conn.execute("CREATE TABLE wood_types (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL)")
+        cursor = conn.cursor()
+        write_rows(cursor, SQLITE, 'wood_types', ['name'], [('Oak',), ('Maple',)])
+        write_rows(cursor, SQLITE, 'wood_types', ['name'], [('Oak',), ('Walnut',)], conflict_columns=['name'])
+        names = [row[0] for row in conn.execute("SELECT name FROM wood_types ORDER BY id")]
+        self.assertEqual(names, ['Oak', 'Maple', 'Walnut'])
+
+    def test_sqlite_upsert(self):
+        """Existing rows are updated in place when update_columns are given"""
+        conn = sqlite_connect()
+        conn.execute("CREATE TABLE boards (roman_number TEXT PRIMARY KEY, description TEXT)")
+        cursor = conn.cursor()
+        write_rows(cursor, SQLITE, 'boards', ('roman_number', 'description'), [('I', 'Old'), ('II', 'Two')])
+        write_rows(cursor, SQLITE, 'boards', ('roman_number', 'description'),
+                   [{'roman_number': 'I', 'description': 'New'}],
+                   conflict_columns=['roman_number'], update_columns=['description'])
+        rows = conn.execute("SELECT roman_number, description FROM boards ORDER BY roman_number").fetchall()
+        self.assertEqual(rows, [('I', 'New'), ('II', 'Two')])
+
+    def test_wrong_row_length(self):
+        with self.assertRaises(ValueError):
+            write_rows(RecordingCursor(), POSTGRESQL, 'players', ('first_name', 'last_name'), [('Alice',)])
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_sqlite_stream_rows(self):
+        """Rows come out in itersize batches without fetchall()"""
+        conn = sqlite_connect()
+        conn.row_factory = sqlite3.Row
+        conn.execute("CREATE TABLE players (id INTEGER PRIMARY KEY, first_name TEXT)")
+        conn.executemany("INSERT INTO players (first_name) VALUES (?)", [(f'P{i}',) for i in range(25)])
+        rows = stream_rows(conn, SQLITE, "SELECT * FROM players WHERE id > ? ORDER BY id", [5], itersize=10)
+        self.assertEqual([row['id'] for row in rows], list(range(6, 26)))
+
+    def test_export_formats(self):
+        rows = [{'id': 1, 'name': 'Oak, red'}, {'id': 2, 'name': None}]
+        self.assertEqual(''.join(iter_export(iter(rows), 'csv')), 'id,name\r\n1,"Oak, red"\r\n2,\r\n')
+        self.assertEqual(''.join(iter_export(iter(rows), 'ndjson')),
+                         '{"id": 1, "name": "Oak, red"}\n{"id": 2, "name": null}\n')
+        self.assertEqual(''.join(iter_export(iter(rows), 'json')),
+                         '[{"id": 1, "name": "Oak, red"},{"id": 2, "name": null}]\n')
+        self.assertEqual(''.join(iter_export(iter([]), 'json')), '[]\n')
+
+    def test_export_chunks(self):
+        rows = ({'id': i} for i in range(10))
+        self.assertEqual(len(list(iter_export(rows, 'ndjson', rows_per_chunk=4))), 3)
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_reuses_connections(self):
+        """A returned connection is handed out again instead of reconnecting"""
+        pool = ConnectionPool(sqlite_connect, min_size=0, max_size=2)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIs(pool.getconn(), conn)
+
+        stats = pool.stats()
+        self.assertEqual(stats['connections_created'], 1)
+        self.assertEqual(stats['checkouts'], 2)
+        self.assertEqual(stats['in_use'], 1)
+
+    def test_bounded(self):
+        """The pool never opens more than max_size connections"""
+        pool = ConnectionPool(sqlite_connect, min_size=0, max_size=1, timeout=0.05)
+        conn = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+        # A waiting thread gets the connection as soon as it is returned
+        borrowed = []
+        pool.timeout = 5
+        waiter = threading.Thread(target=lambda: borrowed.append(pool.getconn()))
+        waiter.start()
+        pool.putconn(conn)
+        waiter.join()
+        self.assertIs(borrowed[0], conn)
+
+    def test_max_lifetime(self):
+        """Connections older than max_lifetime are closed instead of reused"""
+        pool = ConnectionPool(sqlite_connect, min_size=0, max_size=2, max_lifetime=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        self.assertIsNot(pool.getconn(), conn)
+        self.assertEqual(pool.stats()['recycled'], 1)
+
+    def test_health_check(self):
+        """Idle connections that fail SELECT 1 are replaced"""
+        pool = ConnectionPool(sqlite_connect, min_size=0, max_size=2, health_check_idle=0)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        conn.close()  # simulate the server dropping the connection
+
+        fresh = pool.getconn()
+        self.assertIsNot(fresh, conn)
+        fresh.execute("SELECT 1")
+        stats = pool.stats()
+        self.assertEqual(stats['health_check_failures'], 1)
+        self.assertEqual(stats['connections_created'], 2)
+
+    def test_connection_context_manager(self):
+        """connection() returns the connection and rolls back uncommitted work"""
+        pool = ConnectionPool(sqlite_connect, min_size=1, max_size=1)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE t (x INTEGER)")
+            conn.commit()
+            conn.execute("INSERT INTO t VALUES (1)")
+        self.assertEqual(pool.stats()['in_use'], 0)
+
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+
+class TestSQLiteConnections(unittest.TestCase):
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, 'database.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_tuned_connection(self):
+        """Cached connections have WAL and the other PRAGMAs applied"""
+        conn = get_sqlite_connection(self.db_path)
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2)   # MEMORY
+        self.assertEqual(conn.execute("PRAGMA cache_size").fetchone()[0], -16000)
+        # Foreign keys stay unenforced, as before, so deleting a board or player with games still works
+        self.assertEqual(conn.execute("PRAGMA foreign_keys").fetchone()[0], 0)
+
+    def test_cached_per_thread(self):
+        """The same thread gets the same connection, other threads get their own"""
+        conn = get_sqlite_connection(self.db_path)
+        self.assertIs(get_sqlite_connection(self.db_path), conn)
+
+        other = []
+        worker = threading.Thread(target=lambda: other.append(get_sqlite_connection(self.db_path)))
+        worker.start()
+        worker.join()
+        self.assertIsNot(other[0], conn)
+
+    def test_release_rolls_back(self):
+        """Releasing a connection discards uncommitted work but keeps it open"""
+        conn = get_sqlite_connection(self.db_path)
+        conn.execute("CREATE TABLE IF NOT EXISTS t (x INTEGER)")
+        conn.execute("INSERT INTO t VALUES (1)")
+        release_sqlite_connection(conn)
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM t").fetchone()[0], 0)
+
+
+class TestRequestScope(unittest.TestCase):
+    """Request-scoped connections and transaction() in app_hybrid"""
+
+    def setUp(self):
+        self.test_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+        self.test_db.close()
+        self.opened = []
+
+        def get_test_db():
+            conn = sqlite3.connect(self.test_db.name)
+            conn.row_factory = sqlite3.Row
+            self.opened.append(conn)
+            return conn
+
+        patcher = patch.object(app_hybrid, 'get_db', get_test_db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        app_hybrid.init_database()
+        app_hybrid.head_to_head.reset()
+        app_hybrid.score_distribution.reset()
+        self.opened.clear()
+
+    def tearDown(self):
+        try:
+            os.unlink(self.test_db.name)
+        except OSError:
+            pass
+
+    def count_players(self):
+        return app_hybrid.execute_query("SELECT COUNT(*) as count FROM players", fetch=True)[0]['count']
+
+    def test_one_connection_per_request(self):
+        """Every query in a request shares the connection kept on flask.g"""
+        with app_hybrid.app.test_request_context('/'):
+            app_hybrid.execute_query("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+            self.assertEqual(self.count_players(), 1)
+            self.assertEqual(self.count_players(), 1)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_transaction_rolls_back(self):
+        """An exception inside transaction() undoes every write in the block"""
+        with app_hybrid.app.test_request_context('/'):
+            with self.assertRaises(RuntimeError):
+                with app_hybrid.transaction():
+                    app_hybrid.execute_query("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+                    raise RuntimeError("boom")
+            self.assertEqual(self.count_players(), 0)
+
+    def test_execute_insert_returns_id(self):
+        """execute_insert() hands back the new row's ID"""
+        first = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+        second = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        self.assertEqual(second, first + 1)
+
+    def test_transaction_outside_request(self):
+        """Outside a request a transaction still uses a single connection"""
+        with app_hybrid.transaction():
+            app_hybrid.execute_query("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+            app_hybrid.execute_query("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(self.count_players(), 2)
+
+    def test_game_tables_init_is_all_or_nothing(self):
+        """A failure part way through creating the tables kept from games leaves none of them built"""
+        app_hybrid.execute_query("INSERT INTO players (first_name, last_name) VALUES ('Alice', 'Smith'), ('Bob', 'Jones')")
+        app_hybrid.execute_query("INSERT INTO games (winner_id, loser_id, loser_score) VALUES (1, 2, 100)")
+        app_hybrid.execute_query("DROP TABLE player_stats")
+        app_hybrid.execute_query("DELETE FROM game_participants")
+
+        with patch.object(app_hybrid.game_tables.stats_cube, 'create_tables', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                app_hybrid.game_tables.init(app_hybrid.execute_query, app_hybrid.bulk_insert, app_hybrid.transaction)
+        tables = {row['name'] for row in app_hybrid.execute_query("SELECT name FROM sqlite_master", fetch=True)}
+        self.assertNotIn('player_stats', tables)
+        self.assertEqual(app_hybrid.execute_query("SELECT COUNT(*) as count FROM game_participants", fetch=True)[0]['count'], 0)
+
+        app_hybrid.game_tables.init(app_hybrid.execute_query, app_hybrid.bulk_insert, app_hybrid.transaction)
+        self.assertEqual(app_hybrid.game_tables.check(app_hybrid.execute_query), [])
+
+    def count_wood_types(self):
+        return app_hybrid.execute_query("SELECT COUNT(*) as count FROM wood_types", fetch=True)[0]['count']
+
+    def test_bulk_insert_commits_per_chunk(self):
+        """A failing chunk only loses itself - earlier chunks are already committed"""
+        before = self.count_wood_types()
+        rows = [(f'Wood {i}',) for i in range(5)] + [(None,)]
+        with self.assertRaises(sqlite3.IntegrityError):
+            app_hybrid.bulk_insert('wood_types', ('name',), iter(rows), chunk_size=2)
+        self.assertEqual(self.count_wood_types(), before + 4)
+
+    def test_bulk_insert_in_transaction(self):
+        """Inside transaction() a failed bulk insert rolls back with everything else"""
+        before = self.count_wood_types()
+        rows = [(f'Wood {i}',) for i in range(5)] + [(None,)]
+        with self.assertRaises(sqlite3.IntegrityError):
+            with app_hybrid.transaction():
+                app_hybrid.execute_query("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+                app_hybrid.bulk_insert('wood_types', ('name',), rows, chunk_size=2)
+        self.assertEqual(self.count_wood_types(), before)
+        self.assertEqual(self.count_players(), 0)
+
+    def test_import_status_is_json(self):
+        """Import progress is served as JSON, so values echoed from the file can't inject HTML"""
+        result = ImportResult()
+        result.add_error(2, "Unknown winner: <script>alert(1)</script>")
+        job_id = app_hybrid.import_jobs.add(result)
+        response = app_hybrid.app.test_client().get(f'/import_games/{job_id}')
+        self.assertEqual(response.mimetype, 'application/json')
+        self.assertEqual(response.get_json()['errors'], [[2, "Unknown winner: <script>alert(1)</script>"]])
+        self.assertEqual(app_hybrid.app.test_client().get('/import_games/nope').status_code, 404)
+
+    def test_export_route_streams(self):
+        """/export streams the joined games view from its own connection"""
+        alice = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+        bob = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        app_hybrid.execute_query("INSERT INTO games (winner_id, loser_id, date_played) VALUES (?, ?, ?)",
+                                 [alice, bob, '2024-01-01'])
+
+        response = app_hybrid.app.test_client().get('/export/games.csv')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_streamed)
+        lines = response.get_data(as_text=True).splitlines()
+        self.assertTrue(lines[0].startswith('id,date_played,board_id,roman_number,winner_id,winner'))
+        self.assertIn('Alice Smith', lines[1])
+        self.assertIn('Bob Jones', lines[1])
+
+        self.assertEqual(app_hybrid.app.test_client().get('/export/secrets.csv').status_code, 404)
+        self.assertEqual(app_hybrid.app.test_client().get('/export/games.xml').status_code, 404)
+
+    def test_lazy_rows(self):
+        """Lazy rows can be truth-tested, looped over twice, and are empty when there are none"""
+        query = "SELECT first_name FROM players ORDER BY id"
+        self.assertFalse(app_hybrid.execute_query(query, fetch=True, lazy=True))
+        app_hybrid.bulk_insert('players', ('first_name', 'last_name'), [(f'P{i}', 'X') for i in range(5)])
+
+        rows = app_hybrid.execute_query(query, fetch=True, lazy=True)
+        rows.itersize = 2
+        self.assertTrue(rows)
+        names = [row['first_name'] for row in rows]
+        self.assertEqual(names, ['P0', 'P1', 'P2', 'P3', 'P4'])
+        self.assertEqual([row['first_name'] for row in rows], names)
+
+    def test_lazy_rows_are_not_prepared(self):
+        """Asking for lazy rows from a prepared statement is an error, not a silent unprepared query"""
+        with self.assertRaises(ValueError):
+            app_hybrid.execute_query("SELECT id FROM players", fetch=True, lazy=True, prepare=True)
+
+    def test_list_pages_render(self):
+        """/, /games and /stats render from projected and lazy queries"""
+        alice = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+        bob = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        board = app_hybrid.execute_insert("INSERT INTO boards (roman_number, description) VALUES (?, ?)", ['XIV', 'x' * 500])
+
+        client = app_hybrid.app.test_client()
+        client.post('/add_game', data={'board_id': board, 'winner_id': alice, 'loser_id': bob, 'date_played': '2024-01-01'})
+        index = client.get('/').get_data(as_text=True)
+        self.assertIn('Board XIV', index)
+        self.assertIn('x' * 100 + '...', index)
+        self.assertNotIn('x' * 101, index)
+        self.assertIn('Alice Smith', client.get('/games').get_data(as_text=True))
+        self.assertIn('Alice', client.get('/stats').get_data(as_text=True))
+
+    def test_list_pages_query_once(self):
+        """Each list query runs once per render - / gets a list because index.html loops over it twice"""
+        app_hybrid.execute_insert("INSERT INTO boards (roman_number) VALUES (?)", ['XIV'])
+        streamed = []
+
+        def counting_stream_rows(conn, dialect, query, *args):
+            streamed.append(query)
+            return stream_rows(conn, dialect, query, *args)
+
+        client = app_hybrid.app.test_client()
+        with patch.object(app_hybrid, 'stream_rows', counting_stream_rows):
+            client.get('/')
+            self.assertEqual(streamed, [])
+            client.get('/games')
+            self.assertEqual(len(streamed), 1)
+
+    def test_board_list_newest_first_by_typed_date(self):
+        """/ orders boards by board_date, so MM/DD/YYYY dates sort by year; undated boards come last"""
+        for roman_number, date in (('I', '12/01/2021'), ('II', ''), ('III', '01/15/2023'), ('IV', '2022-06-30')):
+            app_hybrid.execute_insert("INSERT INTO boards (roman_number, date) VALUES (?, ?)", [roman_number, date])
+        index = app_hybrid.app.test_client().get('/').get_data(as_text=True)
+        positions = [index.index(f'data-name="{roman_number}"') for roman_number in ('iii', 'iv', 'i', 'ii')]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_columnar_stats_follow_writes(self):
+        """Enabled game columns serve /stats, are patched by game routes and reload after another worker's write"""
+        app_hybrid.game_columns.enable()
+        self.addCleanup(app_hybrid.game_columns.reset)
+        self.addCleanup(app_hybrid.game_events.unsubscribe, app_hybrid.game_columns)
+        self.addCleanup(setattr, app_hybrid.game_columns, 'enabled', False)
+
+        alice = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+        bob = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        board = app_hybrid.execute_insert("INSERT INTO boards (roman_number) VALUES (?)", ['I'])
+        form = {'board_id': board, 'winner_id': alice, 'loser_id': bob, 'date_played': '2024-01-01'}
+        client = app_hybrid.app.test_client()
+        client.post('/add_game', data=form)
+        self.assertIn('1W', client.get('/stats').get_data(as_text=True))
+
+        client.post('/add_game', data=dict(form, date_played='2024-01-02', is_skunk='on'))
+        self.assertEqual(app_hybrid.game_columns.player_totals()[alice]['skunks_given'], 1)
+        self.assertEqual(app_hybrid.game_columns.games_version(app_hybrid.execute_query), 2)
+
+        # Another worker's write only shows up through games_version
+        with app_hybrid.transaction():
+            app_hybrid.execute_query("INSERT INTO games (winner_id, loser_id, date_played) VALUES (?, ?, ?)",
+                                     [bob, alice, '2024-01-03'])
+            app_hybrid.game_columns.bump_version(app_hybrid.execute_query)
+        self.assertIn('1L', client.get('/stats').get_data(as_text=True))
+        self.assertEqual(app_hybrid.game_columns.player_totals()[bob]['wins'], 1)
+
+    def test_board_delete_keeps_game_tables(self):
+        """Deleting a board takes it off its games and the tables kept from games follow"""
+        alice = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+        bob = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        board = app_hybrid.execute_insert("INSERT INTO boards (roman_number) VALUES (?)", ['I'])
+        client = app_hybrid.app.test_client()
+        client.post('/add_game', data={'board_id': board, 'winner_id': alice, 'loser_id': bob, 'date_played': '2024-01-01'})
+        version = app_hybrid.game_columns.games_version(app_hybrid.execute_query)
+
+        client.post(f'/board/{board}/delete')
+        self.assertEqual(app_hybrid.execute_query("SELECT board_id FROM games", fetch=True)[0]['board_id'], None)
+        self.assertEqual(app_hybrid.game_tables.check(app_hybrid.execute_query), [])
+        self.assertGreater(app_hybrid.game_columns.games_version(app_hybrid.execute_query), version)
+
+    def test_head_to_head_follows_game_routes(self):
+        """Adding, editing and deleting games patches the loaded head-to-head matrix"""
+        alice = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Alice', 'Smith'])
+        bob = app_hybrid.execute_insert("INSERT INTO players (first_name, last_name) VALUES (?, ?)", ['Bob', 'Jones'])
+        board = app_hybrid.execute_insert("INSERT INTO boards (roman_number) VALUES (?)", ['I'])
+        app_hybrid.head_to_head.ensure_loaded(app_hybrid.execute_query)
+
+        client = app_hybrid.app.test_client()
+        form = {'board_id': board, 'winner_id': alice, 'loser_id': bob, 'date_played': '2024-01-01'}
+        client.post('/add_game', data=form)
+        client.post('/add_game', data=dict(form, is_skunk='on'))
+        self.assertEqual(app_hybrid.head_to_head.record(alice, bob)['wins'], 2)
+        self.assertEqual(app_hybrid.head_to_head.record(bob, alice)['skunks_received'], 1)
+
+        game_id = app_hybrid.execute_query("SELECT MIN(id) as id FROM games", fetch=True)[0]['id']
+        client.post(f'/game/{game_id}/edit', data=dict(form, winner_id=bob, loser_id=alice))
+        self.assertEqual(app_hybrid.head_to_head.nemesis(alice)['id'], bob)
+
+        client.post(f'/game/{game_id}/delete')
+        self.assertIsNone(app_hybrid.head_to_head.nemesis(alice))
+        self.assertEqual(app_hybrid.head_to_head.rivalry_grid([alice, bob])[alice][bob],
+                         {'wins': 1, 'losses': 0, 'skunks_given': 1, 'skunks_received': 0,
+                          'double_skunks_given': 0, 'double_skunks_received': 0, 'total_games': 1})
+        self.assertEqual(app_hybrid.game_tables.check(app_hybrid.execute_query), [])
+        self.assertIn('Games Played', client.get(f'/board/{board}').get_data(as_text=True))
+
+        detail = client.get(f'/player/{bob}').get_data(as_text=True)
+        self.assertIn('Alice Smith', detail)
+        self.assertIn('2024-01-01', detail)
+        self.assertIn('Monthly Trend', detail)
+        stats_page = client.get('/stats').get_data(as_text=True)
+        self.assertIn('Games per Month', stats_page)
+        self.assertIn('1 scored game', stats_page)
+        self.assertIn('Breakdown', client.get('/stats?by=player&then_by=season&season=Winter').get_data(as_text=True))
+
+
+if __name__ == "__main__":
+    unittest.main()
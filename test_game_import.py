@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Unit Tests for the streaming game importer (app/game_import.py)
+"""
+
+import io
+import os
+import sys
+import unittest
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from game_import import GameLookups, ImportJobs, ImportResult, detect_format, import_games, iter_records, parse_game
+
+
+PLAYERS = [
+    {'id': 1, 'first_name': 'Alice', 'last_name': 'Smith'},
+    {'id': 2, 'first_name': 'Bob', 'last_name': 'Jones'},
+    {'id': 3, 'first_name': 'Bob', 'last_name': 'Jones'},
+    {'id': 4, 'first_name': 'Carol', 'last_name': 'White'},
+]
+BOARDS = [{'id': 7, 'roman_number': 'VII'}]
+
+
+class TestGameImport(unittest.TestCase):
+
+    def setUp(self):
+        self.lookups = GameLookups(PLAYERS, BOARDS)
+
+    def test_parse_names_and_dates(self):
+        row = parse_game({'Date': '03/14/2024', 'Winner': ' alice  smith', 'Loser': 'Carol White',
+                          'Board': 'vii', 'Loser_Score': '85'}, self.lookups)
+        self.assertEqual(row, (7, 1, 4, '2024-03-14', 121, 85, 1, 0))
+
+    def test_parse_ndjson_ids(self):
+        row = parse_game('{"date_played": "2024-01-02", "winner_id": 4, "loser_id": 2, "is_skunk": true}', self.lookups)
+        self.assertEqual(row, (None, 4, 2, '2024-01-02', None, None, 1, 0))
+
+    def test_double_skunk_with_or_without_skunk_flag(self):
+        record = {'date_played': '2024-01-02', 'winner': 'Alice Smith', 'loser': 'Carol White', 'loser_score': '50'}
+        for is_skunk in ('0', '1'):
+            row = parse_game(dict(record, is_skunk=is_skunk, is_double_skunk='1'), self.lookups)
+            self.assertEqual(row[4:], (121, 50, int(is_skunk), 1))
+        self.assertEqual(parse_game(record, self.lookups)[4:], (121, 50, 1, 1))
+        with self.assertRaises(ValueError):
+            parse_game(dict(record, is_skunk='1', is_double_skunk='0'), self.lookups)
+
+    def test_rejects_bad_rows(self):
+        bad_records = [
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': '1'},          # same player
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': 'Bob Jones'},  # ambiguous name
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': 'Nobody'},
+            {'date_played': 'yesterday', 'winner': 'Alice Smith', 'loser': 'Carol White'},
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': 'Carol White', 'loser_score': '130'},
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': 'Carol White',
+             'loser_score': '100', 'is_skunk': '1'},
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': 'Carol White', 'board': 'XX'},
+            {'date_played': '2024-01-01', 'winner': 'Alice Smith', 'loser': 'Carol White',
+             'winner_score': '100', 'loser_score': '110'},
+            '[1, 2]',
+            '{not json',
+        ]
+        for record in bad_records:
+            with self.assertRaises(ValueError, msg=str(record)):
+                parse_game(record, self.lookups)
+
+    def test_import_streams_and_reports(self):
+        stream = io.StringIO(
+            "date_played,winner,loser,loser_score\n"
+            "2024-01-01,Alice Smith,Carol White,100\n"
+            "2024-01-02,Alice Smith,Alice Smith,100\n"
+            "2024-01-03,Carol White,4,50\n"
+        )
+        written = []
+
+        def bulk_insert(table, columns, rows, chunk_size=None):
+            written.extend(rows)
+            return len(written)
+
+        result = import_games(iter_records(stream, 'csv'), self.lookups, bulk_insert)
+        self.assertEqual(result.imported, 1)
+        self.assertEqual(result.skipped, 2)
+        self.assertEqual([line for line, _ in result.errors], [3, 4])
+        self.assertTrue(result.finished)
+
+    def test_error_list_is_capped(self):
+        result = ImportResult()
+        for line_no in range(500):
+            result.add_error(line_no, "bad")
+        self.assertEqual(result.skipped, 500)
+        self.assertEqual(len(result.errors), 100)
+
+    def test_import_jobs_are_bounded(self):
+        """Only the last few jobs are kept, and a running one is never forgotten"""
+        jobs = ImportJobs(max_jobs=3)
+        running = ImportResult()
+        running_id = jobs.add(running)
+        ids = []
+        for _ in range(5):
+            result = ImportResult()
+            result.finished = True
+            ids.append(jobs.add(result))
+        self.assertEqual(len(jobs), 3)
+        self.assertIs(jobs.get(running_id), running)
+        self.assertIsNone(jobs.get(ids[0]))
+        self.assertIsNotNone(jobs.get(ids[-1]))
+
+    def test_detect_format(self):
+        self.assertEqual(detect_format('season.CSV'), 'csv')
+        self.assertEqual(detect_format('season.ndjson'), 'ndjson')
+        with self.assertRaises(ValueError):
+            detect_format('season.xlsx')
+
+
+if __name__ == "__main__":
+    unittest.main()
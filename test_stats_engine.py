@@ -0,0 +1,944 @@
+#!/usr/bin/env python3
+"""
+Unit Tests for the set-based statistics engine (app/stats_engine.py)
+Runs on an in-memory SQLite database built from schema.sql
+"""
+
+import os
+import random
+import sqlite3
+import sys
+import time
+import unittest
+
+# Add the app directory to the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
+
+from unittest.mock import patch
+
+from stats_engine import build_leaderboard, player_stats_batch, player_streaks, empty_player_stats, PARTICIPANT_RESULTS
+from head_to_head import HeadToHeadMatrix
+import summary_tables
+import board_stats
+import game_participants
+import ratings
+import rollups
+import stats_cube
+import game_columns
+import game_events
+import date_columns
+import skunk_columns
+from leaderboard_view import LeaderboardView, LEADERBOARD_SOURCE
+from score_stats import ScoreDistribution, compute, histogram, percentiles
+
+SCHEMA_PATH = os.path.join(os.path.dirname(__file__), 'schema.sql')
+
+
+class StatsTestCase(unittest.TestCase):
+    """In-memory database with random players and games"""
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        with open(SCHEMA_PATH) as f:
+            self.conn.executescript(f.read())
+        for statement in game_columns.SCHEMA:
+            self.conn.execute(statement)
+
+        rng = random.Random(2049)
+        names = ['Alice', 'Bob', 'Carol', 'Dave', 'Erin', 'Frank']
+        self.conn.executemany("INSERT INTO players (first_name, last_name) VALUES (?, ?)",
+                              [(name, 'Player') for name in names])
+        self.conn.execute("INSERT INTO players (first_name, last_name) VALUES ('Idle', 'Player')")
+        self.conn.executemany("INSERT INTO boards (roman_number) VALUES (?)", [('I',), ('II',), ('III',)])
+
+        games = []
+        for day in range(300):
+            winner, loser = rng.sample(range(1, len(names) + 1), 2)
+            loser_score = rng.randint(30, 120)
+            games.append((rng.randint(1, 3), winner, loser, 121, loser_score,
+                          int(loser_score < 91), int(loser_score < 61),
+                          f"2024-{day % 12 + 1:02d}-{day % 28 + 1:02d}"))
+        self.conn.executemany("""
+            INSERT INTO games (board_id, winner_id, loser_id, winner_score, loser_score,
+                               is_skunk, is_double_skunk, date_played)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, games)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def execute_query(self, query, params=None, fetch=False):
+        cursor = self.conn.execute(query, params or [])
+        return cursor.fetchall() if fetch else None
+
+
+class TestLeaderboard(StatsTestCase):
+
+    def old_leaderboard(self):
+        """The per-player list comprehensions the engine replaced"""
+        players = self.execute_query("SELECT * FROM players ORDER BY first_name, last_name", fetch=True)
+        games = self.execute_query("SELECT * FROM games", fetch=True)
+        leaderboard = []
+        for player in players:
+            wins = len([g for g in games if g['winner_id'] == player['id']])
+            losses = len([g for g in games if g['loser_id'] == player['id']])
+            if wins + losses:
+                leaderboard.append({
+                    'id': player['id'],
+                    'wins': wins,
+                    'losses': losses,
+                    'total_games': wins + losses,
+                    'win_percentage': (wins / (wins + losses)) * 100,
+                    'skunks_given': len([g for g in games if g['winner_id'] == player['id'] and (g['is_skunk'] or g['is_double_skunk'])]),
+                    'skunks_received': len([g for g in games if g['loser_id'] == player['id'] and (g['is_skunk'] or g['is_double_skunk'])]),
+                    'double_skunks_given': len([g for g in games if g['winner_id'] == player['id'] and g['is_double_skunk']]),
+                    'double_skunks_received': len([g for g in games if g['loser_id'] == player['id'] and g['is_double_skunk']]),
+                })
+        leaderboard.sort(key=lambda x: x['win_percentage'], reverse=True)
+        return leaderboard
+
+    def test_matches_old_leaderboard(self):
+        leaderboard = build_leaderboard(self.execute_query)
+        expected = self.old_leaderboard()
+        self.assertEqual([{key: entry[key] for key in expected[0]} for entry in leaderboard], expected)
+
+    def test_players_without_games_left_out(self):
+        leaderboard = build_leaderboard(self.execute_query)
+        self.assertNotIn('Idle', [entry['first_name'] for entry in leaderboard])
+        self.assertEqual(sum(entry['total_games'] for entry in leaderboard), 600)
+
+    def test_empty(self):
+        self.conn.execute("DELETE FROM games")
+        self.assertEqual(build_leaderboard(self.execute_query), [])
+
+
+class TestPlayerStatsBatch(StatsTestCase):
+
+    def expected_stats(self, player_id):
+        """calculate_player_stats() worked out game by game"""
+        games = self.execute_query("SELECT * FROM games ORDER BY date_played DESC, id DESC", fetch=True)
+        won = [g for g in games if g['winner_id'] == player_id]
+        lost = [g for g in games if g['loser_id'] == player_id]
+        skunk = lambda g: g['is_skunk'] or g['is_double_skunk']
+        results = ['W' if g['winner_id'] == player_id else 'L' for g in won + lost]
+        results = ''.join(r for g, r in sorted(zip(won + lost, results), key=lambda x: (x[0]['date_played'], x[0]['id']), reverse=True))
+        recent = results[:10]
+        streak = len(results) - len(results.lstrip(results[0])) if results else 0
+        return {
+            'wins': len(won),
+            'losses': len(lost),
+            'skunks_given': len([g for g in won if skunk(g)]),
+            'skunks_received': len([g for g in lost if skunk(g)]),
+            'double_skunks_given': len([g for g in won if g['is_double_skunk']]),
+            'double_skunks_received': len([g for g in lost if g['is_double_skunk']]),
+            'avg_losing_score': round(sum(g['loser_score'] for g in lost) / len(lost), 1) if lost else 0,
+            'recent_form': f"{recent.count('W')}/{len(recent)}",
+            'current_streak': f"{streak}{results[0]}" if results else '0',
+            'longest_win_streak': max(map(len, results.split('L'))),
+            'longest_loss_streak': max(map(len, results.split('W'))),
+        }
+
+    def test_matches_per_player_stats(self):
+        all_stats = player_stats_batch(self.execute_query)
+        self.assertEqual(sorted(all_stats), [1, 2, 3, 4, 5, 6])
+        for player_id, stats in all_stats.items():
+            expected = self.expected_stats(player_id)
+            self.assertEqual({key: stats[key] for key in expected}, expected)
+            self.assertEqual(stats['total_games'], stats['wins'] + stats['losses'])
+            self.assertEqual(set(stats), set(empty_player_stats()))
+
+    def test_favorite_opponent(self):
+        stats = player_stats_batch(self.execute_query, [1])[1]
+        beaten = self.execute_query("""
+            SELECT loser_id, COUNT(*) as count FROM games WHERE winner_id = 1
+            GROUP BY loser_id ORDER BY count DESC
+        """, fetch=True)
+        self.assertEqual(stats['favorite_opponent']['wins_against_them'], beaten[0]['count'])
+
+    def test_subset_and_idle_players(self):
+        stats = player_stats_batch(self.execute_query, [2, 7])
+        self.assertEqual(sorted(stats), [2, 7])
+        self.assertEqual(stats[7], empty_player_stats())
+        self.assertEqual(stats[2], player_stats_batch(self.execute_query)[2])
+
+
+class TestStreaks(StatsTestCase):
+
+    def test_streak_longer_than_recent_form(self):
+        self.conn.executemany("INSERT INTO games (winner_id, loser_id, date_played) VALUES (1, ?, ?)",
+                              [(2 + day % 5, f"2025-01-{day + 1:02d}") for day in range(14)])
+        stats = player_stats_batch(self.execute_query, [1, 2])
+        self.assertTrue(stats[1]['current_streak'].endswith('W'))
+        self.assertGreaterEqual(int(stats[1]['current_streak'][:-1]), 14)
+        self.assertEqual(stats[1]['recent_form'], '10/10')
+        self.assertGreaterEqual(stats[1]['longest_win_streak'], 14)
+        self.assertTrue(stats[2]['current_streak'].endswith('L'))
+
+    def test_us_dates_ordered_by_played_on(self):
+        self.conn.executemany("INSERT INTO games (winner_id, loser_id, date_played) VALUES (1, 2, ?)",
+                              [(f"2025-01-{day + 1:02d}",) for day in range(3)])
+        # As text '12/01/2030' sorts before every ISO date; as a date it is the last game
+        self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (2, 1, '12/01/2030')")
+        stats = player_stats_batch(self.execute_query, [1])
+        self.assertEqual(stats[1]['current_streak'], '1L')
+        self.assertEqual(player_streaks(self.execute_query, [1])[1]['current_streak'], '1L')
+
+    def test_participants_source_matches_games(self):
+        game_participants.create_tables(self.execute_query)
+        game_participants.rebuild(self.execute_query)
+        self.assertEqual(player_streaks(self.execute_query, source=PARTICIPANT_RESULTS),
+                         player_streaks(self.execute_query))
+        self.assertEqual(sorted(player_streaks(self.execute_query, [3, 7], PARTICIPANT_RESULTS)), [3])
+
+    def test_idle_player_keeps_empty_streaks(self):
+        self.assertEqual(player_streaks(self.execute_query, []), {})
+        stats = player_stats_batch(self.execute_query, [7])[7]
+        self.assertEqual((stats['current_streak'], stats['longest_win_streak']), ('0', 0))
+
+
+class TestHeadToHead(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.matrix = HeadToHeadMatrix().load(self.execute_query)
+
+    def reloaded(self, player_ids=range(1, 8)):
+        return HeadToHeadMatrix().load(self.execute_query).rivalry_grid(list(player_ids))
+
+    def test_matches_pair_counts(self):
+        rows = self.execute_query("SELECT winner_id, loser_id, COUNT(*) as count FROM games GROUP BY winner_id, loser_id", fetch=True)
+        for row in rows:
+            self.assertEqual(self.matrix.record(row['winner_id'], row['loser_id'])['wins'], row['count'])
+            self.assertEqual(self.matrix.record(row['loser_id'], row['winner_id'])['losses'], row['count'])
+        self.assertEqual(self.matrix.record(7, 1)['total_games'], 0)
+        self.assertEqual(self.matrix.opponents(7), {})
+
+    def test_incremental_changes_match_reload(self):
+        # Add
+        new_game = {'winner_id': 7, 'loser_id': 1, 'winner_score': 121, 'loser_score': 50,
+                    'is_skunk': 0, 'is_double_skunk': 1}
+        self.conn.execute("""INSERT INTO games (winner_id, loser_id, winner_score, loser_score, is_skunk, is_double_skunk)
+                             VALUES (:winner_id, :loser_id, :winner_score, :loser_score, :is_skunk, :is_double_skunk)""", new_game)
+        self.matrix.game_changed(None, new_game)
+        self.assertEqual(self.matrix.rivalry_grid(range(1, 8)), self.reloaded())
+        self.assertEqual(self.matrix.record(1, 7)['losses'], 1)
+        self.assertEqual(self.matrix.record(1, 7)['double_skunks_received'], 1)
+
+        # Edit: swap winner and loser of game 1
+        old = dict(self.execute_query("SELECT * FROM games WHERE id = 1", fetch=True)[0])
+        self.conn.execute("UPDATE games SET winner_id = ?, loser_id = ?, is_skunk = 0, is_double_skunk = 0 WHERE id = 1",
+                          [old['loser_id'], old['winner_id']])
+        new = dict(self.execute_query("SELECT * FROM games WHERE id = 1", fetch=True)[0])
+        self.matrix.game_changed(old, new)
+        self.assertEqual(self.matrix.rivalry_grid(range(1, 8)), self.reloaded())
+
+        # Delete, including the only game between a pair
+        for game_id in (2, self.conn.execute("SELECT MAX(id) FROM games").fetchone()[0]):
+            old = dict(self.execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0])
+            self.conn.execute("DELETE FROM games WHERE id = ?", [game_id])
+            self.matrix.game_changed(old, None)
+        self.assertEqual(self.matrix.rivalry_grid(range(1, 8)), self.reloaded())
+        self.assertEqual(self.matrix.opponents(7), {})
+
+    def test_nemesis_and_favorite_tie_rules(self):
+        self.conn.execute("DELETE FROM games")
+        games = [(1, 2), (2, 1), (2, 1), (3, 1), (3, 1), (1, 4), (1, 4), (1, 3)]
+        self.conn.executemany("INSERT INTO games (winner_id, loser_id) VALUES (?, ?)", games)
+        matrix = HeadToHeadMatrix().load(self.execute_query)
+        # 1-2 against both 2 and 3, so the lower ID is the nemesis
+        self.assertEqual(matrix.nemesis(1)['id'], 2)
+        self.assertEqual(matrix.nemesis(1)['losses_to_them'], 2)
+        self.assertEqual(matrix.favorite_opponent(1)['id'], 4)
+        self.assertEqual(matrix.nemesis(4)['id'], 1)
+        self.assertIsNone(matrix.favorite_opponent(4))
+
+        # Then fewest wins decides between equal losses
+        self.conn.execute("INSERT INTO games (winner_id, loser_id) VALUES (1, 3)")
+        matrix.game_changed(None, {'winner_id': 1, 'loser_id': 3})
+        self.assertEqual(matrix.nemesis(1)['id'], 2)
+        self.conn.execute("INSERT INTO games (winner_id, loser_id) VALUES (1, 2)")
+        self.conn.execute("INSERT INTO games (winner_id, loser_id) VALUES (1, 2)")
+        matrix.game_changed(None, {'winner_id': 1, 'loser_id': 2})
+        matrix.game_changed(None, {'winner_id': 1, 'loser_id': 2})
+        self.assertEqual(matrix.nemesis(1)['id'], 3)
+        self.assertEqual(matrix.favorite_opponent(1)['id'], 2)
+
+    def test_changes_before_first_load_are_ignored(self):
+        matrix = HeadToHeadMatrix()
+        matrix.game_changed(None, {'winner_id': 1, 'loser_id': 2})
+        self.assertEqual(matrix.opponents(1), {})
+        matrix.ensure_loaded(self.execute_query)
+        self.assertEqual(matrix.rivalry_grid(range(1, 8)), self.reloaded())
+
+    def test_change_seen_by_load_not_counted_twice(self):
+        matrix = HeadToHeadMatrix()
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id) VALUES (1, 2)")
+        new = {'id': cursor.lastrowid, 'winner_id': 1, 'loser_id': 2}
+        version = game_columns.game_columns.bump_version(self.execute_query)
+        matrix.ensure_loaded(self.execute_query)  # loads after the commit, before the event
+        matrix.game_changed(None, new, version)
+        matrix.game_changed(None, new, version)
+        self.assertEqual(matrix.rivalry_grid(range(1, 8)), self.reloaded())
+
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id) VALUES (2, 1)")
+        version = game_columns.game_columns.bump_version(self.execute_query)
+        matrix.game_changed(None, {'id': cursor.lastrowid, 'winner_id': '2', 'loser_id': '1'}, version)
+        matrix.game_changed(None, {'id': str(cursor.lastrowid), 'winner_id': 2, 'loser_id': 1}, version)
+        self.assertEqual(matrix.rivalry_grid(range(1, 8)), self.reloaded())
+
+    def test_reloads_after_another_workers_write(self):
+        self.matrix.ensure_loaded(self.execute_query)
+        self.conn.execute("INSERT INTO games (winner_id, loser_id) VALUES (7, 1)")
+        game_columns.game_columns.bump_version(self.execute_query)  # no event here
+        self.assertEqual(self.matrix.opponents(7), {})
+        self.matrix.ensure_loaded(self.execute_query)
+        self.assertEqual(self.matrix.rivalry_grid(range(1, 8)), self.reloaded())
+
+    def test_favorites_match_batch_query(self):
+        with_matrix = player_stats_batch(self.execute_query, matrix=self.matrix)
+        self.assertEqual(with_matrix, player_stats_batch(self.execute_query))
+
+
+class TestSummaryTables(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        summary_tables.create_tables(self.execute_query)
+        summary_tables.rebuild(self.execute_query)
+
+    def game(self, game_id):
+        rows = self.execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+        return dict(rows[0]) if rows else None
+
+    def test_rebuild_matches_games(self):
+        self.assertEqual(summary_tables.check(self.execute_query), [])
+        self.assertEqual(build_leaderboard(self.execute_query, summary_tables.LEADERBOARD_QUERY),
+                         build_leaderboard(self.execute_query))
+        self.assertEqual(HeadToHeadMatrix().load(self.execute_query, summary_tables.PAIR_MATRIX_QUERY).rivalry_grid(range(1, 8)),
+                         HeadToHeadMatrix().load(self.execute_query).rivalry_grid(range(1, 8)))
+
+    def test_changes_keep_summaries_consistent(self):
+        rng = random.Random(14)
+        for _ in range(60):
+            action = rng.choice(['add', 'edit', 'delete'])
+            game_id = rng.choice([row[0] for row in self.conn.execute("SELECT id FROM games")])
+            if action == 'add':
+                cursor = self.conn.execute("""
+                    INSERT INTO games (winner_id, loser_id, winner_score, loser_score, is_skunk, is_double_skunk)
+                    VALUES (?, ?, 121, ?, ?, ?)
+                """, [*rng.sample(range(1, 8), 2), rng.randint(30, 120), rng.randint(0, 1), rng.randint(0, 1)])
+                summary_tables.apply_change(self.execute_query, None, self.game(cursor.lastrowid))
+            elif action == 'edit':
+                old = self.game(game_id)
+                self.conn.execute("UPDATE games SET winner_id = ?, loser_id = ?, loser_score = ?, is_skunk = ? WHERE id = ?",
+                                  [*rng.sample(range(1, 8), 2), rng.randint(30, 120), rng.randint(0, 1), game_id])
+                summary_tables.apply_change(self.execute_query, old, self.game(game_id))
+            else:
+                old = self.game(game_id)
+                self.conn.execute("DELETE FROM games WHERE id = ?", [game_id])
+                summary_tables.apply_change(self.execute_query, old, None)
+        self.assertEqual(summary_tables.check(self.execute_query), [])
+
+    def test_form_values_and_empty_rows(self):
+        """Games straight from a form (strings, booleans) apply, and backing out a player's only game removes their row"""
+        form_game = {'winner_id': '7', 'loser_id': '1', 'winner_score': '121', 'loser_score': '',
+                     'is_skunk': True, 'is_double_skunk': False}
+        summary_tables.apply_change(self.execute_query, None, form_game)
+        idle = summary_tables.player_summary(self.execute_query, 7)
+        self.assertEqual((idle['wins'], idle['skunks_given'], idle['winning_score_total']), (1, 1, 121))
+
+        summary_tables.apply_change(self.execute_query, form_game, None)
+        self.assertEqual(summary_tables.player_summary(self.execute_query, 7)['total_games'], 0)
+        self.assertEqual(self.execute_query("SELECT COUNT(*) as count FROM player_pair_stats WHERE player_id = 7 OR opponent_id = 7",
+                                            fetch=True)[0]['count'], 0)
+        self.assertEqual(summary_tables.check(self.execute_query), [])
+
+    def test_check_reports_drift(self):
+        self.conn.execute("DELETE FROM games WHERE id = 1")
+        problems = summary_tables.check(self.execute_query)
+        self.assertTrue(any(p.startswith('player_stats') for p in problems))
+        self.assertTrue(any(p.startswith('player_pair_stats') for p in problems))
+        self.assertFalse(summary_tables.needs_rebuild(self.execute_query))
+        summary_tables.rebuild(self.execute_query)
+        self.assertEqual(summary_tables.check(self.execute_query), [])
+
+
+class TestLeaderboardView(StatsTestCase):
+
+    # The OR-join app.py's /leaderboard used to run on every request, skunks read from the flags
+    OLD_LEADERBOARD = """
+        SELECT p.id,
+               COUNT(CASE WHEN g.winner_id = p.id THEN 1 END) as wins,
+               COUNT(CASE WHEN g.loser_id = p.id THEN 1 END) as losses,
+               COUNT(CASE WHEN g.winner_id = p.id AND (g.is_skunk OR g.is_double_skunk) THEN 1 END) as skunks_given,
+               COUNT(CASE WHEN g.loser_id = p.id AND (g.is_skunk OR g.is_double_skunk) THEN 1 END) as skunks_received
+        FROM players p
+        LEFT JOIN games g ON (g.winner_id = p.id OR g.loser_id = p.id)
+        GROUP BY p.id
+        HAVING COUNT(g.id) > 0
+    """
+
+    def test_source_matches_old_query(self):
+        old = {row['id']: tuple(row) for row in self.execute_query(self.OLD_LEADERBOARD, fetch=True)}
+        new = {row['id']: (row['id'], row['wins'], row['losses'], row['skunks_given'], row['skunks_received'])
+               for row in self.execute_query(LEADERBOARD_SOURCE, fetch=True)}
+        self.assertEqual(new, old)
+
+    def test_disabled_view_computes_rows(self):
+        view = LeaderboardView()
+        self.assertEqual(len(view.rows(self.execute_query)), 6)
+        self.assertEqual(view.leaderboard_query('fallback'), 'fallback')
+        view.request_refresh()  # nothing to refresh on SQLite
+
+    def test_refresh_is_debounced(self):
+        statements = []
+        view = LeaderboardView(delay=0.05).enable(lambda query, params=None, fetch=False: statements.append(query))
+        self.addCleanup(game_events.unsubscribe, view)
+        self.assertTrue(statements[0].startswith('CREATE MATERIALIZED VIEW IF NOT EXISTS leaderboard_mv'))
+        self.assertIn('CREATE UNIQUE INDEX', statements[1])
+        del statements[:]
+
+        for _ in range(20):
+            game_events.game_changed(None, {'winner_id': 1, 'loser_id': 2})
+        time.sleep(0.3)
+        self.assertEqual(statements, ['REFRESH MATERIALIZED VIEW CONCURRENTLY leaderboard_mv'])
+
+        game_events.games_reset()
+        time.sleep(0.3)
+        self.assertEqual(len(statements), 2)
+
+
+class TestGameParticipants(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        game_participants.create_tables(self.execute_query)
+        game_participants.rebuild(self.execute_query)
+
+    def test_rebuild_matches_games(self):
+        self.assertEqual(game_participants.check(self.execute_query), [])
+        count = self.execute_query("SELECT COUNT(*) as count FROM game_participants", fetch=True)[0]['count']
+        self.assertEqual(count, 600)
+        for player_id in range(1, 8):
+            old = self.execute_query("SELECT id FROM games WHERE winner_id = ? OR loser_id = ? ORDER BY id",
+                                     [player_id, player_id], fetch=True)
+            new = self.execute_query("SELECT game_id FROM game_participants WHERE player_id = ? ORDER BY game_id",
+                                     [player_id], fetch=True)
+            self.assertEqual([row[0] for row in new], [row[0] for row in old])
+
+    def test_sync_game_follows_writes(self):
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, loser_score, date_played) VALUES (7, 1, 80, '2025-01-01')")
+        game_participants.sync_game(self.execute_query, cursor.lastrowid)
+        self.conn.execute("UPDATE games SET winner_id = 2, loser_id = 3, winner_score = 121, loser_score = 99 WHERE id = 5")
+        game_participants.sync_game(self.execute_query, 5)
+        self.conn.execute("DELETE FROM games WHERE id = 6")
+        game_participants.sync_game(self.execute_query, 6)
+        self.assertEqual(game_participants.check(self.execute_query), [])
+
+        idle = self.execute_query("SELECT * FROM game_participants WHERE player_id = 7", fetch=True)
+        self.assertEqual([(row['role'], row['score'], row['opponent_id']) for row in idle], [('winner', 121, 1)])
+        self.assertFalse(game_participants.needs_rebuild(self.execute_query))
+
+    def test_table_from_before_played_on_is_rebuilt(self):
+        self.conn.execute("DROP TABLE game_participants")
+        self.conn.execute("CREATE TABLE game_participants (game_id INTEGER, player_id INTEGER, role VARCHAR(10), "
+                          "score INTEGER, opponent_id INTEGER, date_played VARCHAR(255))")
+        self.conn.execute("INSERT INTO game_participants SELECT id, winner_id, 'winner', winner_score, loser_id, "
+                          "date_played FROM games")
+        game_participants.upgrade_tables(self.execute_query)
+        game_participants.create_tables(self.execute_query)
+        self.assertTrue(game_participants.needs_rebuild(self.execute_query))
+        game_participants.rebuild(self.execute_query)
+        self.assertEqual(game_participants.check(self.execute_query), [])
+        game_participants.upgrade_tables(self.execute_query)
+        self.assertFalse(game_participants.needs_rebuild(self.execute_query))
+
+    def test_check_reports_drift(self):
+        self.conn.execute("DELETE FROM game_participants WHERE game_id = 1 AND role = 'loser'")
+        self.conn.execute("UPDATE game_participants SET score = 0 WHERE game_id = 2 AND role = 'winner'")
+        self.assertEqual(len(game_participants.check(self.execute_query)), 2)
+
+    def test_player_history_uses_index(self):
+        plan = self.execute_query("""
+            EXPLAIN QUERY PLAN
+            SELECT * FROM game_participants WHERE player_id = ? ORDER BY played_on DESC NULLS LAST, game_id DESC
+        """, [1], fetch=True)
+        details = ' '.join(row['detail'] for row in plan)
+        self.assertIn('idx_game_participants_player_played_on', details)
+        self.assertNotIn('TEMP B-TREE', details)
+
+
+class TestRatings(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        ratings.create_tables(self.execute_query)
+        self.replayed = []
+        ratings.rebuild(self.execute_query, self.bulk_insert)
+
+    def bulk_insert(self, table, columns, rows):
+        rows = list(rows)
+        if table == 'rating_history':
+            self.replayed.extend(rows)
+        self.conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})", rows)
+
+    def game(self, game_id):
+        rows = self.execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)
+        return dict(rows[0]) if rows else None
+
+    def test_rate_game(self):
+        winner, loser = ratings.rate_game(1500, 1500)
+        self.assertEqual((winner, loser), (1516, 1484))
+        upset_winner, _ = ratings.rate_game(1400, 1600)
+        self.assertGreater(upset_winner - 1400, 16)
+        self.assertAlmostEqual(ratings.expected_score(1600, 1400) + ratings.expected_score(1400, 1600), 1)
+
+    def test_rebuild_rates_every_game(self):
+        self.assertEqual(ratings.check(self.execute_query), [])
+        current = ratings.current_ratings(self.execute_query)
+        self.assertEqual(sorted(current), [1, 2, 3, 4, 5, 6])
+        self.assertEqual(sum(entry['games'] for entry in current.values()), 600)
+        # Elo only moves points between players
+        total = self.execute_query("SELECT SUM(rating) as total FROM player_ratings", fetch=True)[0]['total']
+        self.assertAlmostEqual(total, 6 * ratings.INITIAL_RATING)
+
+    def test_new_game_only_rates_itself(self):
+        del self.replayed[:]
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, '2025-06-01')")
+        ratings.apply_change(self.execute_query, self.bulk_insert, None, self.game(cursor.lastrowid))
+        self.assertEqual(len(self.replayed), 2)
+        self.assertEqual(ratings.check(self.execute_query), [])
+        self.assertEqual(ratings.current_ratings(self.execute_query, [7])[7]['games'], 1)
+
+    def test_back_dated_edit_and_delete_replay_from_checkpoint(self):
+        later = self.execute_query("SELECT COUNT(*) as count FROM games WHERE date_played >= '2024-12-01'", fetch=True)[0]['count']
+
+        del self.replayed[:]
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (2, 3, '2024-12-01')")
+        ratings.apply_change(self.execute_query, self.bulk_insert, None, self.game(cursor.lastrowid))
+        self.assertEqual(len(self.replayed), 2 * (later + 1))
+        self.assertEqual(ratings.check(self.execute_query), [])
+
+        old = self.game(10)
+        self.conn.execute("UPDATE games SET date_played = '2024-12-28', winner_id = loser_id, loser_id = winner_id WHERE id = 10")
+        ratings.apply_change(self.execute_query, self.bulk_insert, old, self.game(10))
+        self.assertEqual(ratings.check(self.execute_query), [])
+
+        # Deleting a player's only game leaves them unrated
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, '2024-01-05')")
+        ratings.apply_change(self.execute_query, self.bulk_insert, None, self.game(cursor.lastrowid))
+        old = self.game(cursor.lastrowid)
+        self.conn.execute("DELETE FROM games WHERE id = ?", [cursor.lastrowid])
+        ratings.apply_change(self.execute_query, self.bulk_insert, old, None)
+        self.assertEqual(ratings.check(self.execute_query), [])
+        self.assertNotIn(7, ratings.current_ratings(self.execute_query))
+
+    def test_us_dates_rated_in_played_on_order(self):
+        del self.replayed[:]
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, '1/5/2020')")
+        ratings.apply_change(self.execute_query, self.bulk_insert, None, self.game(cursor.lastrowid))
+        # The earliest game of all, so everything after it is rated again
+        self.assertEqual(len(self.replayed), 2 * 301)
+        self.assertEqual(self.replayed[0][2], '2020-01-05')
+        self.assertEqual(ratings.check(self.execute_query), [])
+
+    def test_check_reports_drift(self):
+        self.conn.execute("UPDATE player_ratings SET rating = rating + 1 WHERE player_id = 1")
+        self.assertEqual(len(ratings.check(self.execute_query)), 1)
+
+
+class TestRollups(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        rollups.create_tables(self.execute_query)
+        rollups.rebuild(self.execute_query)
+
+    def game(self, game_id):
+        return dict(self.execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0])
+
+    def test_rebuild_matches_games(self):
+        self.assertEqual(rollups.check(self.execute_query), [])
+        self.assertFalse(rollups.needs_rebuild(self.execute_query))
+        months = self.execute_query("SELECT COUNT(*) as count FROM player_monthly_stats WHERE player_id = 1", fetch=True)
+        self.assertLessEqual(months[0]['count'], 12)
+
+    def test_add_edit_delete_keep_rollups_current(self):
+        cursor = self.conn.execute("""
+            INSERT INTO games (winner_id, loser_id, winner_score, loser_score, is_skunk, is_double_skunk, date_played)
+            VALUES (7, 1, 121, 80, 1, 0, '2025-03-14')
+        """)
+        new = self.game(cursor.lastrowid)
+        rollups.apply_change(self.execute_query, None, new)
+        self.assertEqual(rollups.check(self.execute_query), [])
+        self.assertEqual(rollups.player_trend(self.execute_query, 7, 'day')[0]['margin_total'], 41)
+
+        self.conn.execute("UPDATE games SET date_played = '2025-04-01', winner_id = 1, loser_id = 7 WHERE id = ?",
+                          [cursor.lastrowid])
+        rollups.apply_change(self.execute_query, new, self.game(cursor.lastrowid))
+        self.assertEqual(rollups.check(self.execute_query), [])
+        self.assertEqual([point['bucket'] for point in rollups.player_trend(self.execute_query, 7)], ['2025-04'])
+
+        old = self.game(cursor.lastrowid)
+        self.conn.execute("DELETE FROM games WHERE id = ?", [cursor.lastrowid])
+        rollups.apply_change(self.execute_query, old, None)
+        self.assertEqual(rollups.check(self.execute_query), [])
+        self.assertEqual(rollups.player_trend(self.execute_query, 7), [])
+
+    def test_us_dates_bucketed_by_played_on(self):
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, '01/15/2023')")
+        rollups.apply_change(self.execute_query, None, self.game(cursor.lastrowid))
+        self.assertEqual(rollups.check(self.execute_query), [])
+        self.assertEqual([point['bucket'] for point in rollups.player_trend(self.execute_query, 7)], ['2023-01'])
+        self.assertEqual([point['bucket'] for point in rollups.player_trend(self.execute_query, 7, 'day')], ['2023-01-15'])
+
+        # Buckets cut from the text, as before played_on, call for a rebuild
+        self.conn.execute("UPDATE player_monthly_stats SET bucket = '01/15/2' WHERE player_id = 7")
+        self.assertTrue(rollups.needs_rebuild(self.execute_query))
+
+    def test_undated_games_left_out(self):
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, NULL)")
+        rollups.apply_change(self.execute_query, None, self.game(cursor.lastrowid))
+        self.assertEqual(rollups.check(self.execute_query), [])
+        self.assertEqual(rollups.player_trend(self.execute_query, 7), [])
+
+    def test_player_trend(self):
+        trend = rollups.player_trend(self.execute_query, 2)
+        self.assertEqual([point['bucket'] for point in trend], sorted(point['bucket'] for point in trend))
+        self.assertEqual(sum(point['wins'] for point in trend),
+                         self.execute_query("SELECT COUNT(*) as count FROM games WHERE winner_id = 2", fetch=True)[0]['count'])
+        window = trend[-rollups.ROLLING_BUCKETS:]
+        self.assertEqual(trend[-1]['rolling_win_rate'],
+                         round(sum(p['wins'] for p in window) / sum(p['games'] for p in window) * 100, 1))
+        recent = rollups.player_trend(self.execute_query, 2, since='2024-07')
+        self.assertEqual([point['bucket'] for point in recent], [p['bucket'] for p in trend if p['bucket'] >= '2024-07'])
+
+    def test_overall_trend_counts_each_game_once(self):
+        trend = rollups.overall_trend(self.execute_query)
+        self.assertEqual(len(trend), 12)
+        self.assertEqual(sum(point['games'] for point in trend), 300)
+
+
+class TestScoreStats(StatsTestCase):
+
+    def margins(self):
+        return sorted(g['winner_score'] - g['loser_score'] for g in self.execute_query("SELECT * FROM games", fetch=True))
+
+    def test_histogram_and_percentiles(self):
+        self.assertEqual(histogram({3: 1, 12: 2, 19: 1}),
+                         [{'low': 0, 'high': 9, 'games': 1, 'percent': 25.0},
+                          {'low': 10, 'high': 19, 'games': 3, 'percent': 75.0}])
+        self.assertEqual(percentiles({1: 1, 2: 1, 3: 1, 4: 1}, (25, 50, 100)), {25: 1, 50: 2, 100: 4})
+        self.assertEqual(percentiles({}), {})
+
+    def test_matches_game_by_game(self):
+        stats = compute(self.execute_query)
+        margins = self.margins()
+        self.assertEqual(stats['games'], 300)
+        self.assertEqual(sum(bar['games'] for bar in stats['margin_histogram']), 300)
+        self.assertEqual(stats['margin_percentiles'][50], margins[149])
+        self.assertEqual(stats['average_margin'], round(sum(margins) / 300, 1))
+
+        won = [g for g in self.execute_query("SELECT * FROM games WHERE winner_id = 3", fetch=True)]
+        self.assertEqual(stats['by_player'][3]['avg_margin_won'],
+                         round(sum(g['winner_score'] - g['loser_score'] for g in won) / len(won), 1))
+        self.assertNotIn(7, stats['by_player'])
+        self.assertEqual(sum(board['games'] for board in stats['by_board']), 300)
+
+    def test_unscored_games_left_out(self):
+        self.conn.execute("INSERT INTO games (winner_id, loser_id, winner_score, loser_score) VALUES (7, 1, NULL, NULL)")
+        self.assertEqual(compute(self.execute_query)['games'], 300)
+
+    def test_cache_dropped_when_games_change(self):
+        distribution = game_events.subscribe(ScoreDistribution())
+        self.addCleanup(game_events.unsubscribe, distribution)
+        first = distribution.get(self.execute_query)
+        self.assertIs(distribution.get(self.execute_query), first)
+
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, winner_score, loser_score) VALUES (7, 1, 121, 100)")
+        game_events.game_changed(None, {'id': cursor.lastrowid, 'winner_id': 7, 'loser_id': 1})
+        self.assertEqual(distribution.get(self.execute_query)['games'], 301)
+        self.assertEqual(distribution.player(self.execute_query, 7)['avg_margin_won'], 21)
+
+    def test_cache_follows_games_version(self):
+        distribution = ScoreDistribution()
+        first = distribution.get(self.execute_query)
+        self.conn.execute("INSERT INTO games (winner_id, loser_id, winner_score, loser_score) VALUES (7, 1, 121, 100)")
+        self.assertIs(distribution.get(self.execute_query), first)
+        game_columns.game_columns.bump_version(self.execute_query)  # another worker's write
+        self.assertEqual(distribution.get(self.execute_query)['games'], 301)
+
+
+class TestBoardStats(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        board_stats.create_tables(self.execute_query)
+        board_stats.rebuild(self.execute_query)
+
+    def game(self, game_id):
+        return dict(self.execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0])
+
+    def test_summary_matches_games(self):
+        self.assertEqual(board_stats.check(self.execute_query), [])
+        games = self.execute_query("SELECT * FROM games WHERE board_id = 2", fetch=True)
+        summary = board_stats.board_summary(self.execute_query, 2)
+        self.assertEqual(summary['games'], len(games))
+        self.assertEqual(summary['first_played'], min(g['date_played'] for g in games))
+        self.assertEqual(summary['last_played'], max(g['date_played'] for g in games))
+        self.assertEqual(sum(p['wins'] for p in summary['players']), len(games))
+        self.assertEqual(sum(p['games'] for p in summary['players']), 2 * len(games))
+        rates = [p['win_rate'] for p in summary['players']]
+        self.assertEqual(rates, sorted(rates, reverse=True))
+        self.assertIsNone(board_stats.board_summary(self.execute_query, 99))
+
+    def test_game_writes_resync_boards(self):
+        old = self.game(1)
+        other_board = 1 if old['board_id'] != 1 else 2
+        self.conn.execute("UPDATE games SET board_id = ?, date_played = '2030-01-01' WHERE id = 1", [other_board])
+        board_stats.apply_change(self.execute_query, old, self.game(1))
+        self.assertEqual(board_stats.check(self.execute_query), [])
+        self.assertEqual(board_stats.board_summary(self.execute_query, other_board)['last_played'], '2030-01-01')
+
+        cursor = self.conn.execute("INSERT INTO boards (roman_number) VALUES ('IV')")
+        board_id = cursor.lastrowid
+        cursor = self.conn.execute("INSERT INTO games (board_id, winner_id, loser_id, is_skunk, is_double_skunk, date_played) "
+                                   "VALUES (?, 7, 1, 1, 0, '')", [board_id])
+        new = self.game(cursor.lastrowid)
+        board_stats.apply_change(self.execute_query, None, {**new, 'board_id': str(board_id)})
+        summary = board_stats.board_summary(self.execute_query, board_id)
+        self.assertEqual((summary['games'], summary['skunk_rate'], summary['first_played']), (1, 100.0, None))
+
+        self.conn.execute("DELETE FROM games WHERE id = ?", [new['id']])
+        board_stats.apply_change(self.execute_query, new, None)
+        self.assertIsNone(board_stats.board_summary(self.execute_query, board_id))
+        self.assertEqual(board_stats.check(self.execute_query), [])
+
+    def test_days_played_from_played_on(self):
+        cursor = self.conn.execute("INSERT INTO games (board_id, winner_id, loser_id, date_played) VALUES (1, 7, 1, '12/31/2030')")
+        board_stats.apply_change(self.execute_query, None, self.game(cursor.lastrowid))
+        self.assertEqual(board_stats.check(self.execute_query), [])
+        self.assertEqual(board_stats.board_summary(self.execute_query, 1)['last_played'], '2030-12-31')
+        self.assertFalse(board_stats.needs_rebuild(self.execute_query))
+
+    def test_resync_uses_board_index(self):
+        plan = self.execute_query("EXPLAIN QUERY PLAN " + board_stats.BOARD_TOTALS_FROM_GAMES.format(where="AND board_id = ?"),
+                                  [1], fetch=True)
+        self.assertIn('idx_games_board_id', ' '.join(row['detail'] for row in plan))
+
+
+class TestStatsCube(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.conn.execute("UPDATE boards SET wood_type = 'Walnut' WHERE id IN (1, 2)")
+        self.conn.execute("UPDATE boards SET wood_type = 'Oak' WHERE id = 3")
+        stats_cube.create_tables(self.execute_query)
+        stats_cube.rebuild(self.execute_query)
+
+    def game(self, game_id):
+        return dict(self.execute_query("SELECT * FROM games WHERE id = ?", [game_id], fetch=True)[0])
+
+    def test_rebuild_matches_games(self):
+        self.assertEqual(stats_cube.check(self.execute_query), [])
+        self.assertFalse(stats_cube.needs_rebuild(self.execute_query))
+        total = stats_cube.query(self.execute_query)
+        self.assertEqual(len(total), 1)
+        self.assertEqual((total[0]['games'], total[0]['wins']), (600, 300))
+
+    def test_roll_up_and_slice_match_games(self):
+        by_player = stats_cube.query(self.execute_query, group_by=('player',))
+        self.assertEqual(sum(row['games'] for row in by_player), 600)
+        self.assertEqual([row['games'] for row in by_player], sorted((row['games'] for row in by_player), reverse=True))
+
+        walnut_winter = {row['player']: row for row in stats_cube.query(
+            self.execute_query, group_by=('player',), filters={'wood_type': 'Walnut', 'season': 'Winter'})}
+        expected = self.execute_query("""
+            SELECT winner_id as player_id, COUNT(*) as wins FROM games
+            WHERE board_id IN (1, 2) AND SUBSTR(date_played, 6, 2) IN ('12', '01', '02')
+            GROUP BY winner_id
+        """, fetch=True)
+        self.assertEqual({row['player_id']: row['wins'] for row in expected},
+                         {player: row['wins'] for player, row in walnut_winter.items() if row['wins']})
+
+        by_season = stats_cube.query(self.execute_query, group_by=('season', 'wood_type'), filters={'year': '2024'})
+        self.assertEqual({row['season'] for row in by_season}, set(stats_cube.SEASONS))
+        self.assertEqual(sum(row['games'] for row in by_season), 600)
+        self.assertEqual(stats_cube.query(self.execute_query, filters={'board': [99]}), [])
+
+    def test_board_edits_apply_without_rebuild(self):
+        self.conn.execute("UPDATE boards SET wood_type = 'Oak' WHERE id = 2")
+        oak = stats_cube.query(self.execute_query, filters={'wood_type': 'Oak'})[0]['games']
+        on_boards = self.execute_query("SELECT COUNT(*) as count FROM games WHERE board_id IN (2, 3)", fetch=True)
+        self.assertEqual(oak, 2 * on_boards[0]['count'])
+        self.assertEqual(stats_cube.values(self.execute_query, 'wood_type'), ['Oak', 'Walnut'])
+
+    def test_add_edit_delete_keep_cube_current(self):
+        cursor = self.conn.execute("""
+            INSERT INTO games (winner_id, loser_id, is_skunk, is_double_skunk, date_played)
+            VALUES (7, 1, 0, 1, '2025-03-14')
+        """)
+        new = self.game(cursor.lastrowid)
+        stats_cube.apply_change(self.execute_query, None, new)
+        self.assertEqual(stats_cube.check(self.execute_query), [])
+        idle = stats_cube.query(self.execute_query, group_by=('board', 'month'), filters={'player': 7})
+        self.assertEqual([(row['board'], row['month'], row['skunks_given']) for row in idle], [(0, '2025-03', 1)])
+
+        self.conn.execute("UPDATE games SET board_id = 3, date_played = '' WHERE id = ?", [cursor.lastrowid])
+        stats_cube.apply_change(self.execute_query, new, {**self.game(cursor.lastrowid), 'board_id': '3'})
+        self.assertEqual(stats_cube.check(self.execute_query), [])
+
+        old = self.game(cursor.lastrowid)
+        self.conn.execute("DELETE FROM games WHERE id = ?", [cursor.lastrowid])
+        stats_cube.apply_change(self.execute_query, old, None)
+        self.assertEqual(stats_cube.check(self.execute_query), [])
+        self.assertEqual(stats_cube.query(self.execute_query, filters={'player': 7}), [])
+
+    def test_us_dates_counted_by_played_on_month(self):
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, '01/15/2023')")
+        stats_cube.apply_change(self.execute_query, None, self.game(cursor.lastrowid))
+        self.assertEqual(stats_cube.check(self.execute_query), [])
+        idle = stats_cube.query(self.execute_query, group_by=('month', 'season'), filters={'player': 7})
+        self.assertEqual([(row['month'], row['season']) for row in idle], [('2023-01', 'Winter')])
+
+    def test_unknown_dimension(self):
+        with self.assertRaises(ValueError):
+            stats_cube.query(self.execute_query, group_by=('colour',))
+        with self.assertRaises(ValueError):
+            stats_cube.values(self.execute_query, 'colour')
+
+
+class TestGameColumns(StatsTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.columns = game_columns.GameColumns()
+        self.columns.create_tables(self.execute_query)
+        self.columns.ensure_current(self.execute_query)
+
+    def players(self):
+        return self.execute_query("SELECT id, first_name, last_name, photo FROM players", fetch=True)
+
+    def assert_matches_queries(self):
+        self.assertEqual(self.columns.leaderboard(self.players()), build_leaderboard(self.execute_query))
+        self.assertEqual(self.columns.streaks(), player_streaks(self.execute_query))
+        player_ids = [1, 2, 3, 7]
+        self.assertEqual(self.columns.rivalry_grid(player_ids),
+                         HeadToHeadMatrix().load(self.execute_query).rivalry_grid(player_ids))
+
+    def test_matches_queries(self):
+        self.assert_matches_queries()
+        self.assertEqual(self.columns.streaks([2, 99]), {2: player_streaks(self.execute_query, [2])[2]})
+
+    def test_matches_queries_without_numpy(self):
+        with patch.object(game_columns, 'numpy', None):
+            self.columns.load(self.execute_query)
+            self.assert_matches_queries()
+
+    def test_patched_by_game_changes(self):
+        cursor = self.conn.execute("INSERT INTO games (winner_id, loser_id, is_skunk, is_double_skunk, date_played) "
+                                   "VALUES (7, 1, 0, 1, '')")
+        new = dict(self.execute_query("SELECT * FROM games WHERE id = ?", [cursor.lastrowid], fetch=True)[0])
+        self.columns.game_changed(None, {**new, 'winner_id': '7', 'is_double_skunk': 'on'})
+        self.assertEqual(self.columns.player_totals()[7]['double_skunks_given'], 1)
+
+        old = dict(self.execute_query("SELECT * FROM games WHERE id = 1", fetch=True)[0])
+        self.conn.execute("UPDATE games SET winner_id = loser_id, loser_id = winner_id, date_played = '2030-01-01' WHERE id = 1")
+        self.columns.game_changed(old, dict(self.execute_query("SELECT * FROM games WHERE id = 1", fetch=True)[0]))
+        self.conn.execute("DELETE FROM games WHERE id = 2")
+        self.columns.game_changed({'id': 2}, None)
+        self.assert_matches_queries()
+
+        with patch.object(game_columns, 'numpy', None):
+            self.columns.game_changed(None, new)  # patched twice is still one game
+            self.assert_matches_queries()
+
+    def test_reloads_after_other_writers(self):
+        self.conn.execute("INSERT INTO games (winner_id, loser_id, date_played) VALUES (7, 1, '2030-01-01')")
+        self.columns.bump_version(self.execute_query)
+        self.assertNotIn(7, self.columns.player_totals())
+        self.columns.ensure_current(self.execute_query)
+        self.assertEqual(self.columns.player_totals()[7]['wins'], 1)
+        self.assertEqual(self.columns.streaks([7]), {7: {'current_streak': '1W', 'longest_win_streak': 1,
+                                                         'longest_loss_streak': 0}})
+
+
+class TestSkunkColumns(StatsTestCase):
+
+    def test_generated_from_flags(self):
+        self.conn.execute("INSERT INTO games (winner_id, loser_id, is_skunk, is_double_skunk) VALUES (7, 1, 0, 1)")
+        for game in self.execute_query("SELECT * FROM games", fetch=True):
+            self.assertEqual(game['skunk_class'], game_events.skunk_class(dict(game)))
+            self.assertEqual(game['margin'], game['winner_score'] - game['loser_score'])
+
+    def test_add_columns_to_old_table(self):
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        conn.execute("""CREATE TABLE games (id INTEGER PRIMARY KEY, winner_id INTEGER, loser_id INTEGER,
+                        winner_score INTEGER DEFAULT 121, loser_score INTEGER DEFAULT 0,
+                        is_skunk BOOLEAN DEFAULT 0, is_double_skunk BOOLEAN DEFAULT 0)""")
+        conn.execute("INSERT INTO games (winner_id, loser_id, loser_score, is_skunk) VALUES (1, 2, 80, 1)")
+        execute_query = lambda query, params=None, fetch=False: conn.execute(query, params or []).fetchall()
+        skunk_columns.add_columns(execute_query)
+        skunk_columns.add_columns(execute_query)  # safe to run again
+        self.assertEqual(tuple(conn.execute("SELECT margin, skunk_class FROM games").fetchone()), (41, 1))
+        self.assertEqual(skunk_columns.skunk_leaders(execute_query)[1]['skunks_given'], 1)
+        conn.close()
+
+    def test_leaders_match_leaderboard_from_partial_indexes(self):
+        leaders = skunk_columns.skunk_leaders(self.execute_query)
+        for entry in build_leaderboard(self.execute_query):
+            expected = {key: entry[key] for key in ('skunks_given', 'double_skunks_given',
+                                                    'skunks_received', 'double_skunks_received')}
+            self.assertEqual(leaders.get(entry['id'], dict.fromkeys(expected, 0)), expected)
+
+        plan = ' '.join(row['detail'] for row in
+                        self.execute_query("EXPLAIN QUERY PLAN " + skunk_columns.SKUNK_LEADERS_QUERY, fetch=True))
+        self.assertIn('idx_games_skunks_by_winner', plan)
+        self.assertIn('idx_games_skunks_by_loser', plan)
+
+
+class TestDateColumns(StatsTestCase):
+
+    DATES = ['2024-01-05', '2024-01-05 10:00', '1/5/2023', '01/15/2023', '12/5/2023', '1/15/2023',
+             '13/01/2023', '2023-13-01', '2024-1-5', '123/1/2023', '5.1.2023', 'someday', '', None]
+
+    def test_generated_like_iso_date(self):
+        self.conn.executemany("INSERT INTO boards (date) VALUES (?)", [(value,) for value in self.DATES])
+        for board in self.execute_query("SELECT date, board_date FROM boards WHERE id > 3", fetch=True):
+            self.assertEqual(board['board_date'], date_columns.iso_date(board['date']), board['date'])
+        self.assertEqual(date_columns.iso_date('1/5/2023'), '2023-01-05')
+        self.assertIsNone(date_columns.iso_date('2/30/2023'))
+
+    def test_add_columns_to_old_tables(self):
+        conn = sqlite3.connect(":memory:")
+        conn.row_factory = sqlite3.Row
+        conn.execute("CREATE TABLE boards (id INTEGER PRIMARY KEY, date TEXT)")
+        conn.execute("CREATE TABLE games (id INTEGER PRIMARY KEY, date_played TEXT)")
+        conn.execute("INSERT INTO boards (date) VALUES ('03/07/2021')")
+        conn.execute("INSERT INTO games (date_played) VALUES ('2024-02-29')")
+        execute_query = lambda query, params=None, fetch=False: conn.execute(query, params or []).fetchall()
+        date_columns.add_columns(execute_query)
+        date_columns.add_columns(execute_query)  # safe to run again
+        self.assertEqual(conn.execute("SELECT date, board_date FROM boards").fetchone()['board_date'], '2021-03-07')
+        self.assertEqual(conn.execute("SELECT played_on FROM games").fetchone()['played_on'], '2024-02-29')
+        conn.close()
+
+    def test_range_filters_use_indexes(self):
+        self.conn.executemany("INSERT INTO boards (date) VALUES (?)", [('12/25/2022',), ('1/2/2023',), ('2023-06-30',)])
+        boards = self.execute_query("SELECT date FROM boards WHERE board_date >= ? ORDER BY board_date",
+                                    [date_columns.iso_date('1/1/2023')], fetch=True)
+        self.assertEqual([board['date'] for board in boards], ['1/2/2023', '2023-06-30'])
+
+        for query, index in (("SELECT id FROM boards WHERE board_date >= '2023-01-01'", 'idx_boards_board_date'),
+                             ("SELECT id FROM games WHERE played_on BETWEEN '2024-03-01' AND '2024-03-31'",
+                              'idx_games_played_on'),
+                             ("SELECT id FROM games ORDER BY played_on DESC NULLS LAST, id DESC", 'idx_games_played_on')):
+            plan = ' '.join(row['detail'] for row in self.execute_query("EXPLAIN QUERY PLAN " + query, fetch=True))
+            self.assertIn(index, plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,8 +15,13 @@ from unittest.mock import patch, MagicMock
 # Add the app directory to the path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'app'))
 
+# Importing app creates the tables kept from games - keep that off the developer's real database
+_import_db = tempfile.NamedTemporaryFile(delete=False, suffix='.db')
+_import_db.close()
+os.environ['SQLITE_DB_PATH'] = _import_db.name
+
 # Import the app
-from app import app, execute_query, generate_unique_filename, safe_delete_file
+from app import app, execute_query, execute_insert, transaction, generate_unique_filename, safe_delete_file
 
 class TestCribbageApp(unittest.TestCase):
     
@@ -36,9 +41,12 @@ class TestCribbageApp(unittest.TestCase):
         
         # Mock the database path
         self.original_db_path = None
+        self.db_env = patch.dict(os.environ, {'SQLITE_DB_PATH': self.test_db.name})
+        self.db_env.start()
         
     def tearDown(self):
         """Clean up after tests"""
+        self.db_env.stop()
         try:
             os.unlink(self.test_db.name)
         except:
@@ -164,6 +172,22 @@ class TestCribbageApp(unittest.TestCase):
         self.assertEqual(result[0]['loser_id'], 2)
         self.assertEqual(result[0]['is_skunk'], 1)
     
+    @patch('app.os.path.join')
+    def test_transaction(self, mock_join):
+        """Test a transaction commits its queries together or rolls them all back"""
+        mock_join.return_value = self.test_db.name
+        
+        with transaction():
+            player_id = execute_insert("INSERT INTO players (first_name, last_name) VALUES ('Alice', 'Smith')")
+            execute_query("UPDATE players SET photo = 'alice.jpg' WHERE id = ?", [player_id])
+        self.assertEqual(execute_query("SELECT photo FROM players WHERE id = ?", [player_id], fetch=True)[0]['photo'], 'alice.jpg')
+        
+        with self.assertRaises(ValueError):
+            with transaction():
+                execute_insert("INSERT INTO players (first_name, last_name) VALUES ('Bob', 'Jones')")
+                raise ValueError("fail part way")
+        self.assertEqual(execute_query("SELECT COUNT(*) as count FROM players", fetch=True)[0]['count'], 1)
+    
     def test_filename_generation(self):
         """Test unique filename generation"""
         filename1 = generate_unique_filename("test.jpg", "board")
@@ -241,6 +265,13 @@ class TestDataValidation(unittest.TestCase):
         safe_delete_file("")
         safe_delete_file(None)
 
+def tearDownModule():
+    for path in (_import_db.name, _import_db.name + '-wal', _import_db.name + '-shm'):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
 def run_unit_tests():
     """Run all unit tests"""
     print("🧪 Running Unit Tests for Cribbage App")